@@ -0,0 +1,564 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import time
+
+import fontTools
+
+import files
+from data import LongDateTime
+
+
+# cache.py
+# -------------------------------
+#
+# Persistent, content-addressed caches:
+# - SVG images that have already been validated and compensated, so unchanged
+#   SVGs don't have to be parsed and checked again on every run.
+# - finished fonts, so a font that would come out exactly the same as one that's
+#   already been compiled (by another format in the same run, or an earlier run)
+#   is only compiled once.
+# - an index of the input files, so forc can tell what's changed since the last
+#   build (and skip formats that nothing has changed for) without reading everything.
+
+
+# bump this whenever validation or compensation changes what ends up in
+# the cache, so old entries stop being used.
+CACHE_VERSION = 3
+
+DEF_MAX_CACHE_SIZE = 256 * 1024 * 1024 # 256MB
+DEF_MAX_FONT_CACHE_SIZE = 1024 * 1024 * 1024 # 1GB
+
+
+
+def fileDigest(path):
+    """
+    Returns a hash of a file's contents.
+    """
+    h = hashlib.sha256()
+
+    with open(path, "rb") as read_file:
+        for chunk in iter(lambda: read_file.read(1024 * 1024), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+
+def evictLeastRecentlyUsed(cachePath, maxSize):
+    """
+    Deletes the least recently used files in a cache folder (and its
+    subfolders) until it's within a size limit.
+
+    Returns how many files were deleted.
+    """
+    entries = []
+    totalSize = 0
+
+    for folder, subfolders, filenames in os.walk(cachePath):
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+            totalSize += stat.st_size
+
+    if totalSize <= maxSize:
+        return 0
+
+    evicted = 0
+    entries.sort()
+
+    for mtime, size, path in entries:
+        if totalSize <= maxSize:
+            break
+        try:
+            os.remove(path)
+            totalSize -= size
+            evicted += 1
+        except OSError:
+            pass
+
+    return evicted
+
+
+
+class SVGCache:
+    """
+    Class representing an on-disk cache of compensated SVG images.
+
+    Entries are keyed by a hash of the SVG file's contents, plus everything
+    else that affects how it gets validated and compensated (the --nusc,
+    --afsc and SVG optimization flags and the manifest metrics).
+    """
+
+    def __init__(self, cachePath, metrics, nusc, afsc, svgOptimize=None, maxSize=DEF_MAX_CACHE_SIZE):
+
+        files.tryDirectory(cachePath, "dir", "SVG cache folder", tryMakeFolder=True)
+
+        self.path = cachePath
+        self.maxSize = maxSize
+
+        self.hits = 0
+        self.misses = 0
+
+        # everything that isn't the SVG itself that goes into a key.
+        self.salt = json.dumps( { "version": CACHE_VERSION
+                                , "nusc": nusc
+                                , "afsc": afsc
+                                , "svgOptimize": svgOptimize
+                                , "metrics": metrics
+                                }
+                                , sort_keys=True
+                                ).encode("utf-8")
+
+
+    def key(self, path, contentDigest=None):
+        """
+        Returns the cache key for an SVG file.
+
+        If the hash of the file's contents is already known (see
+        InputIndex), it can be given so the file doesn't have to be read.
+        """
+        if contentDigest is None:
+            try:
+                contentDigest = fileDigest(path)
+            except OSError as e:
+                raise ValueError(f"The SVG image '{path}' couldn't be read. → {e}")
+
+        return hashlib.sha256(self.salt + contentDigest.encode("utf-8")).hexdigest()
+
+
+    def entryPath(self, key):
+        return self.path / key[:2] / (key + ".svg")
+
+
+    def get(self, key):
+        """
+        Returns the compensated SVG (as bytes) for a key, or None if it isn't cached.
+        """
+        entry = self.entryPath(key)
+
+        try:
+            with open(entry, "rb") as read_file:
+                data = read_file.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        # touch it so eviction knows it's been used recently.
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return data
+
+
+    def put(self, key, data):
+        """
+        Stores a compensated SVG (as bytes) in the cache.
+        """
+        entry = self.entryPath(key)
+        tempEntry = entry.with_suffix(f".{os.getpid()}.tmp")
+
+        try:
+            entry.parent.mkdir(exist_ok=True)
+            with open(tempEntry, "wb") as file:
+                file.write(data)
+
+            # replacing is atomic, so a half-written entry can never be read.
+            os.replace(tempEntry, entry)
+        except OSError:
+            # the cache is just an optimisation; failing to write to it isn't a problem.
+            pass
+
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache is within its size limit.
+        """
+        return evictLeastRecentlyUsed(self.path, self.maxSize)
+
+
+    def __str__(self):
+        return f"{self.hits} hit(s), {self.misses} miss(es)"
+
+
+
+
+
+# forc's own packages. (everything else that's next to forc, like a
+# virtual environment, isn't part of it.)
+sourcePackages = ["compile", "manifest", "tables", "transform", "validate"]
+
+# (the code that's running can't change, so this is only worked out once per process.)
+sourceDigestMemo = None
+
+
+def sourceDigest():
+    """
+    Returns a hash of forc's own source code, so cached fonts stop being
+    used as soon as anything that could change how they're made does.
+    """
+    global sourceDigestMemo
+
+    if sourceDigestMemo is not None:
+        return sourceDigestMemo
+
+    h = hashlib.sha256()
+    sourcePath = pathlib.Path(__file__).parent
+
+    sourceFiles = list(sourcePath.glob("*.py"))
+
+    for package in sourcePackages:
+        sourceFiles += (sourcePath / package).rglob("*.py")
+
+    for path in sorted(sourceFiles):
+        h.update(str(path.relative_to(sourcePath)).encode("utf-8"))
+
+        with open(path, "rb") as read_file:
+            h.update(read_file.read())
+
+    sourceDigestMemo = h.hexdigest()
+    return sourceDigestMemo
+
+
+
+def glyphsDigest(glyphs, imageFormat, inputIndex=None):
+    """
+    Returns a hash of everything about a font's glyphs that ends up in it -
+    their codepoints, aliases and the contents of their images of the given
+    image format ('svg' or 'png').
+
+    (PNGs that are in the input index aren't read again.)
+    """
+    h = hashlib.sha256()
+    fileDigests = dict() # (so PNGs shared between glyphs are only read once.)
+
+    for g in glyphs["all"]:
+        h.update(repr((g.codepoints.seq, g.codepoints.vs16, g.glyphType)).encode("utf-8"))
+
+        if g.alias is not None:
+            h.update(repr((g.alias.seq, g.alias.vs16)).encode("utf-8"))
+
+        if g.imgDict:
+            for imgKey, img in sorted(g.imgDict.items()):
+                if imgKey == "svg" and imageFormat == "svg":
+                    h.update(hashlib.sha256(img.getSVGBytes()).digest())
+
+                elif imgKey.startswith("png-") and imageFormat == "png":
+                    if img.path not in fileDigests:
+                        if inputIndex is not None and inputIndex.get(img.path) is not None:
+                            fileDigests[img.path] = inputIndex.get(img.path)
+                        else:
+                            fileDigests[img.path] = hashlib.sha256(img.getBytes()).hexdigest()
+
+                    h.update((imgKey + fileDigests[img.path]).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+
+def keyValue(value):
+    """
+    Turns the manifest's data types (Tag, Fixed, LongDateTime, etc.) into
+    something that can go in a cache key.
+    """
+    if isinstance(value, LongDateTime):
+        return int(value)
+
+    return str(value)
+
+
+
+class FontCache:
+    """
+    Class representing an on-disk cache of compiled (and tested) fonts.
+
+    Entries are keyed by a hash of everything that goes into a font's tables
+    (see key()), so formats that make exactly the same font - like sbixOT and
+    sbixOTiOS, which is only packaged differently - share an entry.
+
+    Fonts that are reused keep the 'modified' date from when they were
+    actually compiled.
+    """
+
+    def __init__(self, cachePath, maxSize=DEF_MAX_FONT_CACHE_SIZE):
+
+        files.tryDirectory(cachePath, "dir", "font cache folder", tryMakeFolder=True)
+
+        self.path = cachePath
+        self.maxSize = maxSize
+        self.source = sourceDigest()
+
+
+    def key(self, formatData, manifest, glyphsDigest, compiler, flags):
+        """
+        Returns the cache key for a font format.
+        """
+
+        # only the parts of the manifest that end up in this format's font.
+        metadata = { k: v for k, v in manifest["metadata"].items() if k not in ["nameRecords", "filenames", "iOSConfig"] }
+        metadata["nameRecords"] = manifest["metadata"]["nameRecords"].get(formatData["name"])
+
+        # (the TTX compiler is fontTools, so its version matters too.)
+        compilerVersion = fontTools.version if compiler == "ttx" else None
+
+        keyData = json.dumps( { "version": CACHE_VERSION
+                              , "source": self.source
+                              , "imageTables": formatData["imageTables"]
+                              , "ligatureFormat": formatData["ligatureFormat"]
+                              , "compiler": compiler
+                              , "compilerVersion": compilerVersion
+                              , "no_vs16": flags["no_vs16"]
+                              , "no_lig": flags["no_lig"]
+                              , "svg_gzip": flags["svg_gzip"]
+                              , "metrics": manifest["metrics"]
+                              , "encoding": manifest.get("encoding")
+                              , "metadata": metadata
+                              , "glyphs": glyphsDigest
+                              }
+                              , sort_keys=True
+                              , default=keyValue
+                              ).encode("utf-8")
+
+        return hashlib.sha256(keyData).hexdigest()
+
+
+    def entryPath(self, key):
+        return self.path / (key + ".font")
+
+
+    def get(self, key):
+        """
+        Returns the path of the cached font for a key, or None if it isn't cached.
+        """
+        entry = self.entryPath(key)
+
+        if not entry.exists():
+            return None
+
+        # touch it so eviction knows it's been used recently.
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+        return entry
+
+
+    def put(self, key, fontPath):
+        """
+        Stores a copy of a compiled font in the cache.
+        """
+        entry = self.entryPath(key)
+        tempEntry = entry.with_suffix(f".{os.getpid()}.tmp")
+
+        try:
+            shutil.copyfile(fontPath, tempEntry)
+
+            # replacing is atomic, so a half-written entry can never be read.
+            os.replace(tempEntry, entry)
+        except OSError:
+            # the cache is just an optimisation; failing to write to it isn't a problem.
+            pass
+
+
+    def evict(self):
+        """
+        Deletes the least recently used fonts until the cache is within its size limit.
+        """
+        return evictLeastRecentlyUsed(self.path, self.maxSize)
+
+
+
+
+class InputIndex:
+    """
+    Class representing an index of forc's input files - their size,
+    modification time and a hash of their contents - that's kept between runs.
+
+    Files whose size and modification time haven't changed since the last run
+    aren't read again; their hash is just taken from the index.
+
+    It also remembers a fingerprint of everything that went into each format
+    the last time it was built (see fingerprint()), and the files that were
+    made, so formats that nothing has changed for can be skipped entirely.
+    """
+
+    def __init__(self, indexPath):
+
+        self.path = indexPath
+
+        self.files = dict() # path -> [size, modification time (ns), hash]
+        self.formats = dict() # font format -> {"fingerprint": ..., "outputs": {filename: [size, modification time (ns)]}}
+
+        self.lastFiles = dict()
+        self.changed = 0
+
+        # (a missing, broken or outdated index is just treated as being empty.)
+        try:
+            with open(indexPath, "r", encoding="utf-8") as read_file:
+                index = json.load(read_file)
+
+            if index.get("version") == CACHE_VERSION:
+                self.lastFiles = index["files"]
+                self.formats = index["formats"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+        self.source = sourceDigest()
+
+
+    def add(self, path):
+        """
+        Adds a file to the index (hashing it if it's new or has changed) and returns its hash.
+        """
+        path = str(path)
+        stat = os.stat(path)
+
+        last = self.lastFiles.get(path)
+
+        if last is not None and last[0] == stat.st_size and last[1] == stat.st_mtime_ns:
+            contentDigest = last[2]
+        else:
+            contentDigest = fileDigest(path)
+
+            if last is None or last[2] != contentDigest:
+                self.changed += 1
+
+        # files that were changed a moment ago could be changed again without
+        # their modification time changing, so those are always hashed next time.
+        mtime = stat.st_mtime_ns if time.time_ns() - stat.st_mtime_ns > 2 * 10**9 else None
+
+        self.files[path] = [stat.st_size, mtime, contentDigest]
+        return contentDigest
+
+
+    def scan(self, inputPath, otherPaths, outputPath):
+        """
+        Adds everything in the input folder (apart from hidden files and
+        folders, and the output folder if it's inside it) and any other
+        files (like the manifest) to the index.
+        """
+        for folder, subfolders, filenames in os.walk(inputPath):
+            subfolders[:] = sorted(s for s in subfolders if not s.startswith(".") and pathlib.Path(folder, s) != outputPath)
+
+            for filename in sorted(filenames):
+                if not filename.startswith("."):
+                    self.add(pathlib.Path(folder) / filename)
+
+        for path in otherPaths:
+            if path is not None:
+                self.add(path)
+
+        # (files that have been deleted count as changes too.)
+        self.changed += len(set(self.lastFiles) - set(self.files))
+
+
+    def get(self, path):
+        """
+        Returns the hash of a file in the index, or None if it isn't in it.
+        """
+        entry = self.files.get(str(path))
+
+        if entry is None:
+            return None
+
+        return entry[2]
+
+
+    def fingerprint(self, inputPath, imageFormat, buildData):
+        """
+        Returns a hash of everything that affects a format - the input images of
+        its image format ('svg' or 'png'), forc's source code and anything else
+        that's given in buildData (the format, manifest, flags, etc.).
+        """
+        h = hashlib.sha256(json.dumps( { "version": CACHE_VERSION
+                                       , "source": self.source
+                                       , "build": buildData
+                                       }
+                                       , sort_keys=True
+                                       , default=keyValue
+                                       ).encode("utf-8"))
+
+        for path in sorted(self.files):
+            try:
+                folderName = pathlib.Path(path).relative_to(inputPath).parts[0]
+            except (ValueError, IndexError):
+                continue
+
+            if (imageFormat == "svg" and folderName == "svg") or (imageFormat == "png" and folderName.startswith("png")):
+                h.update(f"{path}\0{self.files[path][2]}\0".encode("utf-8"))
+
+        return h.hexdigest()
+
+
+    def isUpToDate(self, fontFormat, fingerprint, outputPath):
+        """
+        Returns whether a format was last built from exactly the same inputs,
+        and the files that were made then are still there, untouched.
+        """
+        last = self.formats.get(fontFormat)
+
+        if last is None or last["fingerprint"] != fingerprint or not last["outputs"]:
+            return False
+
+        for filename, (size, mtime) in last["outputs"].items():
+            try:
+                stat = os.stat(outputPath / filename)
+            except OSError:
+                return False
+
+            if stat.st_size != size or stat.st_mtime_ns != mtime:
+                return False
+
+        return True
+
+
+    def record(self, fontFormat, fingerprint, outputPath, filenames):
+        """
+        Remembers that a format has been built, and the files it made.
+        """
+        outputs = dict()
+
+        for filename in filenames:
+            try:
+                stat = os.stat(outputPath / filename)
+            except OSError:
+                continue
+
+            outputs[filename] = [stat.st_size, stat.st_mtime_ns]
+
+        self.formats[fontFormat] = {"fingerprint": fingerprint, "outputs": outputs}
+
+
+    def save(self):
+        """
+        Writes the index to disk.
+        """
+        tempPath = self.path.with_suffix(f".{os.getpid()}.tmp")
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            with open(tempPath, "w", encoding="utf-8") as file:
+                json.dump({"version": CACHE_VERSION, "files": self.files, "formats": self.formats}, file)
+
+            # replacing is atomic, so a half-written index can never be read.
+            os.replace(tempPath, self.path)
+        except OSError:
+            # the index is just an optimisation; failing to write it isn't a problem.
+            pass
+
+
+    def __str__(self):
+        return f"{self.changed} of {len(self.files)} file(s) changed since the last build"
@@ -3,6 +3,7 @@ import log
 import shutil
 
 import files
+from validate.font import verifyFont
 from format import formats
 
 
@@ -24,7 +25,6 @@ def createFont(formatData, outPath, tempPath, filename, flags, font):
     formatName = formatData["name"]
 
     outFontPath = tempPath / (filename + extension)
-    testTTX = tempPath / (filename + "_test.ttx")
 
 
     # COMPILER
@@ -34,14 +34,14 @@ def createFont(formatData, outPath, tempPath, filename, flags, font):
     # save TTX
     log.out(f"- Packing font data into binary and writing it to file...", 90)
 
-    files.writeFile(outFontPath, font.toBytes(), 'Could not write binary font to file')
+    font.writeFile(outFontPath)
 
 
     # TESTING
     # ------------------------------------------------------
     if not flags['no_test']:
-        log.out(f'- Testing font by attempting to decompile as TTX..', 90)
-        files.compileTTX(outFontPath, testTTX)
+        log.out(f'- Verifying font...', 90)
+        verifyFont(outFontPath)
 
 
     return outFontPath
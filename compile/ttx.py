@@ -3,6 +3,7 @@ import log
 import shutil
 
 import files
+from validate.font import verifyFont
 from format import formats
 
 
@@ -20,9 +21,6 @@ def createFont(formatData, outPath, tempPath, filename, flags, font):
     formatName = formatData["name"]
 
 
-    originalTTXPath = tempPath / (filename + "_dev.ttx")
-    afterExportTTX = tempPath / (filename + ".ttx")
-
     outFontPath = tempPath / (filename + extension)
 
 
@@ -30,37 +28,38 @@ def createFont(formatData, outPath, tempPath, filename, flags, font):
     # ------------------------------------------------------
     log.out(f"[ttx compiler]", 90)
 
-    # save TTX
-    log.out(f"- Saving forc's assembled (initial) TTX to file...", 90)
-
-    files.writeFile(originalTTXPath, font.toTTX(asString=True), 'Could not write initial TTX to file')
-
-    # --dev-ttx flag
+    # the TTX is streamed out to a file table-by-table so it never has to be held
+    # in memory all at once. (it goes straight to the output folder for --dev-ttx.)
     if flags["dev_ttx_output"]:
-        shutil.copy(str(originalTTXPath), str(outPath / (filename + "_dev.ttx")))
+        log.out(f"- Writing forc's assembled (initial) TTX to file...", 90)
+        initialTTX = outPath / (filename + "_dev.ttx")
+    else:
+        log.out(f"- Writing forc's assembled TTX to a temporary file...", 90)
+        initialTTX = tempPath / (filename + "_dev.ttx")
+
+    font.writeTTX(initialTTX)
 
 
     log.out(f'- Compiling font...', 90)
-    files.compileTTX(originalTTXPath, outFontPath)
+    files.compileTTX(initialTTX, outFontPath)
 
 
 
 
     # TESTING
     # ------------------------------------------------------
-    # We use TTX again because TTX actually doesn't catch all font errors on the first pass.
-
-    if not flags['no_test'] and flags["ttx_output"]:
-        log.out(f'- Testing font by compiling it back to TTX...', 90)
-        files.compileTTX(outFontPath, afterExportTTX)
-
-        # -ttx flag
-        shutil.copy(str(afterExportTTX), str(outPath / (filename + ".ttx")))
-
-
-    elif not flags['no_test']:
-        log.out(f'- Testing font by compiling it back to TTX...', 90)
-        files.compileTTX(outFontPath, afterExportTTX)
+    # The compiler doesn't catch every problem a font can have, so the finished
+    # font is loaded back in and checked. (this is much quicker than decompiling
+    # all of it back to TTX, which only happens if --ttx is used.)
+
+    if not flags['no_test']:
+        log.out(f'- Verifying font...', 90)
+        verifyFont(outFontPath)
+
+    # --ttx flag
+    if flags["ttx_output"]:
+        log.out(f'- Decompiling font to TTX...', 90)
+        files.decompileFont(outFontPath, outPath / (filename + ".ttx"))
 
 
     return outFontPath
@@ -11,7 +11,46 @@ import compile.ios.create
 from format import formats
 
 
-def createFont(fontFormat, outputPath, manifest, glyphs, compiler, flags):
+def fontFilename(fontFormat, manifest):
+    """
+    Returns the base filename of a format's font.
+
+    The user setting custom filenames in the manifest is optional.
+    If none are given, just use the font format as the base filename.
+    """
+    if "filenames" in manifest["metadata"]:
+        return manifest['metadata']['filenames'][fontFormat]
+
+    return fontFormat
+
+
+
+def outputFilenames(fontFormat, manifest, compiler, flags):
+    """
+    Returns the names of the files that createFont() makes in the output folder for a format.
+    """
+    filename = fontFilename(fontFormat, manifest)
+
+    if formats[fontFormat]["iOSCompile"]:
+        names = [filename + ".mobileconfig"]
+    else:
+        names = [filename + formats[fontFormat]["extension"]]
+
+    # (only the TTX compiler makes these.)
+    if compiler == 'ttx' and flags["ttx_output"]:
+        names.append(filename + ".ttx")
+
+    return names
+
+
+
+def createFont(fontFormat, outputPath, manifest, glyphs, compiler, flags, fontCache=None, cacheKey=None):
+    """
+    Assembles, compiles and tests a font (or reuses an identical one from the
+    font cache), then writes it to the output folder.
+
+    Returns True if the font came from the font cache.
+    """
 
     log.out(f'{fontFormat}', 96)
     log.out("-----------------", 90)
@@ -22,19 +61,16 @@ def createFont(fontFormat, outputPath, manifest, glyphs, compiler, flags):
 
     # output folder
     outPath = pathlib.Path(outputPath).absolute()
-    tempPath = outPath / '.forc_tmp'
+
+    # every format gets its own temporary folder so
+    # formats can be built at the same time.
+    tempPath = outPath / '.forc_tmp' / fontFormat
 
     files.tryDirectory(tempPath, "dir", "temporary font build folder", tryMakeFolder=True)
 
 
     # filenames
-    # the user setting custom filenames in the manifest is optional.
-    # If none are given, just use the font format as the base filename.
-
-    if "filenames" in manifest["metadata"]:
-        filename = manifest['metadata']['filenames'][fontFormat]
-    else:
-        filename = fontFormat
+    filename = fontFilename(fontFormat, manifest)
 
     # format information
     formatData = formats[fontFormat]
@@ -42,28 +78,54 @@ def createFont(fontFormat, outputPath, manifest, glyphs, compiler, flags):
 
 
 
-    # create the font!
+    # reuse an identical font if one's already been compiled
     # --------------------------------------------------------------
-    log.out(f'🛠  Assembling font...')
-    emojiFont = TTFont(formatData["name"], manifest, glyphs, flags)
-    log.out(f'🛠  Performing internal tests...')
-    emojiFont.test()
-    log.out(f'✅ Font successfully assembled.\n', 32)
+    # (--dev-ttx needs the assembled font, so that always builds from scratch.)
 
+    cachedFontPath = None
 
-    # pass it to compilers and packagers
-    # --------------------------------------------------------------
-    log.out(f"⚙️  Compiling and externally testing font...")
+    if fontCache is not None and not flags["dev_ttx_output"]:
+        cachedFontPath = fontCache.get(cacheKey)
+
+    if cachedFontPath is not None:
+        tempFontPath = cachedFontPath
 
+        # --ttx flag
+        # (only the TTX compiler makes these.)
+        if flags["ttx_output"] and compiler == 'ttx':
+            log.out(f'- Decompiling font to TTX...', 90)
+            files.decompileFont(tempFontPath, outPath / (filename + ".ttx"))
+
+        log.out(f'♻️  Reused an identical font that has already been compiled and tested.\n', 32)
 
-    if compiler == 'ttx':
-        tempFontPath = compile.ttx.createFont(formatData, outPath, tempPath, filename, flags, emojiFont)
-    elif compiler == 'forc':
-        tempFontPath = compile.forc.createFont(formatData, outPath, tempPath, filename, flags, emojiFont)
     else:
-        raise ValueError("Something went wrong with the build process. I'm not able to run the font data through a compiler.")
 
-    log.out(f'✅ Compiling and testing OK.\n', 32)
+        # create the font!
+        # --------------------------------------------------------------
+        log.out(f'🛠  Assembling font...')
+        emojiFont = TTFont(formatData["name"], manifest, glyphs, flags)
+        log.out(f'🛠  Performing internal tests...')
+        emojiFont.test()
+        log.out(f'✅ Font successfully assembled.\n', 32)
+
+
+        # pass it to compilers and packagers
+        # --------------------------------------------------------------
+        log.out(f"⚙️  Compiling and externally testing font...")
+
+
+        if compiler == 'ttx':
+            tempFontPath = compile.ttx.createFont(formatData, outPath, tempPath, filename, flags, emojiFont)
+        elif compiler == 'forc':
+            tempFontPath = compile.forc.createFont(formatData, outPath, tempPath, filename, flags, emojiFont)
+        else:
+            raise ValueError("Something went wrong with the build process. I'm not able to run the font data through a compiler.")
+
+        log.out(f'✅ Compiling and testing OK.\n', 32)
+
+        # only fonts that have been tested are cached.
+        if fontCache is not None and not flags["no_test"]:
+            fontCache.put(cacheKey, tempFontPath)
 
 
     if formats[fontFormat]["iOSCompile"]:
@@ -82,4 +144,11 @@ def createFont(fontFormat, outputPath, manifest, glyphs, compiler, flags):
     log.out(f'🗑  Cleaning up...')
     shutil.rmtree(tempPath)
 
+    try:
+        tempPath.parent.rmdir()
+    except OSError:
+        pass # other formats are still using it.
+
     log.out(f'✅ Format finished!\n\n', 32)
+
+    return cachedFontPath is not None
@@ -1,6 +1,8 @@
-import subprocess
 import pathlib
 import json
+from io import BytesIO
+
+from fontTools import ttLib
 
 
 
@@ -75,21 +77,38 @@ def writeFile(path, contents, exceptionString):
 
 
 
-def compileTTX(input, output):
+def compileTTX(ttx, output):
+    """
+    Compiles a font from TTX with fontTools, in-process.
+
+    The TTX can either be given as bytes or as a path to a TTX file.
     """
-    Invokes the TTX compiler and attempts to compile a font with it.
 
-    (this can be for multiple purposes, either compiling a font by TTX or
-    just for using the TTX compiler as an extra testing mechanism.)
+    if type(ttx) is bytes:
+        ttx = BytesIO(ttx)
+
+    try:
+        # (these are the same settings the ttx command line tool compiles with.)
+        ttFont = ttLib.TTFont(recalcBBoxes=True, recalcTimestamp=True)
+        ttFont.importXML(ttx)
+        ttFont.save(output)
+    except Exception as e:
+        raise Exception('TTX compiler failed: ' + str(e))
+
+
+
+def decompileFont(input, output):
     """
+    Decompiles a font file into a TTX file with fontTools, in-process.
 
-    # feed the assembled TTX as input to the ttx command line tool.
-    cmd_ttx = ['ttx', '-q', '-o', output, input]
+    (This can be for multiple purposes, either for creating a TTX
+    representation of a finished font or just for using the TTX
+    decompiler as an extra testing mechanism.)
+    """
 
-    # try to export temporary PNG
     try:
-        r = subprocess.run(cmd_ttx, stdout=subprocess.DEVNULL).returncode
+        ttFont = ttLib.TTFont(input, 0)
+        ttFont.saveXML(output)
+        ttFont.close()
     except Exception as e:
-        raise Exception('TTX compiler invocation failed: ' + str(e))
-    if r:
-        raise Exception('TTX compiler returned error code: ' + str(r))
+        raise Exception('TTX decompiler failed: ' + str(e))
@@ -1,6 +1,6 @@
-from lxml.etree import Element, tostring
+from lxml.etree import Element, tostring, xmlfile
 from math import log2, floor
-from transform.bytes import calculateTableChecksum, generateOffsets
+from transform.bytes import FileChunk, TableChecksum, calculateTableChecksum
 import struct
 
 import log
@@ -54,6 +54,7 @@ class TTFont:
 
 
         self.tables = {}
+        self.compiledTables = {} # tag -> (padded bytes, original length, checksum). see compileTables().
 
 
         try:
@@ -90,7 +91,7 @@ class TTFont:
             # an empty loca table if there's no glyf table (CBDT/CBLC
             # fonts shouldnt have glyf tables.)
 
-            if glyphFormat is not "CBx":
+            if glyphFormat != "CBx":
                 log.out('[loca] ', 36, newline=False)
                 self.tables["loca"] = tables.loca.loca()
 
@@ -152,7 +153,7 @@ class TTFont:
             # table dependencies and the TTX compiler.
             #
             # CBDT/CBLC doesn't use glyf at all
-            if glyphFormat is not "CBx":
+            if glyphFormat != "CBx":
                 log.out('[glyf] ', 36, newline=False)
                 self.tables["glyf"] = tables.glyf.glyf(m, glyphs)
 
@@ -162,18 +163,21 @@ class TTFont:
 
             if glyphFormat == "SVG":
                 log.out('[SVG ]', 36)
-                self.tables["SVG "] = tables.svg.SVG(m, glyphs)
+                self.tables["SVG "] = tables.svg.SVG(m, glyphs, flags["svg_gzip"])
 
             elif glyphFormat == "sbix":
                 log.out('[sbix]', 36)
                 self.tables["sbix"] = tables.sbix.sbix(glyphs)
 
             elif glyphFormat == "CBx":
+                # (CBLC indexes CBDT's bitmaps, so CBDT has to be made first.)
+                cbdt = tables.cbdt.CBDT(m, glyphs)
+
                 log.out('[CBLC] ', 36, newline=False)
-                self.tables["CBLC"] = tables.cblc.CBLC(m, glyphs)
+                self.tables["CBLC"] = tables.cblc.CBLC(m, glyphs, cbdt)
 
                 log.out('[CBDT]', 36)
-                self.tables["CBDT"] = tables.cbdt.CBDT(m, glyphs)
+                self.tables["CBDT"] = cbdt
 
 
 
@@ -253,19 +257,94 @@ class TTFont:
 
 
 
-    def bytesPass(self):
+    def writeTTX(self, path):
+        """
+        Writes the font class as TTX straight to a file, one table at a time.
+
+        Tables with a lot of image data (sbix, CBDT, SVG) have their own
+        writeTTX() that streams them out in even smaller pieces, so the whole
+        font never has to be held in memory as one big tree or string.
+        """
+
+        try:
+            with xmlfile(str(path), encoding="UTF-8") as xf:
+                xf.write_declaration()
+
+                with xf.element('ttFont', {'sfntVersion': '\\x00\\x01\\x00\\x00', 'ttLibVersion': '3.28'}): # hard-coded attrs.
+                    xf.write("\n")
+                    xf.write(self.glyphOrder.toTTX(), pretty_print=True)
+
+                    for tableName, t in self.tables.items():
+                        if hasattr(t, "writeTTX"):
+                            t.writeTTX(xf)
+                        else:
+                            xf.write(t.toTTX(), pretty_print=True)
+
+        except OSError as e:
+            raise Exception(f"Could not write TTX to file. → {e}")
+
+
+
+    def compileTable(self, tableName):
+        """
+        Converts a table to bytes and calculates its checksum.
+
+        This is only ever done once per table - the results are cached
+        in self.compiledTables.
+        """
+
+        if tableName not in self.compiledTables:
+
+            # head's checksum has to be calculated with checkSumAdjustment set to 0.
+            # (it gets patched into the finished font afterwards. see toBytes().)
+            if tableName == "head":
+                self.tables["head"].checkSumAdjustment = 0
+
+            # convert to bytes
+            try:
+                data, length = self.tables[tableName].toBytes()
+            except ValueError as e:
+                raise ValueError(f"Something has gone wrong with converting the {tableName} table to bytes. -> {e}")
+
+            # get a checksum on that data
+            try:
+                checkSum = calculateTableChecksum(data)
+            except ValueError as e:
+                raise ValueError(f"Something has gone wrong with calculating the checksum for {tableName}. -> {e}")
+
+            self.compiledTables[tableName] = (data, length, checkSum)
+
+        return self.compiledTables[tableName]
+
+
+
+    def compileTables(self):
         """
-        Represents a single compile pass to bytes.
-        (Just a WIP/placeholder right now.)
+        Converts every table to bytes and calculates their checksums.
+
+        Returns a dict of table name -> (padded bytes, original length, checksum),
+        in the same order as self.tables.
+        """
+        return {tableName: self.compileTable(tableName) for tableName in self.tables}
+
+
+
+    def fontHeader(self, tableInfo):
+        """
+        Returns the offset table and table records for the font (ie. everything
+        before the table data), along with the offset of each table.
+
+        tableInfo is a dict of table name -> (original length, checksum), in the
+        order the tables are laid out in.
         """
 
         # offset table (ie. the font header)
         # --------------------------------------------------------------
         # (this should be fine and complete)
 
-        numTables = len(self.tables)
-        searchRange = (2 ** floor(log2(numTables))) * 16
-        entrySelector = int(log2(floor(log2(numTables))))
+        numTables = len(tableInfo)
+        entrySelector = floor(log2(numTables))
+        searchRange = (2 ** entrySelector) * 16
         rangeShift = numTables * 16 - searchRange
 
         offsetTable = struct.pack( ">IHHHH"
@@ -280,55 +359,38 @@ class TTFont:
         # table record entries
         # -------------------------------------------------------------
 
-        initialTables = []
-        originalLengths = []
-        checkSums = []
-        tags = []
+        offset = (numTables * 16) + 12 # 16 = tableRecord length, 12 = offset table length.
 
-        # get all of the table data
-        for tableName, t in self.tables.items():
-            #print(f"converting {tableName} to bytes...")
+        tableRecordsList = []
+        offsets = dict()
 
-            # convert to bytes
-            try:
-                tableOutput = t.toBytes()
-            except ValueError as e:
-                raise ValueError(f"Something has gone wrong with converting the {tableName} table to bytes. -> {e}")
+        for tableName, (length, checkSum) in tableInfo.items():
+            tableRecordsList.append(tables.tableRecord.TableRecord(tableName, checkSum, offset, length))
+            offsets[tableName] = offset
 
-            initialTables.append(tableOutput[0])
-            originalLengths.append(tableOutput[1])
+            offset += length + (-length % 4) # every table is padded to a multiple of 4 bytes.
 
-            # get a checksum on that data
-            try:
-                checkSums.append(calculateTableChecksum(tableOutput[0]))
-            except ValueError as e:
-                raise ValueError(f"Something has gone wrong with calculating the checksum for {tableName}. -> {e}")
-
-            # also add a tag.
-            tags.append(tableName)
+        tableRecordsList.sort()
+        tableRecords = b''.join(t.toBytes() for t in tableRecordsList)
 
+        return offsetTable + tableRecords, offsets
 
-        # calculate offsets for each table
-        initialOffset = (len(self.tables) * 16) + 12 # 16 = tableRecord length, 12 = offset table length.
-        tableOffsets = generateOffsets(initialTables, 32, initialOffset, usingClasses=False)
 
-        tableRecordsList = []
 
-        for n, t in enumerate(initialTables):
-                tableRecordsList.append(tables.tableRecord.TableRecord( tags[n]
-                                               , checkSums[n]
-                                               , tableOffsets["offsetInts"][n]
-                                               , originalLengths[n]
-                                               ))
-        #print(tableRecordsList)
+    def checkSumAdjustment(self, header, tableInfo):
+        """
+        Works out head.checkSumAdjustment from the font header and every table's checksum.
 
-        tableRecordsList.sort()
-        tableRecords = b''
+        A font's checksum is just the sum of the checksums of its parts
+        (every table is padded to a multiple of 4 bytes, so the sums line up),
+        so none of the tables have to be looked at again.
+        """
+        fontCheckSum = calculateTableChecksum(header)
 
-        for t in tableRecordsList:
-            tableRecords += t.toBytes()
+        for length, checkSum in tableInfo.values():
+            fontCheckSum = (fontCheckSum + checkSum) & 0xffffffff
 
-        return offsetTable + tableRecords + tableOffsets["bytes"]
+        return (0xB1B0AFBA - fontCheckSum) % 0x100000000
 
 
 
@@ -336,18 +398,114 @@ class TTFont:
         """
         Compiles font class into a fully formed TrueType/OpenType font.
         (WIP)
+
+        Every table is only converted to bytes once, and head.checkSumAdjustment
+        is patched in at the end.
         """
 
-        log.out('first compilation pass...', 90)
-        firstPass = self.bytesPass()
+        log.out('compiling tables...', 90)
+        compiledTables = self.compileTables()
+
+        tableInfo = {tableName: (length, checkSum) for tableName, (data, length, checkSum) in compiledTables.items()}
+        header, offsets = self.fontHeader(tableInfo)
+
+        font = bytearray(header)
+
+        for data, length, checkSum in compiledTables.values():
+            font += data
+
 
         log.out('calculating checksum...', 90)
-        initialCS = calculateTableChecksum(firstPass)
-        checkSumAdjustment = (0xB1B0AFBA - initialCS) % 0x100000000
+        checkSumAdjustment = self.checkSumAdjustment(header, tableInfo)
         self.tables["head"].checkSumAdjustment = checkSumAdjustment
 
-        log.out('last compilation pass...', 90)
-        lastPass = self.bytesPass()
+        # checkSumAdjustment is 8 bytes into head.
+        struct.pack_into(">I", font, offsets["head"] + 8, checkSumAdjustment)
+
+
+        return bytes(font)
+
+
+
+    def writeFile(self, path):
+        """
+        Compiles font class into a fully formed TrueType/OpenType font, streaming
+        it straight into a file.
+
+        Tables that can be output as chunks (see transform.bytes.FileChunk) have
+        their image files copied directly into the font file, so they're never
+        loaded into memory. Every other table is converted to bytes as usual.
+
+        The font header goes at the start of the file, but it needs every table's
+        checksum, so space is left for it and it's written at the end.
+        """
+
+        # lay out every table.
+        # --------------------------------------------------------------
+        log.out('laying out tables...', 90)
+
+        layout = dict() # table name -> (chunks, original length)
+
+        for tableName, t in self.tables.items():
+            if hasattr(t, "toChunks"):
+                try:
+                    layout[tableName] = t.toChunks()
+                except ValueError as e:
+                    raise ValueError(f"Something has gone wrong with converting the {tableName} table to bytes. -> {e}")
+            else:
+                data, length, checkSum = self.compileTable(tableName)
+                layout[tableName] = ([data], length)
+
+        headerLength = (len(layout) * 16) + 12
+
+
+        # write everything.
+        # --------------------------------------------------------------
+        log.out('writing tables...', 90)
+
+        tableInfo = dict()
+
+        try:
+            with open(path, "wb") as file:
+
+                # (placeholder for the header.)
+                file.write(bytes(headerLength))
+
+                for tableName, (chunks, length) in layout.items():
+
+                    # streamed tables are checksummed as they're written.
+                    if tableName in self.compiledTables:
+                        checkSum = None
+                    else:
+                        checkSum = TableChecksum()
+
+                    for chunk in chunks:
+                        if isinstance(chunk, FileChunk):
+                            chunk.copyTo(file, checkSum)
+                        else:
+                            file.write(chunk)
+
+                            if checkSum is not None:
+                                checkSum.update(chunk)
+
+                    if checkSum is None:
+                        tableInfo[tableName] = (length, self.compiledTables[tableName][2])
+                    else:
+                        tableInfo[tableName] = (length, checkSum.value())
+
+
+                log.out('calculating checksum...', 90)
+                header, offsets = self.fontHeader(tableInfo)
+
+                checkSumAdjustment = self.checkSumAdjustment(header, tableInfo)
+                self.tables["head"].checkSumAdjustment = checkSumAdjustment
+
+                file.seek(0)
+                file.write(header)
 
+                # checkSumAdjustment is 8 bytes into head.
+                file.seek(offsets["head"] + 8)
+                file.write(struct.pack(">I", checkSumAdjustment))
 
-        return lastPass
+        except OSError as e:
+            raise Exception(f"Could not write binary font to file. → {e}")
@@ -7,6 +7,7 @@ from io import StringIO
 
 import log
 from start import start
+from watch import watch as watchInputs
 
 
 
@@ -28,9 +29,18 @@ DEF_NO_LIG = False
 
 DEF_NUSC = False
 DEF_AFSC = False
+DEF_SVG_GZIP = False
+DEF_SVG_MIN = False
+DEF_SVG_PATHS = False
+DEF_SVG_BAKE = False
+DEF_SVG_PRECISION = 3
 
 DEF_NO_TEST = False
 
+DEF_JOBS = 1
+DEF_NO_CACHE = False
+DEF_WATCH = False
+
 DEF_TTX_OUTPUT = False
 DEF_DEV_TTX = False
 
@@ -104,6 +114,26 @@ FOR SVGs
             Affinity software. Always use this if you are making
             a font with SVGs that come from Affinity software.
 
+--svg-min   Minifies SVGs before they go into the font. Removes
+            comments, metadata, editor data, unused ids and default
+            values, and rounds coordinates.
+
+--svg-paths Rewrites SVG path data in its shortest form, removes
+            path segments that don't draw anything, and merges
+            paths that look the same and don't overlap.
+
+--svg-bake  (with --svg-paths) Applies the transforms SVGs are
+            wrapped in directly to their coordinates, where it's
+            safe to.
+
+--svg-precision
+            The number of decimal places --svg-min and --svg-paths
+            round coordinates to (default: {DEF_SVG_PRECISION}).
+
+--svg-gzip  Compresses the SVG documents in SVGinOT fonts with gzip.
+            Makes fonts much smaller, but not every platform can
+            read compressed SVG documents.
+
 
 
 FOR ALL COMPILERS
@@ -113,6 +143,21 @@ FOR ALL COMPILERS
 
 
 
+FOR PERFORMANCE
+
+-j, --jobs  Number of worker processes to use when processing images
+            and building formats (default: {DEF_JOBS}). 0 uses every
+            available CPU core.
+
+--no-cache  Doesn't use (or update) the cache of checked SVG images
+            and finished fonts that forc keeps in the output folder.
+
+--watch     Stays open after building, and builds again whenever
+            anything in the input folder, the manifest or the
+            aliases file changes. Press Ctrl+C to stop.
+
+
+
 FOR TTX COMPILER
 Will be ignored if you are using a different compiler.
 
@@ -144,17 +189,26 @@ def main():
 
     nusc = DEF_NUSC
     afsc = DEF_AFSC
+    svg_gzip = DEF_SVG_GZIP
+    svg_min = DEF_SVG_MIN
+    svg_paths = DEF_SVG_PATHS
+    svg_bake = DEF_SVG_BAKE
+    svg_precision = DEF_SVG_PRECISION
 
     no_test = DEF_NO_TEST
 
+    jobs = DEF_JOBS
+    no_cache = DEF_NO_CACHE
+    watch = DEF_WATCH
+
     ttx_output = DEF_TTX_OUTPUT
     dev_ttx_output = DEF_DEV_TTX
 
 
     try:
         opts, _ = getopt.getopt(sys.argv[1:],
-                                'hi:o:m:a:d:F:C:',
-                                ['help', 'no-vs16', 'no-lig', 'nusc', 'afsc', 'no-test', 'ttx', 'dev-ttx'])
+                                'hi:o:m:a:d:F:C:j:',
+                                ['help', 'no-vs16', 'no-lig', 'nusc', 'afsc', 'svg-min', 'svg-paths', 'svg-bake', 'svg-precision=', 'svg-gzip', 'no-test', 'jobs=', 'no-cache', 'watch', 'ttx', 'dev-ttx'])
         for opt, arg in opts:
             if opt in ['-h', '--help']:
                 print(HELP)
@@ -187,11 +241,32 @@ def main():
                 nusc = True
             elif opt =='--afsc':
                 afsc = True
+            elif opt =='--svg-min':
+                svg_min = True
+            elif opt =='--svg-paths':
+                svg_paths = True
+            elif opt =='--svg-bake':
+                svg_bake = True
+            elif opt =='--svg-precision':
+                svg_precision = int(arg)
+                if svg_precision < 0:
+                    raise ValueError("The SVG precision can't be negative.")
+            elif opt =='--svg-gzip':
+                svg_gzip = True
 
 
             elif opt =='--no-test':
                 no_test = True
 
+            elif opt in ['-j', '--jobs']:
+                jobs = int(arg)
+                if jobs < 0:
+                    raise ValueError("The number of jobs can't be negative.")
+            elif opt =='--no-cache':
+                no_cache = True
+            elif opt =='--watch':
+                watch = True
+
 
             elif opt =='--ttx':
                 ttx_output = True
@@ -207,13 +282,35 @@ def main():
 
                 , "nusc": nusc
                 , "afsc": afsc
+                , "svg_min": svg_min
+                , "svg_paths": svg_paths
+                , "svg_bake": svg_bake
+                , "svg_precision": svg_precision
+                , "svg_gzip": svg_gzip
 
                 , "no_test": no_test
 
+                , "jobs": jobs
+                , "no_cache": no_cache
+
                 , "ttx_output": ttx_output
                 , "dev_ttx_output": dev_ttx_output
                 }
 
+        # --watch keeps building (and saying when each build is done) until it's stopped.
+        if watch:
+            watchInputs( input_path
+                        , output_path
+                        , manifest_path
+                        , aliases_path
+                        , delim_codepoint
+
+                        , output_formats
+                        , compiler
+                        , flags
+                        )
+            return
+
         start( input_path
               , output_path
               , manifest_path
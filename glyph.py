@@ -4,7 +4,8 @@ import lxml.etree as etree
 
 from validate.svg import isSVGValid
 from validate.codepoints import testZWJSanity, testRestrictedCodepoints
-from transform.svg import compensateSVG
+from transform.svg import compensateSVG, minifySVG, optimizeGeometry
+from transform.svgStream import streamCompensateSVG
 
 
 # glyph.py
@@ -24,40 +25,90 @@ def simpleHex(int):
 
 
 
+# stands in for the root id of a compensated SVG until it's given a glyph ID in a font.
+svgIDPlaceholder = "forc-glyph-id-placeholder"
+
+
+
 class Img:
     """
     Class representing a single glyph image.
     """
-    def __init__(self, type, strike, m, path, nusc=False, afsc=False):
+    def __init__(self, type, strike, m, path, nusc=False, afsc=False, svgData=None, svgOptimize=None):
 
         if not path.exists():
             raise ValueError(f"Image object couldn't be built because the path given ('{path}') doesn't exist.'")
 
         self.type = type
         self.strike = strike
+        self.path = path # PNGs are loaded from here on-demand.
+        self.bytesSaved = None # bytes saved by optimizing this SVG (if it was optimized during this run).
 
         if type == "svg":
 
-            # try parsing the SVG
-            try:
-                svgImage = etree.parse(path.as_uri())
-            except ValueError:
-                raise ValueError(f"Image object couldn't be built because there was a problem in retrieving or processing the image '{path}'. {e}")
+            # SVGs that don't need optimizing can be validated and compensated
+            # while they're being parsed, without a tree.
+            # (streamCompensateSVG() gives back None if an SVG needs the tree-based path.)
+            if svgData is None and svgOptimize is None:
+                svgData = streamCompensateSVG(path, m, afsc, nusc, svgIDPlaceholder)
 
-            # test for SVG compatibility.
-            try:
-                isSVGValid(svgImage, nusc)
-            except ValueError as e:
-                raise ValueError(f"Image object couldn't be built due to compatibility issues with the SVG image '{path}'. → {e}")
+            # this SVG has already been validated and compensated
+            # (ie. it came from the SVG cache or was just streamed).
+            if svgData is not None:
+                self.svgData = svgData
+
+            else:
+                # try parsing the SVG
+                try:
+                    svgImage = etree.parse(path.as_uri())
+                except ValueError:
+                    raise ValueError(f"Image object couldn't be built because there was a problem in retrieving or processing the image '{path}'. {e}")
+
+                # test for SVG compatibility.
+                try:
+                    isSVGValid(svgImage, nusc)
+                except ValueError as e:
+                    raise ValueError(f"Image object couldn't be built due to compatibility issues with the SVG image '{path}'. → {e}")
+
+                # do all the compensation stuff on it.
+                compensatedSVG = compensateSVG(svgImage, m, afsc)
+
+                # the root gets a placeholder id that's swapped for a real glyph ID in getSVGBytes().
+                # (it's set before optimizing, so the root's the same when measuring before and after.)
+                compensatedSVG.getroot().attrib["id"] = svgIDPlaceholder
+
+                # optimize it (if svgOptimize is given - see glyphProc.svgOptimizeOptions()).
+                # (minifying goes first, so metadata doesn't get in the way of baking transforms.)
+                if svgOptimize is not None:
+                    unoptimizedLength = len(etree.tostring(compensatedSVG, method="xml", pretty_print=False, xml_declaration=True, encoding="UTF-8"))
 
-            # do all the compensation stuff on it and make it the data.
-            self.data = compensateSVG(svgImage, m, afsc)
+                    if svgOptimize["minify"]:
+                        compensatedSVG = minifySVG(compensatedSVG, svgOptimize["precision"])
 
+                    if svgOptimize["paths"]:
+                        optimizeGeometry(compensatedSVG, svgOptimize["precision"], svgOptimize["bake"])
 
+                # only keep the serialized SVG, not the tree.
+                # (optimizing might have taken the root's id away, so it's set again.)
+                compensatedSVG.getroot().attrib["id"] = svgIDPlaceholder
+                self.svgData = etree.tostring(compensatedSVG, method="xml", pretty_print=False, xml_declaration=True, encoding="UTF-8")
 
-        if type == "png":
-            self.path = path
-            # take the PNG and use it for later.
+                if svgOptimize is not None:
+                    self.bytesSaved = unoptimizedLength - len(self.svgData)
+
+
+    def getSVGBytes(self, glyphID=None):
+        """
+        Returns the compensated SVG serialized as bytes.
+
+        If a glyph ID is given, the SVG's root id is set to match it.
+        Otherwise it's returned with the id placeholder intact.
+        """
+        if glyphID is None:
+            return self.svgData
+
+        # the root element always comes first, so the first match is always the root's id.
+        return self.svgData.replace(svgIDPlaceholder.encode("utf-8"), f"glyph{glyphID}".encode("utf-8"), 1)
 
 
     def getHexDump(self):
@@ -65,7 +116,7 @@ class Img:
         Loads and returns a hexdump of the image object's file on-demand.
         """
 
-        if self.type is "svg":
+        if self.type == "svg":
             raise ValueError(f"Hexdump of an SVG image was attempted. You can't hexdump SVG images in forc.")
 
         try:
@@ -97,11 +148,32 @@ class Img:
 
 
 
+# every distinct codepoint sequence tuple -> (that tuple, its glyph name).
+# CodepointSeqs with the same codepoints all share one tuple and one name string.
+internedSeqs = dict()
+
+
+def clearInternedSeqs():
+    """
+    Forgets every interned codepoint sequence, so a process that stays open
+    (ie. --watch) doesn't hold onto sequences from old builds.
+
+    (CodepointSeqs that have already been made keep theirs.)
+    """
+    internedSeqs.clear()
+
+
+
 class CodepointSeq:
     """
     Class representing a sequence of Unicode codepoints.
+
+    These are immutable (and hashable), so they can be used as keys
+    and shared freely between glyphs.
     """
 
+    __slots__ = ("seq", "vs16", "sortKey", "glyphName", "seqHash")
+
 
     def __init__(self, sequence, delim, userInput=True):
 
@@ -123,26 +195,66 @@ class CodepointSeq:
         # handle fe0f
         # ------------------------------------------------------
         if len(seq) > 1:
-            self.seq = [c for c in seq if c != 0xfe0f]
-            self.vs16 = 0xfe0f in seq and len(self.seq) == 1
+            strippedSeq = tuple(c for c in seq if c != 0xfe0f)
+            vs16 = 0xfe0f in seq and len(strippedSeq) == 1
         else:
-            self.seq = seq
-            self.vs16 = False
+            strippedSeq = tuple(seq)
+            vs16 = False
 
 
         # test the codepoints
         # # ------------------------------------------------------
         try:
-            if userInput: testRestrictedCodepoints(self.seq)
-            testZWJSanity(self.seq)
+            if userInput: testRestrictedCodepoints(strippedSeq)
+            testZWJSanity(strippedSeq)
         except ValueError as e:
             raise ValueError(f"'{sequence}' is not a valid codepoint sequence. → {e}")
 
 
+        self.setSeq(strippedSeq, vs16)
+
+
+
+    def setSeq(self, seq, vs16):
+        """
+        Sets up this object's (immutable) attributes from a validated codepoint tuple.
+        """
+
+        # intern the sequence and its name so identical sequences share them.
+        if seq not in internedSeqs:
+            internedSeqs[seq] = (seq, 'u' + '_'.join(map(simpleHex, seq)))
+
+        seq, glyphName = internedSeqs[seq]
+
+        object.__setattr__(self, "seq", seq)
+        object.__setattr__(self, "vs16", vs16)
+        object.__setattr__(self, "glyphName", glyphName)
+        object.__setattr__(self, "seqHash", hash(seq))
+
+        # see __lt__ for why it's sorted this way.
+        object.__setattr__(self, "sortKey", (len(seq), seq))
+
+
+    # pickling (ie. sending glyphs to worker processes) only needs the codepoints.
+    # everything else gets worked out again on the other side.
+
+    def __getstate__(self):
+        return (self.seq, self.vs16)
+
+    def __setstate__(self, state):
+        self.setSeq(*state)
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"CodepointSeq objects can't be changed once they've been made.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"CodepointSeq objects can't be changed once they've been made.")
+
 
     def name(self):
         """
-        Generates a TTX 'name' for the glyph based on it's codepoint sequence.
+        Returns a TTX 'name' for the glyph based on it's codepoint sequence.
 
         The way this is named is important and it makes the TTX compiler happy.
         DO NOT CHANGE IT!
@@ -150,7 +262,7 @@ class CodepointSeq:
         eg. ['1f44d', '101601']
         -> u1f44d_101601
         """
-        return 'u' + '_'.join(map(simpleHex, self.seq))
+        return self.glyphName
 
     def __str__(self):
         return '-'.join(map(simpleHex, self.seq))
@@ -159,8 +271,13 @@ class CodepointSeq:
         return str(self)
 
     def __eq__(self, other):
+        if not isinstance(other, CodepointSeq):
+            return NotImplemented
         return self.seq == other.seq
 
+    def __hash__(self):
+        return self.seqHash
+
     def __lt__(self, other):
         """
         Sorts by codepoint sequence length, then the value of the first codepoint.
@@ -174,11 +291,7 @@ class CodepointSeq:
         of range of low-bit cmap subtables. If glyphIDs are out of range of
         cmap subtables like this, the font won't compile.
         """
-        if len(self.seq) < len(other.seq):
-            return True
-        elif len(self.seq) == len(other.seq):
-            return self.seq < other.seq
-        return False
+        return self.sortKey < other.sortKey
 
     def __len__(self):
         return len(self.seq)
@@ -193,6 +306,10 @@ class Glyph:
     """
     Class representing a font glyph.
     """
+
+    __slots__ = ("codepoints", "alias", "imgDict", "glyphType")
+
+
     def __init__(self, codepoints, imgDict=None, alias=None, delim="-", userInput=True):
 
         try:
@@ -222,8 +339,8 @@ class Glyph:
             self.glyphType = "empty"
 
 
-    # the way that glyph classes get compared/equated is
-    # simply by their codepointseq.
+    # the way that glyph classes get compared/equated (and hashed)
+    # is simply by their codepointseq.
 
     def __str__(self):
         return str(self.codepoints)
@@ -232,13 +349,69 @@ class Glyph:
         return str(self.codepoints) + f" - {self.glyphType}"
 
     def __eq__(self, other):
+        if not isinstance(other, Glyph):
+            return NotImplemented
         return self.codepoints == other.codepoints
 
+    def __hash__(self):
+        return self.codepoints.seqHash
+
     def __lt__(self, other):
-        return self.codepoints < other.codepoints
+        return self.codepoints.sortKey < other.codepoints.sortKey
 
     def __len__(self):
         return len(self.codepoints)
 
     def name(self):
-        return self.codepoints.name()
+        return self.codepoints.glyphName
+
+
+
+
+
+
+
+class GlyphRegistry:
+    """
+    Class representing an index of glyphs by their codepoint sequences.
+
+    This lets glyphs be looked up and checked against each other without
+    searching through every other glyph each time.
+    """
+    def __init__(self, glyphs=None):
+        self.glyphs = []
+        self.bySeq = dict() # CodepointSeq -> list of glyphs with that sequence
+        self.singleCodepoints = set() # codepoints of every non-ligature glyph
+
+        if glyphs:
+            for g in glyphs:
+                self.add(g)
+
+
+    def add(self, glyph):
+        self.glyphs.append(glyph)
+
+        if glyph.codepoints in self.bySeq:
+            self.bySeq[glyph.codepoints].append(glyph)
+        else:
+            self.bySeq[glyph.codepoints] = [glyph]
+
+        if len(glyph.codepoints) == 1:
+            self.singleCodepoints.add(glyph.codepoints.seq[0])
+
+
+    def duplicates(self):
+        """
+        Returns a list of every group of glyphs that share a codepoint sequence.
+        """
+        return [group for group in self.bySeq.values() if len(group) > 1]
+
+
+    def __contains__(self, codepoints):
+        return codepoints in self.bySeq
+
+    def __iter__(self):
+        return iter(self.glyphs)
+
+    def __len__(self):
+        return len(self.glyphs)
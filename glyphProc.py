@@ -1,7 +1,10 @@
+import json
+import os
 import pathlib
+from concurrent.futures import ProcessPoolExecutor
 
 import log
-from glyph import simpleHex, Glyph, Img
+from glyph import simpleHex, Glyph, GlyphRegistry, Img, clearInternedSeqs
 
 # glyphProc.py
 # -----------------------------
@@ -9,75 +12,261 @@ from glyph import simpleHex, Glyph, Img
 # processing and compiling glyphs before font creation.
 
 
-def compileImageGlyphs(dir, m, delim, nusc, afsc, imageFormats):
+
+def buildImg(imgArgs):
+    """
+    Builds a single Img object from a tuple of Img arguments.
+
+    (This has to be a top-level function so worker processes can use it.)
+    """
+    return Img(*imgArgs)
+
+
+
+def buildImgs(imgArgsList, jobs):
+    """
+    Builds a list of Img objects, fanning the work out over a pool of
+    worker processes if more than one job is requested.
+
+    The results come back in the same order as imgArgsList, and if any
+    of them fail, the first failure (in that order) is the one that gets raised.
+    """
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs == 1 or len(imgArgsList) < 2:
+        return [buildImg(a) for a in imgArgsList]
+
+    # hand out work in chunks so the manifest data isn't pickled for every single image.
+    chunksize = max(1, len(imgArgsList) // (jobs * 4))
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(buildImg, imgArgsList, chunksize=chunksize))
+
+
+
+def scanImageFolders(dir):
+    """
+    Scans the input folder and the image folders inside it in a single pass.
+
+    Returns a dict of folder name -> file stem -> os.DirEntry for the 'svg'
+    folder and anything starting with 'png'. (DirEntries cache their stat
+    results, so nothing after this has to go back to the filesystem to check
+    on these files.)
+    """
+
+    index = dict()
+
+    with os.scandir(dir) as inputEntries:
+        for folder in inputEntries:
+
+            if folder.name == 'svg':
+                extension = '.svg'
+            elif folder.name.startswith('png'):
+                extension = '.png'
+            else:
+                continue
+
+            index[folder.name] = dict()
+
+            if folder.is_dir():
+                with os.scandir(folder.path) as imageEntries:
+                    for entry in imageEntries:
+                        stem, suffix = os.path.splitext(entry.name)
+
+                        if suffix == extension:
+                            index[folder.name][stem] = entry
+
+    return index
+
+
+
+def svgOptimizeOptions(flags):
+    """
+    Returns the SVG optimization options (--svg-min, --svg-paths, --svg-bake and
+    --svg-precision) as a dict for Img, or None if SVGs aren't being optimized.
+    """
+    if not (flags["svg_min"] or flags["svg_paths"]):
+        return None
+
+    return { "minify": flags["svg_min"]
+           , "paths": flags["svg_paths"]
+           , "bake": flags["svg_paths"] and flags["svg_bake"]
+           , "precision": flags["svg_precision"]
+           }
+
+
+
+def reportSVGSavings(svgImgs):
+    """
+    Logs how many bytes SVG optimization saved, in total and for every glyph
+    (the ones that saved the most first).
+
+    SVGs that came from the cache were optimized (and reported) in an earlier run,
+    so they aren't counted.
+    """
+    saved = [(stem, img.bytesSaved) for stem, img in svgImgs.items() if img.bytesSaved is not None]
+    cached = len(svgImgs) - len(saved)
+
+    if not saved:
+        log.out(f'- SVG optimization: all {cached} SVGs came from the cache.', 90)
+        return
+
+    total = sum(s for stem, s in saved)
+
+    log.out(f'- SVG optimization: {total} bytes saved across {len(saved)} SVGs ({total // len(saved)} per glyph on average{f", {cached} cached SVGs not counted" if cached else ""}).', 90)
+
+    for stem, s in sorted(saved, key=lambda s: s[1], reverse=True):
+        log.out(f'  - {stem}: {s} bytes', 90)
+
+
+
+def compileImageGlyphs(dir, m, delim, nusc, afsc, imageFormats, jobs=1, svgCache=None, svgOptimize=None, inputIndex=None, imgMemo=None):
 
     ## get a rough list of everything
 
-    imgCollection = dict()
+    imgIndex = scanImageFolders(dir)
+    imgFolders = dict() # folder name -> (image type, strike size, stem -> DirEntry)
 
     if 'svg' in imageFormats:
 
-        if not (dir / 'svg').exists():
+        if 'svg' not in imgIndex:
             raise Exception(f"You don't have an 'svg' folder in your input!")
 
-        if not list((dir / 'svg').glob("*.svg")):
+        if not imgIndex['svg']:
             raise Exception(f"There are no svg images in your SVG folder!.")
 
-        imgCollection['svg'] = dict()
-
-        for path in list((dir / 'svg').glob("*.svg")):
-            imgCollection['svg'][path.stem] = Img("svg", 0, m, path.absolute(), afsc)
+        imgFolders['svg'] = ("svg", 0, imgIndex['svg'])
 
 
 
     if 'png' in imageFormats:
 
-        if not list(dir.glob("png*")):
+        pngFolderNames = [name for name in imgIndex if name.startswith('png')]
+
+        if not pngFolderNames:
             raise Exception(f"There are no PNG folders in your input folder.")
 
-        for pngFolder in list(dir.glob("png*")):
-            if not pngFolder.name[0] == '.' and not pngFolder.suffix: # if it's not a hidden file and if it's not a file.
+        for pngFolderName in pngFolderNames:
+            if not pngFolderName[0] == '.' and not os.path.splitext(pngFolderName)[1]: # if it's not a hidden file and if it's not a file.
 
                 try:
-                    formatName, strike = pngFolder.name.split('-', 2)
+                    formatName, strike = pngFolderName.split('-', 2)
                     strikeSize = int(strike)
                 except ValueError as e:
-                    raise Exception(f"One of your PNG folders ('{pngFolder.name}') isn't named properly. Make sure it's 'png-<strike size>'.")
+                    raise Exception(f"One of your PNG folders ('{pngFolderName}') isn't named properly. Make sure it's 'png-<strike size>'.")
 
-                if not list(pngFolder.glob("*.png")):
-                    raise Exception(f"There are no PNG images in '{pngFolder}'.")
+                if not imgIndex[pngFolderName]:
+                    raise Exception(f"There are no PNG images in '{dir / pngFolderName}'.")
 
-                imgCollection[pngFolder.name] = dict()
+                imgFolders[pngFolderName] = ("png", strikeSize, imgIndex[pngFolderName])
 
-                for path in list(pngFolder.glob("*.png")):
-                    imgCollection[pngFolder.name][path.stem] = Img("png", strikeSize, m, path.absolute())
 
 
     ## check size
 
-    firstFolderName = list(imgCollection.keys())[0]
-    firstFolder = imgCollection[firstFolderName]
+    firstFolderName = list(imgFolders.keys())[0]
+    firstFolder = imgFolders[firstFolderName][2]
 
-    if len(imgCollection) > 1:
-        for key, folder in list(imgCollection.items())[1:]:
+    if len(imgFolders) > 1:
+        for key, (imgType, strikeSize, folder) in list(imgFolders.items())[1:]:
             if not len(folder) == len(firstFolder):
                 raise Exception(f"The amount of glyphs in your input folders aren't the same. '{key}' has {str(len(folder))}. '{firstFolderName}' has {len(firstFolder)}. The amount of images in every folder should be the same.")
 
 
 
+    ## check if all the codepoint names are the same
+
+    for c in firstFolder:
+        for folderName, (imgType, strikeSize, folder) in imgFolders.items():
+            if not c in folder:
+                raise Exception(f"There's a mismatch in your files. I tried to find an image for the codepoint '{c}' in '{folderName}', but I couldn't find one. You have to make sure you have the exact same sets of filenames in each of your input folders.")
+
+
+
+    ## build every image
+    ## (this is done all at once so it can be done in parallel.)
+
+    imgArgsList = []
+    imgKeys = []
+    svgCacheKeys = dict() # index in imgArgsList -> cache key, for SVGs that aren't cached yet.
+
+    imgCollection = {folderName: dict() for folderName in imgFolders}
+
+    # (in --watch mode, images from the last build are kept in imgMemo, and
+    # the ones that haven't changed since then are just used again.)
+    memoKeys = []
+    usedMemo = dict()
+    metricsKey = json.dumps(m['metrics'], sort_keys=True)
+
+    for folderName, (imgType, strikeSize, folder) in imgFolders.items():
+        for stem, entry in folder.items():
+            path = pathlib.Path(entry.path).absolute()
+
+            if imgMemo is not None:
+                if inputIndex is not None:
+                    memoKey = (folderName, str(path), inputIndex.get(path), metricsKey)
+                else:
+                    memoKey = (folderName, str(path), entry.stat().st_size, entry.stat().st_mtime_ns, metricsKey)
+
+                if memoKey in imgMemo:
+                    imgCollection[folderName][stem] = usedMemo[memoKey] = imgMemo[memoKey]
+                    continue
+
+                memoKeys.append(memoKey)
+
+            if imgType == "svg":
+                svgData = None
+
+                if svgCache:
+                    # (SVGs in the input index don't have to be read again to get their key.)
+                    key = svgCache.key(path, inputIndex.get(path) if inputIndex else None)
+                    svgData = svgCache.get(key)
+
+                    if svgData is None:
+                        svgCacheKeys[len(imgArgsList)] = key
+
+                imgArgsList.append(("svg", 0, m, path, nusc, afsc, svgData, svgOptimize))
+
+            else:
+                imgArgsList.append(("png", strikeSize, m, path))
+
+            imgKeys.append((folderName, stem))
+
+
+    imgs = buildImgs(imgArgsList, jobs)
+
+    for (folderName, stem), img in zip(imgKeys, imgs):
+        imgCollection[folderName][stem] = img
+
+    # only keep what this build used, so images that have changed or gone don't pile up.
+    if imgMemo is not None:
+        log.out(f'- {len(usedMemo)} image(s) unchanged since the last build, {len(imgs)} (re)loaded.', 90)
+
+        usedMemo.update(zip(memoKeys, imgs))
+        imgMemo.clear()
+        imgMemo.update(usedMemo)
+
+    # store any newly-compensated SVGs.
+    if svgCache:
+        for index, key in svgCacheKeys.items():
+            svgCache.put(key, imgs[index].getSVGBytes())
+
+    if svgOptimize is not None and 'svg' in imgCollection:
+        reportSVGSavings(imgCollection['svg'])
+
+
+
     ## convert them into glyphs
-    ## (at the same time checking if all the codepoint names are the same)
 
     imgGlyphs = []
 
-    for c, file in firstFolder.items():
+    for c in firstFolder:
         imgDict = dict()
 
         for folderName, folder in imgCollection.items():
-            if not c in folder:
-                raise Exception(f"There's a mismatch in your files. I tried to find an image for the codepoint '{c}' in '{folderName}', but I couldn't find one. You have to make sure you have the exact same sets of filenames in each of your input folders.")
-            else:
-                imgDict[folderName] = folder[c]
+            imgDict[folderName] = folder[c]
 
         try:
             imgGlyphs.append(Glyph(c, imgDict=imgDict, delim=delim))
@@ -92,57 +281,60 @@ def compileImageGlyphs(dir, m, delim, nusc, afsc, imageFormats):
 
 
 
-def compileAliasGlyphs(glyphs, aliases, delim):
+def raiseProblems(problems):
+    """
+    Raises an Exception describing every problem in a list of problems (if there are any).
+    """
+    if len(problems) == 1:
+        raise Exception(problems[0])
+
+    elif problems:
+        raise Exception(f"There are {len(problems)} problems with your glyphs:\n" + '\n'.join(f"- {p}" for p in problems))
+
+
+
+def compileAliasGlyphs(registry, aliases, delim):
 
     # basic check!
 
+    problems = []
+
     for target, destination in aliases.items():
 
         try:
             aliasGlyph = Glyph(target, alias=destination, delim=delim)
         except ValueError as e:
-            raise Exception(f"Some part of an alias glyph isn't named correctly. → {e}")
+            problems.append(f"Some part of an alias glyph isn't named correctly. → {e}")
+            continue
 
 
         # is the target NOT a real destination
-        targetMatches = False
-
-        for g in glyphs:
-            if aliasGlyph == g:
-                targetMatches = True
-
-        if targetMatches:
-            raise Exception(f"The codepoint sequence for the alias glyph ('{target}') is represented in your image glyphs. It has to be something different.")
+        if aliasGlyph.codepoints in registry:
+            problems.append(f"The codepoint sequence for the alias glyph ('{target}') is represented in your image glyphs. It has to be something different.")
+            continue
 
 
         # is the destination is a real destination
-        destinationMatches = False
+        if aliasGlyph.alias not in registry:
+            problems.append(f"The destination ('{destination}') of the alias glyph '{target}' is not represented in your image glyphs.")
+            continue
 
-        for g in glyphs:
-            if aliasGlyph.alias == g.codepoints:
-                destinationMatches = True
+        registry.add(aliasGlyph)
 
-        if not destinationMatches:
-            raise Exception(f"The destination ('{destination}') of the alias glyph '{target}' is not represented in your image glyphs.")
 
-        glyphs.append(aliasGlyph)
+    raiseProblems(problems)
 
 
-    return glyphs
 
-
-
-def addServiceGlyphs(glyphs, no_vs16):
+def addServiceGlyphs(registry, no_vs16):
     """
-    adds service glyphs to the list of glyphs based on various requirements.
+    adds service glyphs to the registry of glyphs based on various requirements.
     """
 
-    newGlyphs = []
-
     vs16Presence = False
     zwjPresence = False
 
-    for g in glyphs:
+    for g in registry:
 
         # presence
         if g.codepoints.vs16 and no_vs16 is False: vs16Presence = True
@@ -151,48 +343,53 @@ def addServiceGlyphs(glyphs, no_vs16):
 
     # add particular service glyphs.
 
-    glyphs.append(Glyph(["20"], userInput=False)) # breaking space
-    glyphs.append(Glyph(["a0"], userInput=False)) # non-breaking space
-    if vs16Presence: glyphs.append(Glyph(["fe0f"], userInput=False))
-    if zwjPresence: glyphs.append(Glyph(["200d"], userInput=False))
+    registry.add(Glyph(["20"], userInput=False)) # breaking space
+    registry.add(Glyph(["a0"], userInput=False)) # non-breaking space
+    if vs16Presence: registry.add(Glyph(["fe0f"], userInput=False))
+    if zwjPresence: registry.add(Glyph(["200d"], userInput=False))
 
 
-    return glyphs
 
 
-
-
-def glyphDuplicateTest(glyphs):
+def glyphDuplicateTest(registry):
     """
-    Checks whether there are any duplicates in codepoints in a list of glyphs.
+    Checks whether there are any duplicates in codepoints in a registry of glyphs.
     """
-    for id1, g1 in enumerate(glyphs):
-        for id2, g2 in enumerate(glyphs):
-            if g1 == g2:
-                if id1 != id2:
-                    raise Exception(f"One of your glyphs (image paths - {g1.img}) when processed, becomes {g1}. This matches another glyph that you have - {g2}. Make sure that your codepoint sequences aren't duplicates when stripped of VS16s (fe0f).")
+    problems = []
 
+    for group in registry.duplicates():
+        g1 = group[0]
 
+        for g2 in group[1:]:
+            problems.append(f"One of your glyphs (image paths - {g1.imgDict}) when processed, becomes {g1}. This matches another glyph that you have - {g2}. Make sure that your codepoint sequences aren't duplicates when stripped of VS16s (fe0f).")
 
+    raiseProblems(problems)
 
-def areGlyphLigaturesSafe(glyphs):
 
-    singleGlyphCodepoints = []
-    ligatures = []
 
-    for g in glyphs:
+
+def areGlyphLigaturesSafe(registry):
+
+    problems = []
+
+    for g in registry:
         if len(g.codepoints) > 1:
-            ligatures.append(g)
-        else:
-            singleGlyphCodepoints.append(g.codepoints.seq[0])
+            for codepoint in g.codepoints.seq:
+                if codepoint not in registry.singleCodepoints:
+                    problems.append(f"One of your ligatures ({g.codepoints}) has an individual codepoint (apart from fe0f and 200d) that is not represented as a glyph itself ({simpleHex(codepoint)}). All components of all ligatures (apart from fe0f and 200d) must be represented as glyphs.")
+
+    raiseProblems(problems)
 
-    for g in ligatures:
-        for codepoint in g.codepoints.seq:
-            if codepoint not in singleGlyphCodepoints:
-                raise Exception(f"One of your ligatures ({g.codepoints}) has an individual codepoint (apart from fe0f and 200d) that is not represented as a glyph itself ({simpleHex(codepoint)}). All components of all ligatures (apart from fe0f and 200d) must be represented as glyphs.")
 
 
 
+def sortKey(glyph):
+    """
+    The key glyphs are sorted by. (see CodepointSeq.__lt__.)
+    """
+    return glyph.codepoints.sortKey
+
+
 
 def mixAndSortGlyphs(glyphs):
 
@@ -208,19 +405,19 @@ def mixAndSortGlyphs(glyphs):
     #
     # CHECK OUT THE CODEPOINTSEQ CLASS TO UNDERSTAND WHY.
 
-    glyphs.sort()
+    glyphs.sort(key=sortKey)
 
     for g in glyphs:
 
         glyphStruct["all"].append(g)
 
-        if g.glyphType is not "alias":
+        if g.glyphType != "alias":
             glyphStruct["img_empty"].append(g)
 
-        if g.glyphType is "img":
+        if g.glyphType == "img":
             glyphStruct["img"].append(g)
 
-        if g.glyphType is "empty":
+        if g.glyphType == "empty":
             glyphStruct["empty"].append(g)
 
 
@@ -230,49 +427,57 @@ def mixAndSortGlyphs(glyphs):
 
 
 
-def getGlyphs(inputPath, m, aliases, delim, imageFormats, flags):
+def getGlyphs(inputPath, m, aliases, delim, imageFormats, flags, svgCache=None, inputIndex=None, imgMemo=None):
     """
     Runs inputs through all of the necessary processes and checks to create a glyphs structure.
     """
 
+    # (only the sequences from this build need interning.)
+    clearInternedSeqs()
+
     # compile image glyphs
     log.out(f'- Getting + validating image glyphs... (this can take a while)', 90)
-    imgGlyphs = compileImageGlyphs(inputPath, m, delim, flags["nusc"], flags["afsc"], imageFormats)
+    imgGlyphs = compileImageGlyphs(inputPath, m, delim, flags["nusc"], flags["afsc"], imageFormats, flags["jobs"], svgCache, svgOptimizeOptions(flags), inputIndex, imgMemo)
+
+    if svgCache:
+        evicted = svgCache.evict()
+        log.out(f'- SVG cache: {svgCache}, {evicted} evicted.', 90)
+
+
+    # every glyph goes into a registry so they can be checked against each other quickly.
+    registry = GlyphRegistry(imgGlyphs)
 
 
     # compile alias glyphs
     if aliases:
         log.out(f'- Getting + validating alias glyphs...', 90)
-        glyphs = compileAliasGlyphs(imgGlyphs, aliases, delim)
-    else:
-        glyphs = imgGlyphs
+        compileAliasGlyphs(registry, aliases, delim)
 
 
     # process service glyphs
     log.out(f'- Adding service codepoints...', 90)
-    glyphs = addServiceGlyphs(glyphs, flags["no_vs16"])
+    addServiceGlyphs(registry, flags["no_vs16"])
 
 
     # check for duplicate codepoints without VS16
     if not flags["no_vs16"]:
         log.out(f'- Checking if there are any duplicate glyphs...', 90)
-        glyphDuplicateTest(glyphs)
+        glyphDuplicateTest(registry)
 
 
     # validating (or stripping) ligatures
     if flags["no_lig"]:
         log.out(f'- [--no-lig] Stripping any ligatures...', 90)
-        singleGlyphs = []
+        glyphs = []
 
-        for g in glyphs:
+        for g in registry:
             if len(g.codepoints) == 1:
-                singleGlyphs.append(g)
-
-        glyphs = singleGlyphs
+                glyphs.append(g)
 
     else:
         log.out(f'- Validating ligatures...', 90)
-        areGlyphLigaturesSafe(glyphs)
+        areGlyphLigaturesSafe(registry)
+        glyphs = registry.glyphs
 
 
     log.out(f'- Mixing and sorting glyphs...', 90)
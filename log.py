@@ -1,15 +1,29 @@
+import sys
+
+
 def to_color(s, c):
     return f'\x1b[{c}m{s}\x1b[0m' if use_color else s
 
 def out_line(s='', color=37, indent=0, thread_name=None, newline=True):
-    t = ''
+    global partial_line
+
+    if thread_name is None:
+        thread_name = default_thread_name
+
     if thread_name is not None and show_threads:
-        t = to_color(f'<{thread_name}> ', thread_color)
+        # lines are held back until they're finished and then written in one go,
+        # so they don't get mixed up with output from other workers.
+        partial_line += ' ' * indent + to_color(s, color)
+
+        if newline:
+            sys.stdout.write(to_color(f'<{thread_name}> ', thread_color) + partial_line + '\n')
+            sys.stdout.flush()
+            partial_line = ''
 
-    if newline:
-        print(t + ' ' * indent + to_color(s, color))
+    elif newline:
+        print(' ' * indent + to_color(s, color))
     else:
-        print(t + ' ' * indent + to_color(s, color), end="")
+        print(' ' * indent + to_color(s, color), end="")
 
 def out(s='', color=37, indent=0, thread_name=None, newline=True):
     for line in s.split('\n'):
@@ -20,3 +34,7 @@ def out(s='', color=37, indent=0, thread_name=None, newline=True):
 use_color = True
 show_threads = True
 thread_color = 34
+
+# the thread name used when one isn't given (ie. set by each worker process).
+default_thread_name = None
+partial_line = ''
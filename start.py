@@ -1,11 +1,15 @@
+import os
 import pathlib
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 
 import log
 import files
-from create import createFont
+from cache import SVGCache, FontCache, InputIndex, glyphsDigest
+from create import createFont, outputFilenames
 from manifest.manifest import checkTransformManifest
 from validate.aliases import validateAliases
-from glyphProc import getGlyphs
+from glyphProc import getGlyphs, svgOptimizeOptions
 from format import formats, compilers
 
 
@@ -17,6 +21,85 @@ from format import formats, compilers
 # Also initiates font export when all of these things are completed and satisfactory.
 
 
+
+def createFontWorker(fontFormat, outputPath, manifest, glyphs, compiler, flags, fontCache, cacheKey):
+    """
+    Creates a font in a worker process, marking all of its log output with the font format.
+    """
+    log.default_thread_name = fontFormat
+    return createFont(fontFormat, outputPath, manifest, glyphs, compiler, flags, fontCache, cacheKey)
+
+
+
+def createFonts(outputFormats, outputPath, manifest, glyphs, compiler, flags, fontCache=None, inputIndex=None):
+    """
+    Creates a font for every output format, building them at the
+    same time in separate worker processes if more than one job is requested.
+
+    Formats that would make exactly the same font as another one (see
+    FontCache) wait for that one to be finished, and then reuse it.
+    """
+
+    # work out every format's font cache key.
+    # ------------------------------------------------
+    cacheKeys = {f: None for f in outputFormats}
+
+    if fontCache is not None:
+        digests = dict() # image format -> glyphs digest
+
+        for f in outputFormats:
+            imageFormat = formats[f]["imageFormat"]
+
+            if imageFormat not in digests:
+                digests[imageFormat] = glyphsDigest(glyphs, imageFormat, inputIndex)
+
+            cacheKeys[f] = fontCache.key(formats[f], manifest, digests[imageFormat], compiler, flags)
+
+
+    # formats that make the same font as an earlier one go in a second wave.
+    waves = [[], []]
+    seenKeys = set()
+
+    for f in outputFormats:
+        if cacheKeys[f] is not None and cacheKeys[f] in seenKeys:
+            waves[1].append(f)
+        else:
+            waves[0].append(f)
+            seenKeys.add(cacheKeys[f])
+
+
+    # build them.
+    # ------------------------------------------------
+    jobs = flags["jobs"]
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    reused = 0
+
+    for wave in waves:
+        if not wave:
+            continue
+
+        waveJobs = min(jobs, len(wave))
+
+        if waveJobs == 1:
+            for f in wave:
+                reused += createFont(f, outputPath, manifest, glyphs, compiler, flags, fontCache, cacheKeys[f])
+
+        else:
+            with ProcessPoolExecutor(max_workers=waveJobs) as executor:
+                futures = [executor.submit(createFontWorker, f, outputPath, manifest, glyphs, compiler, flags, fontCache, cacheKeys[f]) for f in wave]
+
+                # if anything went wrong, the first format (in the order they were given) that failed is reported.
+                for future in futures:
+                    reused += future.result()
+
+    if fontCache is not None:
+        log.out(f'- Font cache: {reused} of {len(outputFormats)} font(s) reused, {fontCache.evict()} evicted.', 90)
+
+
+
 def start( inputPath
           , outputPath
           , manifestPath
@@ -26,12 +109,15 @@ def start( inputPath
           , outputFormats
           , compiler
           , flags
+          , imgMemo=None
           ):
     """
     Performs a variety of initial data gathering and validation tasks,
     designed to make sure all of the user-given data is valid and usable.
 
     Once this has all been validated, it starts the font making process.
+
+    (imgMemo is for --watch mode - see watch.py.)
     """
 
     log.out(f'\nFetching resources...', 35)
@@ -116,11 +202,65 @@ def start( inputPath
 
 
 
+    # work out what's changed since the last build
+    # ------------------------------------------------
+
+    if not flags["no_cache"]:
+        log.out(f'Checking what has changed since the last build...')
+
+        inputIndex = InputIndex(outputPathPath / '.forc_cache' / 'index.json')
+        inputIndex.scan(inputPathPath, [manifestPathPath, aliasesPathPath if aliasesPath else None], outputPathPath)
+
+        log.out(f'- Input index: {inputIndex}.', 90)
+
+        # everything apart from the input images that affects a format.
+        buildData = { "compiler": compiler
+                    , "delim": delim_codepoint
+                    , "flags": {k: v for k, v in flags.items() if k not in ["jobs"]}
+                    , "manifest": inputIndex.get(manifestPathPath)
+                    , "aliases": inputIndex.get(aliasesPathPath) if aliasesPath else None
+                    }
+
+        fingerprints = dict()
+        formatsToBuild = []
+
+        for f in outputFormats:
+            fingerprints[f] = inputIndex.fingerprint(inputPathPath, formats[f]["imageFormat"], dict(buildData, format=f))
+
+            # (--dev-ttx always builds from scratch.)
+            if not flags["dev_ttx_output"] and inputIndex.isUpToDate(f, fingerprints[f], outputPathPath):
+                log.out(f'- {f} is already up to date.', 90)
+            else:
+                formatsToBuild.append(f)
+
+        log.out(f'{len(formatsToBuild)} of {len(outputFormats)} format(s) need building.\n', 32)
+
+        if not formatsToBuild:
+            inputIndex.save()
+            log.out(f'Nothing has changed since the last build, so there\'s nothing to do!', 32)
+            return
+
+        # only the images that the formats being built use need getting.
+        glyphImageFormats = set(formats[f]["imageFormat"] for f in formatsToBuild)
+
+    else:
+        inputIndex = None
+        formatsToBuild = outputFormats
+
+
+
+
     # glyphs
     # ------------------------------------------------
 
+    # compensated SVGs are cached in the output folder between runs.
+    if 'svg' in glyphImageFormats and not flags["no_cache"]:
+        svgCache = SVGCache(outputPathPath / '.forc_cache' / 'svg', manifest['metrics'], flags["nusc"], flags["afsc"], svgOptimizeOptions(flags))
+    else:
+        svgCache = None
+
     log.out(f'Getting + checking glyphs...')
-    glyphs = getGlyphs(inputPathPath, manifest, aliases, delim_codepoint, glyphImageFormats, flags)
+    glyphs = getGlyphs(inputPathPath, manifest, aliases, delim_codepoint, glyphImageFormats, flags, svgCache, inputIndex, imgMemo)
     log.out(f'Glyphs OK!\n', 32)
 
 
@@ -132,5 +272,32 @@ def start( inputPath
 
     log.out(f'Starting font compilation...\n\n', 35)
 
-    for f in outputFormats:
-        createFont(f, outputPath, manifest, glyphs, compiler, flags)
+    # finished fonts are cached too, so identical fonts are only compiled once.
+    # (with --no-cache, they're only shared between the formats in this run.)
+    if flags["no_cache"]:
+        fontCachePath = outputPathPath / '.forc_tmp' / 'fonts'
+    else:
+        fontCachePath = outputPathPath / '.forc_cache' / 'fonts'
+
+    fontCache = FontCache(fontCachePath)
+
+    try:
+        createFonts(formatsToBuild, outputPath, manifest, glyphs, compiler, flags, fontCache, inputIndex)
+
+        # remember what every format was built from, so it can be skipped next
+        # time if none of that changes.
+        if inputIndex is not None:
+            for f in formatsToBuild:
+                inputIndex.record(f, fingerprints[f], outputPathPath, outputFilenames(f, manifest, compiler, flags))
+
+    finally:
+        if inputIndex is not None:
+            inputIndex.save()
+
+        if flags["no_cache"]:
+            shutil.rmtree(fontCachePath, ignore_errors=True)
+
+            try:
+                fontCachePath.parent.rmdir()
+            except OSError:
+                pass
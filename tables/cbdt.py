@@ -1,8 +1,10 @@
 import struct
 
 from lxml.etree import Element
-from tables.common.ebxBitmaps import EBDTBitmapFormat17
-from transform.bytes import outputTableBytes
+from tables.common.ebxBitmaps import EBDTBitmapFormat17, EBDTBitmapFormat19
+from tables.common.ebxIndexes import IndexSubTable1, IndexSubTable3, IndexSubTable4, IndexSubTable5
+from tables.common.ebxMetrics import BigGlyphMetrics
+from transform.bytes import chunksToBytes, outputTableChunks
 
 class CBDTStrike:
     """
@@ -12,8 +14,122 @@ class CBDTStrike:
     def __init__(self, glyphs, metrics, strikeRes):
         self.glyphs = []
 
-        for g in glyphs["img"]: #img is used here because CBDT bitmaps are identified by glyph name.
-            self.glyphs.append(EBDTBitmapFormat17(metrics, strikeRes, g))
+        glyphIDs = [id for id, g in enumerate(glyphs["img_empty"]) if g.imgDict]
+
+        for id, g in zip(glyphIDs, glyphs["img"]): #img is used here because CBDT bitmaps are identified by glyph name.
+            self.glyphs.append(EBDTBitmapFormat17(metrics, strikeRes, g, id))
+
+        self.indexSubTables = self.chooseIndexSubTables(glyphs, metrics, strikeRes)
+
+
+
+    def chooseIndexSubTables(self, glyphs, metrics, strikeRes):
+        """
+        Works out which IndexSubTable format (and bitmap format) makes the
+        smallest strike, counting both the CBLC index and the CBDT data, and
+        returns the IndexSubTables for it.
+
+        Every bitmap in a strike has the same metrics, so the options are:
+        - format 1 + format 17 bitmaps (one subtable, Offset32s)
+        - format 3 + format 17 bitmaps (Offset16s, split every 64KB of data)
+        - format 4 + format 17 bitmaps (same as 3, but sparse)
+        - format 5 + format 19 bitmaps (metrics stored once, but every bitmap
+          is padded to the size of the biggest one)
+
+        TTX output always uses format 1 + format 17.
+        """
+        bitmaps = self.glyphs
+        options = []
+
+
+        # format 1
+        options.append((self.indexLength(IndexSubTable1, [bitmaps]), lambda: [IndexSubTable1(bitmaps)]))
+
+
+        # formats 3 and 4
+        groups = self.splitBitmaps(bitmaps, IndexSubTable3.maxDataLength)
+
+        if groups:
+            options.append((self.indexLength(IndexSubTable3, groups), lambda: [IndexSubTable3(g) for g in groups]))
+            options.append((self.indexLength(IndexSubTable4, groups), lambda: [IndexSubTable4(g) for g in groups]))
+
+
+        # format 5
+        # (format 19 bitmaps don't have metrics, but they're padded to the biggest PNG.)
+        imageSize = 4 + max(len(b.png) for b in bitmaps) # dataLen + data
+        extraData = imageSize * len(bitmaps) - sum(b.length for b in bitmaps)
+
+        def format5():
+            bitmaps19 = [EBDTBitmapFormat19(strikeRes, g, b.id, imageSize) for g, b in zip(glyphs["img"], bitmaps)]
+            return [IndexSubTable5(bitmaps19, 19, BigGlyphMetrics(metrics))]
+
+        options.append((self.indexLength(IndexSubTable5, [bitmaps]) + extraData, format5))
+
+
+        # the first of the smallest options wins.
+        size, makeIndexSubTables = min(options, key=lambda o: o[0])
+
+        return makeIndexSubTables()
+
+
+
+    @staticmethod
+    def indexLength(indexFormat, groups):
+        """
+        The number of bytes a strike's IndexSubTableArray and IndexSubTables
+        would take up in CBLC, split into the given groups of bitmaps.
+        """
+        return sum(8 + indexFormat.length(g[0].id, g[-1].id, len(g)) for g in groups)
+
+
+
+    @staticmethod
+    def splitBitmaps(bitmaps, maxDataLength):
+        """
+        Splits a list of bitmaps into groups that each have no more than
+        maxDataLength bytes of bitmap data, in a single pass.
+
+        Returns None if a single bitmap is too big by itself.
+        """
+        groups = [[]]
+        dataLength = 0
+
+        for b in bitmaps:
+            if b.length > maxDataLength:
+                return None
+
+            if dataLength + b.length > maxDataLength:
+                groups.append([])
+                dataLength = 0
+
+            groups[-1].append(b)
+            dataLength += b.length
+
+        return groups
+
+
+
+    def layout(self, offset):
+        """
+        Sets every IndexSubTable's imageDataOffset, as if the strike's bitmaps
+        start at the given offset in CBDT. Returns the offset just after the strike.
+        """
+        for s in self.indexSubTables:
+            s.imageDataOffset = offset
+            offset += sum(b.length for b in s.bitmaps)
+
+        return offset
+
+
+    def toChunks(self):
+        chunks = []
+
+        for s in self.indexSubTables:
+            for b in s.bitmaps:
+                chunks += b.toChunks()
+
+        return chunks
+
 
 
     def toTTX(self, index):
@@ -26,6 +142,18 @@ class CBDTStrike:
         return strikedata
 
 
+    def writeTTX(self, xf, index):
+        """
+        Writes the strike's TTX to an lxml xmlfile one bitmap at a time,
+        so only one bitmap's hexdump is ever in memory.
+        """
+        with xf.element("strikedata", {"index": str(index)}):
+            xf.write("\n")
+            for g in self.glyphs:
+                xf.write(g.toTTX(), pretty_print=True)
+        xf.write("\n")
+
+
 class CBDT:
     """
     A class representing a CBDT table.
@@ -42,14 +170,18 @@ class CBDT:
 
 
         # iterate over each strike.
-        strikeIndex = 0
-
         for imageFormat, image in glyphs["img"][0].imgDict.items():
             if imageFormat.split('-')[0] == "png":
                 strikeRes = imageFormat.split('-')[1]
                 self.strikes.append(CBDTStrike(glyphs, m["metrics"], strikeRes))
 
-                strikeIndex += 1
+
+        # lay the strikes out one after the other, after the header.
+        # (CBLC gets its offsets from here.)
+        offset = 4
+
+        for strike in self.strikes:
+            offset = strike.layout(offset)
 
 
     def toTTX(self):
@@ -63,10 +195,36 @@ class CBDT:
 
         return cbdt
 
+
+    def writeTTX(self, xf):
+        """
+        Writes the CBDT table's TTX to an lxml xmlfile one strike at a time.
+        """
+        with xf.element("CBDT"):
+            xf.write("\n")
+            xf.write(Element("header", {"version": f"{self.majorVersion}.{self.minorVersion}"}), pretty_print=True)
+
+            for strikeIndex, strike in enumerate(self.strikes):
+                strike.writeTTX(xf, strikeIndex)
+        xf.write("\n")
+
+
+    def toChunks(self):
+        """
+        Returns the CBDT table as a list of chunks, so the PNGs can be copied
+        straight from file to file. (see transform.bytes.FileChunk)
+        """
+        chunks = [struct.pack( ">HH"
+                             , self.majorVersion # UInt16
+                             , self.minorVersion # UInt16
+                             )]
+
+        for strike in self.strikes:
+            chunks += strike.toChunks()
+
+        return outputTableChunks(chunks)
+
+
     def toBytes(self):
-        cbdt = struct.pack( ">HH"
-                          , self.majorVersion # UInt16
-                          , self.minorVersion # UInt16
-                          )
-        return outputTableBytes(cbdt) # placeholder
-        # TODO: pack all of the image data immediately after~
+        chunks, length = self.toChunks()
+        return (chunksToBytes(chunks), length)
@@ -2,7 +2,7 @@ import struct
 from lxml.etree import Element
 from tables.common.ebxMetrics import SbitLineMetrics
 from tables.common.ebxIndexes import IndexSubTable1
-from transform.bytes import outputTableBytes
+from transform.bytes import generateOffsets, outputTableBytes
 
 
 class CBLCBitmapSize:
@@ -12,10 +12,12 @@ class CBLCBitmapSize:
     This is similar to, but not the same as, an EBLC BitmapSize subtable.
     """
 
-    def __init__(self, metrics, ppem, glyphs):
+    def __init__(self, metrics, ppem, strike):
 
-        self.indexSubTables = []
-        self.indexSubTables.append(IndexSubTable1(glyphs))
+        # TTX always gets one format 1 IndexSubTable, and the binary version
+        # gets whatever the CBDT strike chose.
+        self.ttxIndexSubTables = [IndexSubTable1(strike.glyphs)]
+        self.indexSubTables = strike.indexSubTables
 
         self.colorRef = 0 # TODO: ???
         self.hori = SbitLineMetrics('hori', metrics)
@@ -25,13 +27,8 @@ class CBLCBitmapSize:
         self.bitDepth = 32 # 32 is the bitdepth for colour emoji. hard-coded for now.
         self.flags = 1 # TODO: figure out how this actually works.
 
-        glyphIDList = []
-        for id, g in enumerate(glyphs['img_empty']):
-            if g.imgDict:
-                glyphIDList.append(id)
-
-        self.startGlyphIndex = glyphIDList[0]
-        self.endGlyphIndex = glyphIDList[-1]
+        self.startGlyphIndex = strike.glyphs[0].id
+        self.endGlyphIndex = strike.glyphs[-1].id
 
 
 
@@ -65,14 +62,14 @@ class CBLCBitmapSize:
 
         strike.append(bSizeTable)
 
-        for s in self.indexSubTables:
+        for s in self.ttxIndexSubTables:
             strike.append(s.toTTX())
 
         return strike
 
 
 
-    def toBytes(self):
+    def toBytes(self, indexSubTableArrayOffset, indexTablesSize):
         """
         Returns a bytes version of this table element.
 
@@ -82,15 +79,50 @@ class CBLCBitmapSize:
         - Array of all BitmapSizes (containing offsets to attached IndexSubTable(s))
         - Array of all IndexSubTables
 
-        TODO: figure out how to do this.
+        (the offset and size of this strike's IndexSubTables come from CBLC.)
+        """
+        return ( struct.pack( ">IIII"
+                            , indexSubTableArrayOffset # Offset32
+                            , indexTablesSize # UInt32
+                            , len(self.indexSubTables) # numberOfIndexSubTables, UInt32
+                            , self.colorRef # UInt32
+                            )
+               + self.hori.toBytes() # SbitLineMetrics
+               + self.vert.toBytes() # SbitLineMetrics
+               + struct.pack( ">HHBBBb"
+                            , self.startGlyphIndex # UInt16
+                            , self.endGlyphIndex # UInt16
+                            , self.ppemX # UInt8
+                            , self.ppemY # UInt8
+                            , self.bitDepth # UInt8
+                            , self.flags # Int8
+                            )
+               )
+
+
+    def indexSubTablesToBytes(self):
         """
+        Returns this strike's IndexSubTableArray, followed by the IndexSubTables.
+        """
+        indexSubTables = generateOffsets(self.indexSubTables, 32, 8 * len(self.indexSubTables))
+
+        indexSubTableArray = b''
+
+        for s, offset in zip(self.indexSubTables, indexSubTables["offsetInts"]):
+            indexSubTableArray += struct.pack( ">HHI"
+                                             , s.firstGlyphIndex # UInt16
+                                             , s.lastGlyphIndex # UInt16
+                                             , offset # additionalOffsetToIndexSubtable, Offset32
+                                             )
+
+        return indexSubTableArray + indexSubTables["bytes"]
 
 
 
 
 class CBLC:
 
-    def __init__(self, m, glyphs):
+    def __init__(self, m, glyphs, cbdt):
 
         self.majorVersion = 3
         self.minorVersion = 0
@@ -99,11 +131,9 @@ class CBLC:
         self.bitmapSizeTables = []
 
         # iterate over each strike.
-
-
-        for imageFormat, image in glyphs["img"][0].imgDict.items():
-            if imageFormat.split('-')[0] == "png":
-                self.bitmapSizeTables.append(CBLCBitmapSize(m["metrics"], image.strike, glyphs))
+        # (the IndexSubTables are made by CBDT, because they depend on how it lays out its bitmaps.)
+        for strike, image in zip(cbdt.strikes, [i for f, i in glyphs["img"][0].imgDict.items() if f.split('-')[0] == "png"]):
+            self.bitmapSizeTables.append(CBLCBitmapSize(m["metrics"], image.strike, strike))
 
 
 
@@ -124,7 +154,12 @@ class CBLC:
                           , self.majorVersion # UInt16
                           , self.minorVersion  # UInt16
                           , len(self.bitmapSizeTables) # UInt32 (numSizes)
-                          # pack all of the BitmapSize tables immediately after.
                           )
 
-        return outputTableBytes(cblc)
+        indexTables = [b.indexSubTablesToBytes() for b in self.bitmapSizeTables]
+        offsets = generateOffsets(indexTables, 32, 8 + 48 * len(self.bitmapSizeTables), usingClasses=False)
+
+        for b, offset, indexTable in zip(self.bitmapSizeTables, offsets["offsetInts"], indexTables):
+            cblc += b.toBytes(offset, len(indexTable))
+
+        return outputTableBytes(cblc + offsets["bytes"])
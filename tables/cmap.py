@@ -1,7 +1,7 @@
 import struct
 from lxml.etree import Element
-from tables.common.cmapSubtables import cmapFormat0, cmapFormat4, cmapFormat12, cmapFormat14
-from transform.bytes import generateOffsets, outputTableBytes
+from tables.common.cmapSubtables import makeMappings, cmapFormat0, cmapFormat4, cmapFormat12, cmapFormat14
+from transform.bytes import outputTableBytes
 
 
 class cmap:
@@ -13,6 +13,9 @@ class cmap:
 
         self.version = 0 # hardcoded. no other version.
 
+        # glyph IDs come from the order of glyphs that actually exist in the font.
+        glyphIDs = {g.codepoints: id for id, g in enumerate(glyphs['img_empty'])}
+
         # check what's what in this set to determine what subtables to toTTX.
         # ---------------------------------------------------------
         oneByte = []
@@ -36,28 +39,31 @@ class cmap:
         self.subtables = []
 
         if oneByte:
-            self.subtables.append(cmapFormat0(oneByte, platformID=1, platEncID=0, language=0))
+            self.subtables.append(cmapFormat0(oneByte, glyphIDs, platformID=1, platEncID=0, language=0))
 
         if twoByte:
              # platform ID 0 (Unicode)
-            self.subtables.append(cmapFormat4(twoByte, platformID=0, platEncID=3, language=0))
+            self.subtables.append(cmapFormat4(twoByte, glyphIDs, platformID=0, platEncID=3, language=0))
 
             # platform ID 3 (Microsoft)
             # platEncID should be 1. This is what is required to make
             # this particular cmap subtable format work.
-            self.subtables.append(cmapFormat4(twoByte, platformID=3, platEncID=1, language=0))
+            self.subtables.append(cmapFormat4(twoByte, glyphIDs, platformID=3, platEncID=1, language=0))
 
         if fourByte:
             # platform ID 0 (Unicode)
-            self.subtables.append(cmapFormat12(fourByte, platformID=0, platEncID=10, language=0))
+            self.subtables.append(cmapFormat12(fourByte, glyphIDs, platformID=0, platEncID=10, language=0))
 
             # platform ID 3 (Microsoft)
             # platEncID should be 10. This is what is required to make
             # this particular cmap subtable format work.
-            self.subtables.append(cmapFormat12(fourByte, platformID=3, platEncID=10, language=0))
+            self.subtables.append(cmapFormat12(fourByte, glyphIDs, platformID=3, platEncID=10, language=0))
 
         if vs:
-            self.subtables.append(cmapFormat14(vs)) # IDs are specific to this cmap Subtable.
+            # (sequences that map to the same glyph as their base codepoint
+            # go in format 14's Default UVS table.)
+            defaultMappings = dict(makeMappings(fourByte, glyphIDs))
+            self.subtables.append(cmapFormat14(vs, glyphIDs, defaultMappings)) # IDs are specific to this cmap Subtable.
 
 
 
@@ -76,26 +82,37 @@ class cmap:
 
     def toBytes(self):
 
-        # initialise some stuff
-        subtableOffsets = generateOffsets(self.subtables, 32, 4 + (8 * len(self.subtables))) ## placheholder. last one should be (8 * len(self.subtables)
-        encodingRecords = b''
+        # encoding records have to be sorted by platform ID, then encoding ID.
+        subtables = sorted(self.subtables, key=lambda sub: (sub.platformID, sub.platEncID))
 
 
         # prepare the chunks
         header = struct.pack( ">HH"
                           , self.version # UInt16
-                          , len(self.subtables) # UInt16
+                          , len(subtables) # UInt16
                           )
 
-        for num, subtable in enumerate(self.subtables):
+        encodingRecords = b''
+        subtableData = b''
+
+
+        # subtables that come out exactly the same (like the Unicode and Microsoft
+        # versions of format 4 and 12) are only stored once, and share an offset.
+        subtableOffsets = dict() # subtable bytes -> offset
+        offset = 4 + (8 * len(subtables)) # header + encoding records
+
+        for subtable in subtables:
+            subtableBytes = subtable.toBytes()
+
+            if subtableBytes not in subtableOffsets:
+                subtableOffsets[subtableBytes] = offset + len(subtableData)
+                subtableData += subtableBytes
 
-            if subtable.format not in [4, 14]: # TEMP: skipping malformed cmaps for now.
-                encodingEntry = struct.pack( ">HHI"
-                           , subtable.platformID # UInt16
-                           , subtable.platEncID # UInt16
-                           , subtableOffsets["offsetInts"][num] # Offset32 (UInt32)
-                           )
-                encodingRecords += encodingEntry
+            encodingRecords += struct.pack( ">HHI"
+                       , subtable.platformID # UInt16
+                       , subtable.platEncID # UInt16
+                       , subtableOffsets[subtableBytes] # Offset32 (UInt32)
+                       )
 
 
-        return outputTableBytes(header + encodingRecords + subtableOffsets["bytes"])
+        return outputTableBytes(header + encodingRecords + subtableData)
@@ -13,11 +13,60 @@ def makeTTXSubtable(tag, attrs, cmapGlyphSet):
             subtable.append(Element("map", {"code": hex(g.codepoints.seq[0]), "name": g.alias.name() }))
     return subtable
 
-def makeGlyphIDArray(glyphs):
+
+def makeMappings(glyphs, glyphIDs):
+    """
+    Makes a list of (codepoint, glyph ID) tuples for a set of single-codepoint
+    glyphs, sorted by codepoint.
+
+    glyphIDs is a dict of codepoint sequence -> glyph ID. (alias glyphs use
+    the glyph ID of their destination.)
+    """
+    mappings = dict()
+
+    for g in glyphs:
+        if g.alias:
+            mappings[g.codepoints.seq[0]] = glyphIDs[g.alias]
+        else:
+            mappings[g.codepoints.seq[0]] = glyphIDs[g.codepoints]
+
+    return sorted(mappings.items())
+
+
+def makeRuns(mappings):
     """
-    makes a glyph
+    Splits a sorted list of (codepoint, glyph ID) tuples into runs where both
+    the codepoints and the glyph IDs go up by one each time.
+
+    This is done in a single pass. Returns a list of (startCode, endCode, startGlyphID).
     """
-    pass
+    runs = []
+
+    for code, glyphID in mappings:
+        if runs:
+            startCode, endCode, startGlyphID = runs[-1]
+
+            if code == endCode + 1 and glyphID == startGlyphID + (code - startCode):
+                runs[-1] = (startCode, code, startGlyphID)
+                continue
+
+        runs.append((code, code, glyphID))
+
+    return runs
+
+
+def binarySearchParams(count, size):
+    """
+    Returns the searchRange, entrySelector and rangeShift for a binary-searchable
+    array of 'count' items that are each 'size' bytes long.
+    """
+    entrySelector = floor(log2(count)) if count else 0
+    searchRange = (2 ** entrySelector) * size
+    rangeShift = count * size - searchRange
+
+    return searchRange, entrySelector, rangeShift
+
+
 
 class cmapFormat0:
     """
@@ -27,7 +76,7 @@ class cmapFormat0:
     - https://docs.microsoft.com/en-us/typography/opentype/spec/cmap#format-0-byte-encoding-table
     """
 
-    def __init__(self, glyphs, platformID, platEncID, language):
+    def __init__(self, glyphs, glyphIDs, platformID, platEncID, language):
 
         # check if the glyphs are one-byte, reject them if they are not.
         for g in glyphs:
@@ -39,6 +88,7 @@ class cmapFormat0:
         self.platEncID = platEncID
         self.language = language
         self.glyphs = glyphs
+        self.mappings = makeMappings(glyphs, glyphIDs)
 
     def toTTX(self):
         return makeTTXSubtable(  "cmap_format_0",
@@ -59,13 +109,16 @@ class cmapFormat0:
                           , self.language # UInt16
                           )
 
-        # initialise list with a fixed size
-        glyphIdArray = [0x00] * 256 # MAYBE: I presume that no value is 0x00.
+        # every codepoint from 0 to 255, indexed by codepoint. (0 = .notdef/no glyph.)
+        glyphIdArray = [0] * 256
+
+        for code, glyphID in self.mappings:
 
-        for id, glyph in enumerate(self.glyphs):
-            glyphIdArray[id] = glyph.codepoints.seq[0]
+            # glyph IDs that don't fit in a byte can't be represented in this format.
+            if glyphID <= 0xff:
+                glyphIdArray[code] = glyphID
 
-        return beginning + array.array('B', glyphIdArray)
+        return beginning + array.array('B', glyphIdArray).tobytes()
 
 
 
@@ -77,7 +130,11 @@ class cmapFormat4:
     - https://docs.microsoft.com/en-us/typography/opentype/spec/cmap#format-4-segment-mapping-to-delta-values
     """
 
-    def __init__(self, glyphs, platformID, platEncID, language):
+    # runs of glyphs shorter than this are cheaper to put in the glyphIdArray
+    # (2 bytes per codepoint) than to give their own segment (8 bytes each).
+    minDeltaRun = 4
+
+    def __init__(self, glyphs, glyphIDs, platformID, platEncID, language):
 
         # check if the glyphs are two-byte, reject them if they are not.
         for g in glyphs:
@@ -89,6 +146,7 @@ class cmapFormat4:
         self.platformID = platformID
         self.platEncID = platEncID
         self.language = language
+        self.mappings = makeMappings(glyphs, glyphIDs)
 
 
     def toTTX(self):
@@ -100,86 +158,102 @@ class cmapFormat4:
                                 , self.glyphs
                                 )
 
-    def toBytes(self):
 
-        reservedPad = 0 # hardcoded
+    def makeSegments(self):
+        """
+        Works out the segments for this subtable, in one pass over its glyphs.
 
-        endCode = []
-        startCode = []
-        idDelta = []
-        idRangeOffset = []
-        segCount = 0
+        Returns a list of (startCode, endCode, idDelta, glyphIDs), where glyphIDs
+        is None for segments that just use idDelta, or a list of glyph IDs for
+        segments that go through the glyphIdArray.
+        """
+        segments = []
+        shortRuns = [] # consecutive short runs, waiting to be put into one glyphIdArray segment.
 
-        # generate segments
-        for id, glyph in enumerate(self.glyphs):
-            thisGlyphCodepoint = glyph.codepoints.seq[0]
-            lastGlyphCodepoint = self.glyphs[id-1].codepoints.seq[0]
+        for run in makeRuns(self.mappings) + [None]:
 
-            if id == 0:
-                segCount +=1
-                startCode.append(thisGlyphCodepoint)
-            else:
-                # check if it's continuous with the last glyph.
-                if thisGlyphCodepoint != (lastGlyphCodepoint + 1):
-                    endCode.append(lastGlyphCodepoint)
-                    startCode = thisGlyphCodepoint
-                    segCount += 1
+            # anything that doesn't carry straight on from the short runs ends them.
+            if shortRuns and (run is None or run[0] != shortRuns[-1][1] + 1 or run[1] - run[0] + 1 >= self.minDeltaRun):
+                if len(shortRuns) == 1:
+                    startCode, endCode, startGlyphID = shortRuns[0]
+                    segments.append((startCode, endCode, startGlyphID - startCode, None))
                 else:
-                    pass
+                    glyphIDs = []
+                    for startCode, endCode, startGlyphID in shortRuns:
+                        glyphIDs.extend(range(startGlyphID, startGlyphID + endCode - startCode + 1))
 
-        # TODO: learn how to calculate idDelta and idRangeOffset
-        # TODO: add terminating entries to these arrays.
+                    segments.append((shortRuns[0][0], shortRuns[-1][1], 0, glyphIDs))
 
-        # METADATA
-        # Generate a bunch of metadata. these calculations are what they are (and they're tested to be correct).
-        segCountX2 = segCount * 2
-        searchRange = 2 * (2 ** floor(log2(39)))
-        entrySelector = floor(log2(searchRange / 2))
-        rangeShift = 2 * segCount - searchRange
-        rangeShift = max(rangeShift, 0)
+                shortRuns = []
 
+            if run is None:
+                break
 
+            startCode, endCode, startGlyphID = run
 
-        # RANGES AND OTHER STUFF
-        reservedPad = 0 # hard-coded
+            if endCode - startCode + 1 >= self.minDeltaRun:
+                segments.append((startCode, endCode, startGlyphID - startCode, None))
+            else:
+                shortRuns.append(run)
+
+        # every format 4 subtable has to end with a segment for 0xFFFF.
+        if not segments or segments[-1][1] != 0xffff:
+            segments.append((0xffff, 0xffff, 1, None))
+
+        return segments
+
+
+    def toBytes(self):
+
+        segments = self.makeSegments()
+        segCount = len(segments)
 
         startCode = []
         endCode = []
         idDelta = []
+        idRangeOffset = []
+        glyphIdArray = []
 
-        currentDelta = 0 # just for the upcoming loop
+        for num, (start, end, delta, glyphIDs) in enumerate(segments):
+            startCode.append(start)
+            endCode.append(end)
+            idDelta.append(delta % 0x10000) # (idDelta is modulo 65536.)
 
-        for g in range(0, len(self.glyphs)):
-            if g == 0:
-                startCode.append(self.glyphs[g].codepoints.seq[0])
+            if glyphIDs is None:
+                idRangeOffset.append(0)
             else:
-                if self.glyphs[g].codepoints.seq[0] == self.glyphs[g-1].codepoints.seq[0] + 1:
-                    currentDelta += 1
-                else:
-                    endCode.append(self.glyphs[g-1].codepoints.seq[0])
-                    idDelta.append(-currentDelta) # deltas in this should be negative
-                    currentDelta = 0
+                # the offset (in bytes) from this idRangeOffset entry to this segment's first glyphIdArray entry.
+                idRangeOffset.append(2 * (segCount - num) + 2 * len(glyphIdArray))
+                glyphIdArray.extend(glyphIDs)
+
+
+        # METADATA
+        searchRange, entrySelector, rangeShift = binarySearchParams(segCount, 2)
+        length = 16 + 8 * segCount + 2 * len(glyphIdArray)
 
+        if length > 0xffff:
+            raise ValueError(f"cmap subtable format 4 is too big ({length} bytes). It can't be more than 65535 bytes long.")
 
-        beginning = struct.pack( ">HHHHHH"
+        beginning = struct.pack( ">HHHHHHH"
                           , self.format # UInt16
-                          # length # UInt16
+                          , length # UInt16
                           , self.language # UInt16
-                          , segCountX2 # UInt16
+                          , segCount * 2 # segCountX2, UInt16
                           , searchRange # UInt16
                           , entrySelector # UInt16
                           , rangeShift # UInt16
                           )
 
+        reservedPad = 0 # hard-coded
 
-        # beginning + startCode + endCode + reservedPad + idDelta
-
-
-        # TODO: create bytes representations of these and compile.
-              # idRangeOffset[segCount] # UInt16. Offsets into glyphIdArray or 0.
-              # glyphIdArray[] # Array of UInt16s.
-
-        return b'' # placeholder
+        return ( beginning
+               + struct.pack(f">{segCount}H", *endCode) # UInt16
+               + struct.pack(">H", reservedPad) # UInt16
+               + struct.pack(f">{segCount}H", *startCode) # UInt16
+               + struct.pack(f">{segCount}H", *idDelta) # Int16 (stored modulo 65536)
+               + struct.pack(f">{segCount}H", *idRangeOffset) # UInt16
+               + struct.pack(f">{len(glyphIdArray)}H", *glyphIdArray) # UInt16
+               )
 
 
 
@@ -210,7 +284,7 @@ class cmapFormat12:
     - https://docs.microsoft.com/en-us/typography/opentype/spec/cmap#format-12-segmented-coverage
     """
 
-    def __init__(self, glyphs, platformID, platEncID, language):
+    def __init__(self, glyphs, glyphIDs, platformID, platEncID, language):
 
         # check if the glyphs are four-byte, reject them if they are not.
         for g in glyphs:
@@ -222,6 +296,7 @@ class cmapFormat12:
         self.platformID = platformID
         self.platEncID = platEncID
         self.language = language
+        self.mappings = makeMappings(glyphs, glyphIDs)
 
 
     def toTTX(self):
@@ -238,22 +313,7 @@ class cmapFormat12:
                                 )
     def toBytes(self):
 
-        startCode = 0
-        endCode = 0
-        startGlyphID = 0
-        sequentialMapGroup = []
-
-        for g in range(len(self.glyphs)):
-            if g == 0:
-                startCode = self.glyphs[g].codepoints.seq[0]
-                startCodeID = g
-            else:
-                if self.glyphs[g].codepoints.seq[0] != self.glyphs[g-1].codepoints.seq[0] + 1:
-                    endCode = self.glyphs[g-1].codepoints.seq[0]
-                    sequentialMapGroup.append(SequentialMapGroupRecord(startCode, endCode, startGlyphID))
-
-                    startCode = self.glyphs[g].codepoints.seq[0]
-                    startGlyphID = g
+        sequentialMapGroup = [SequentialMapGroupRecord(*run) for run in makeRuns(self.mappings)]
 
         subtableLength = 16 + 12*len(sequentialMapGroup)
         numGroups = len(sequentialMapGroup)
@@ -267,12 +327,7 @@ class cmapFormat12:
                                 , numGroups # UInt32
                                 )
 
-        smgBytes = b'\0'
-
-        for smg in sequentialMapGroup:
-            smgBytes += smg.toBytes()
-
-        return beginning + smgBytes
+        return beginning + b''.join(smg.toBytes() for smg in sequentialMapGroup)
 
 
 
@@ -286,7 +341,7 @@ class cmapFormat14:
     - https://docs.microsoft.com/en-us/typography/opentype/spec/cmap#format-14-unicode-variation-sequences
     """
 
-    def __init__(self, glyphs):
+    def __init__(self, glyphs, glyphIDs, defaultMappings):
 
         self.format = 14 # hard-coded
         self.glyphs = glyphs
@@ -296,6 +351,20 @@ class cmapFormat14:
         # platEncID 5 = cmap subtable 14 in platID 0. It just means that.
         # no other platID or platEncID should be used for this subtable.
 
+        self.varSelector = 0xfe0f # hard-coded
+
+        # sequences that use the same glyph as their base codepoint does in the
+        # rest of the cmap go in the Default UVS table, the rest go in the
+        # Non-Default UVS table with their own glyph ID.
+        self.defaultUVS = []
+        self.nonDefaultUVS = []
+
+        for code, glyphID in makeMappings(glyphs, glyphIDs):
+            if defaultMappings.get(code) == glyphID:
+                self.defaultUVS.append(code)
+            else:
+                self.nonDefaultUVS.append((code, glyphID))
+
 
     def toTTX(self):
         cmap14 = Element("cmap_format_14",    { "platformID": str(self.platformID)
@@ -313,5 +382,61 @@ class cmapFormat14:
 
         return cmap14
 
+
     def toBytes(self):
-        return b'\0' # placeholder
+
+        # Default UVS table: ranges of consecutive codepoints.
+        # -----------------------------------------------------
+        ranges = []
+
+        for code in self.defaultUVS:
+            if ranges and code == ranges[-1][0] + ranges[-1][1] + 1 and ranges[-1][1] < 0xff:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + 1)
+            else:
+                ranges.append((code, 0))
+
+        defaultUVSTable = b''
+
+        if ranges:
+            defaultUVSTable = struct.pack(">I", len(ranges)) # numUnicodeValueRanges, UInt32
+
+            for startUnicodeValue, additionalCount in ranges:
+                defaultUVSTable += struct.pack(">I", startUnicodeValue)[1:] # uint24
+                defaultUVSTable += struct.pack(">B", additionalCount) # UInt8
+
+
+        # Non-Default UVS table: codepoints mapped to specific glyphs.
+        # -----------------------------------------------------
+        nonDefaultUVSTable = b''
+
+        if self.nonDefaultUVS:
+            nonDefaultUVSTable = struct.pack(">I", len(self.nonDefaultUVS)) # numUVSMappings, UInt32
+
+            for unicodeValue, glyphID in self.nonDefaultUVS:
+                nonDefaultUVSTable += struct.pack(">I", unicodeValue)[1:] # uint24
+                nonDefaultUVSTable += struct.pack(">H", glyphID) # UInt16
+
+
+        # header and the (single) VariationSelector record.
+        # -----------------------------------------------------
+        headerLength = 10 + 11 # header + 1 VariationSelector record
+
+        defaultUVSOffset = headerLength if defaultUVSTable else 0
+        nonDefaultUVSOffset = headerLength + len(defaultUVSTable) if nonDefaultUVSTable else 0
+
+        length = headerLength + len(defaultUVSTable) + len(nonDefaultUVSTable)
+
+        header = struct.pack(">HII"
+                            , self.format # UInt16
+                            , length # UInt32
+                            , 1 # numVarSelectorRecords, UInt32
+                            )
+
+        varSelectorRecord = ( struct.pack(">I", self.varSelector)[1:] # uint24
+                            + struct.pack(">II"
+                                         , defaultUVSOffset # Offset32
+                                         , nonDefaultUVSOffset # Offset32
+                                         )
+                            )
+
+        return header + varSelectorRecord + defaultUVSTable + nonDefaultUVSTable
@@ -1,5 +1,8 @@
+import struct
+
 from lxml.etree import Element
 from tables.common.ebxMetrics import SmallGlyphMetrics, BigGlyphMetrics
+from transform.bytes import FileChunk
 
 
 
@@ -7,12 +10,18 @@ class EBDTBitmapFormat17:
     """
     Class representing a CBDT format 17 bitmap subtable.
 
-    (this is the only CBDT subtable format supported by TTX)
+    (small metrics + PNG data.)
     """
-    def __init__(self, metrics, strikeRes, glyph):
+    imageFormat = 17
+
+    def __init__(self, metrics, strikeRes, glyph, id=None):
+        self.id = id
         self.name = glyph.name()
         self.metrics = SmallGlyphMetrics(metrics)
         self.img = glyph.imgDict["png-" + strikeRes]
+        self.png = FileChunk(self.img.path)
+
+        self.length = 5 + 4 + len(self.png) # metrics, dataLen, data
 
 
     def toTTX(self):
@@ -27,6 +36,13 @@ class EBDTBitmapFormat17:
         return bitmapTable
 
 
+    def toChunks(self):
+        """
+        Returns the bitmap as a list of chunks. (the PNG itself isn't loaded - see FileChunk.)
+        """
+        return [self.metrics.toBytes() + struct.pack(">I", len(self.png)), self.png] # SmallGlyphMetrics, dataLen (UInt32), data
+
+
 
 
 class EBDTBitmapFormat18:
@@ -47,9 +63,24 @@ class EBDTBitmapFormat19:
     """
     Class representing a CBDT format 19 bitmap subtable.
 
-    (This is not supported by TTX)
+    (PNG data only - the metrics are in CBLC, so every bitmap indexed by the same
+    IndexSubTable has the same metrics. This is only used with IndexSubTable
+    format 5, where every bitmap has to take up the same number of bytes, so
+    it's padded to imageSize.)
     """
+    imageFormat = 19
 
-    def __init__(self, metrics, strikeRes, img):
+    def __init__(self, strikeRes, glyph, id, imageSize):
+        self.id = id
         self.name = glyph.name()
-        self.img = img
+        self.img = glyph.imgDict["png-" + strikeRes]
+        self.png = FileChunk(self.img.path)
+
+        if 4 + len(self.png) > imageSize:
+            raise ValueError(f"The PNG for {self.name} is too big for a format 19 bitmap of {imageSize} bytes.")
+
+        self.length = imageSize
+
+
+    def toChunks(self):
+        return [struct.pack(">I", len(self.png)), self.png, bytes(self.length - 4 - len(self.png))] # dataLen (UInt32), data, padding
@@ -1,28 +1,206 @@
+import struct
 from lxml.etree import Element
 
 # For storing EBLC/CBLC/bloc IndexSubTable classes.
 # (bloc only supports table formats 1-3.)
+#
+# Each IndexSubTable indexes a list of bitmap classes (see ebxBitmaps) that
+# sit one after the other in the bitmap data table. They all need:
+# - .id (glyph ID)
+# - .name
+# - .length (bytes in the bitmap data table)
+#
+# imageDataOffset is the position of the first bitmap in the bitmap data table.
+# It's set when the bitmap data table is laid out.
+
+
+
+def indexSubHeader(indexFormat, imageFormat, imageDataOffset):
+    return struct.pack( ">HHI"
+                      , indexFormat # UInt16
+                      , imageFormat # UInt16
+                      , imageDataOffset # Offset32
+                      )
+
+
+def padTo4(data):
+    return data + bytes(-len(data) % 4)
+
+
+def rangeOffsets(bitmaps):
+    """
+    Returns an offset for every glyph ID from the first bitmap's to the last
+    one's (plus one for the end). Glyphs that don't have a bitmap take up no space.
+    """
+    offsets = []
+    position = 0
+    bitmapIndex = 0
+
+    for glyphID in range(bitmaps[0].id, bitmaps[-1].id + 1):
+        offsets.append(position)
+
+        if bitmaps[bitmapIndex].id == glyphID:
+            position += bitmaps[bitmapIndex].length
+            bitmapIndex += 1
+
+    offsets.append(position)
+
+    return offsets
+
+
 
 
 class IndexSubTable1:
     """
     Class representing an EBLC/CBLC/bloc IndexSubTable, format 1.
+
+    (variable-metrics bitmaps, an Offset32 for every glyph ID in the range.)
     """
-    def __init__(self, glyphs):
-        self.glyphs = []
+    indexFormat = 1
 
-        for id, g in enumerate(glyphs["img_empty"]):
-            if g.imgDict:
-                self.glyphs.append({"id": id, "name": g.name() })
+    def __init__(self, bitmaps, imageFormat=17):
+        self.bitmaps = bitmaps
+        self.imageFormat = imageFormat
+        self.imageDataOffset = 0
+
+        self.firstGlyphIndex = bitmaps[0].id
+        self.lastGlyphIndex = bitmaps[-1].id
 
 
     def toTTX(self):
-        eblcSub = Element("eblc_index_sub_table_1", { "imageFormat": "17" #TODO: Do something about image format nums.
-                                                    , "firstGlyphIndex": str(self.glyphs[0]["id"])
-                                                    , "lastGlyphIndex": str(self.glyphs[-1]["id"])
+        eblcSub = Element("eblc_index_sub_table_1", { "imageFormat": str(self.imageFormat)
+                                                    , "firstGlyphIndex": str(self.firstGlyphIndex)
+                                                    , "lastGlyphIndex": str(self.lastGlyphIndex)
                                                     })
 
-        for g in self.glyphs:
-            eblcSub.append(Element("glyphLoc", {"id": str(g["id"]), "name": g["name"] }))
+        for b in self.bitmaps:
+            eblcSub.append(Element("glyphLoc", {"id": str(b.id), "name": b.name }))
 
         return eblcSub
+
+
+    @staticmethod
+    def length(firstGlyphIndex, lastGlyphIndex, numGlyphs):
+        return 8 + 4 * (lastGlyphIndex - firstGlyphIndex + 2)
+
+
+    def toBytes(self):
+        offsets = rangeOffsets(self.bitmaps)
+
+        return indexSubHeader(self.indexFormat, self.imageFormat, self.imageDataOffset) + struct.pack(f">{len(offsets)}I", *offsets) # sbitOffsets (Offset32s)
+
+
+
+
+class IndexSubTable3:
+    """
+    Class representing an EBLC/CBLC/bloc IndexSubTable, format 3.
+
+    (the same as format 1, but with Offset16s, so it can only index 64KB of bitmaps.)
+    """
+    indexFormat = 3
+    maxDataLength = 0xffff
+
+    def __init__(self, bitmaps, imageFormat=17):
+        self.bitmaps = bitmaps
+        self.imageFormat = imageFormat
+        self.imageDataOffset = 0
+
+        self.firstGlyphIndex = bitmaps[0].id
+        self.lastGlyphIndex = bitmaps[-1].id
+
+
+    @staticmethod
+    def length(firstGlyphIndex, lastGlyphIndex, numGlyphs):
+        return 8 + 2 * (lastGlyphIndex - firstGlyphIndex + 2) + (2 if (lastGlyphIndex - firstGlyphIndex) % 2 else 0)
+
+
+    def toBytes(self):
+        offsets = rangeOffsets(self.bitmaps)
+
+        if offsets[-1] > self.maxDataLength:
+            raise ValueError(f"The bitmaps for glyphs {self.firstGlyphIndex}-{self.lastGlyphIndex} are too big for IndexSubTable format 3.")
+
+        return padTo4(indexSubHeader(self.indexFormat, self.imageFormat, self.imageDataOffset) + struct.pack(f">{len(offsets)}H", *offsets)) # sbitOffsets (Offset16s)
+
+
+
+
+class IndexSubTable4:
+    """
+    Class representing an EBLC/CBLC IndexSubTable, format 4.
+
+    (variable-metrics bitmaps, only for the glyph IDs that have one, with Offset16s.)
+    """
+    indexFormat = 4
+    maxDataLength = 0xffff
+
+    def __init__(self, bitmaps, imageFormat=17):
+        self.bitmaps = bitmaps
+        self.imageFormat = imageFormat
+        self.imageDataOffset = 0
+
+        self.firstGlyphIndex = bitmaps[0].id
+        self.lastGlyphIndex = bitmaps[-1].id
+
+
+    @staticmethod
+    def length(firstGlyphIndex, lastGlyphIndex, numGlyphs):
+        return 8 + 4 + 4 * (numGlyphs + 1)
+
+
+    def toBytes(self):
+        glyphArray = []
+        position = 0
+
+        for b in self.bitmaps:
+            glyphArray += [b.id, position]
+            position += b.length
+
+        if position > self.maxDataLength:
+            raise ValueError(f"The bitmaps for glyphs {self.firstGlyphIndex}-{self.lastGlyphIndex} are too big for IndexSubTable format 4.")
+
+        glyphArray += [0, position] # (the extra entry is just there for the end offset.)
+
+        return ( indexSubHeader(self.indexFormat, self.imageFormat, self.imageDataOffset)
+               + struct.pack(">I", len(self.bitmaps)) # numGlyphs, UInt32
+               + struct.pack(f">{len(glyphArray)}H", *glyphArray) # glyphArray (GlyphIdOffsetPairs - UInt16 glyphID, Offset16 sbitOffset)
+               )
+
+
+
+
+class IndexSubTable5:
+    """
+    Class representing an EBLC/CBLC IndexSubTable, format 5.
+
+    (constant-metrics bitmaps that are all the same size, only for the glyph IDs that have one.)
+    """
+    indexFormat = 5
+
+    def __init__(self, bitmaps, imageFormat, metrics):
+        self.bitmaps = bitmaps
+        self.imageFormat = imageFormat
+        self.imageDataOffset = 0
+        self.metrics = metrics # BigGlyphMetrics
+
+        self.firstGlyphIndex = bitmaps[0].id
+        self.lastGlyphIndex = bitmaps[-1].id
+
+        self.imageSize = bitmaps[0].length
+
+        if any(b.length != self.imageSize for b in bitmaps):
+            raise ValueError(f"Every bitmap in IndexSubTable format 5 has to be the same size.")
+
+
+    @staticmethod
+    def length(firstGlyphIndex, lastGlyphIndex, numGlyphs):
+        return 8 + 4 + 8 + 4 + 2 * numGlyphs + (2 if numGlyphs % 2 else 0)
+
+
+    def toBytes(self):
+        return padTo4( indexSubHeader(self.indexFormat, self.imageFormat, self.imageDataOffset)
+                     + struct.pack(">I", self.imageSize) # UInt32
+                     + self.metrics.toBytes() # BigGlyphMetrics
+                     + struct.pack(f">I{len(self.bitmaps)}H", len(self.bitmaps), *[b.id for b in self.bitmaps]) # numGlyphs (UInt32), glyphIdArray (UInt16s)
+                     )
@@ -1,5 +1,7 @@
+import struct
 from lxml.etree import Element
 from data import Tag
+from transform.bytes import generateOffsets
 
 
 # OTLFeature
@@ -23,6 +25,13 @@ class Feature:
 
         return feature
 
+    def toBytes(self):
+        return struct.pack( ">HHH"
+                          , 0 # featureParamsOffset, Offset16
+                          , 1 # lookupIndexCount, UInt16
+                          , 0 # lookupListIndices[0], UInt16
+                          )
+
 
 class FeatureRecord:
     """
@@ -40,6 +49,9 @@ class FeatureRecord:
 
         return featureRecord
 
+    def toBytes(self, offset):
+        return self.tag.toBytes() + struct.pack(">H", offset) # Tag, Offset16 to the feature table from the beginning of featureList
+
 
 class FeatureList:
     """
@@ -55,3 +67,13 @@ class FeatureList:
             featureList.append(fr.toTTX(index))
 
         return featureList
+
+    def toBytes(self):
+        features = generateOffsets([fr.feature for fr in self.featureRecords], 16, 2 + 6 * len(self.featureRecords))
+
+        featureList = struct.pack(">H", len(self.featureRecords)) # featureCount, UInt16
+
+        for fr, offset in zip(self.featureRecords, features["offsetInts"]):
+            featureList += fr.toBytes(offset)
+
+        return featureList + features["bytes"]
@@ -1,5 +1,7 @@
+import struct
 from lxml.etree import Element
 from data import Tag
+from tables.common.cmapSubtables import makeMappings
 
 
 # OTLFeature
@@ -20,6 +22,50 @@ def glyphName(int): # TODO: replace this with a more complex name system for gly
     return f"u{int:x}"
 
 
+class Coverage:
+    """
+    Class representing a Coverage table.
+    (https://docs.microsoft.com/en-us/typography/opentype/spec/chapter2#coverage-table)
+
+    Only used during bytes compilation.
+    """
+    def __init__(self, glyphIDs):
+        self.glyphIDs = sorted(glyphIDs)
+
+        # ranges of consecutive glyph IDs, for format 2.
+        self.ranges = [] # [startGlyphID, endGlyphID, startCoverageIndex]
+
+        for index, glyphID in enumerate(self.glyphIDs):
+            if self.ranges and glyphID == self.ranges[-1][1] + 1:
+                self.ranges[-1][1] = glyphID
+            else:
+                self.ranges.append([glyphID, glyphID, index])
+
+
+    def toBytes(self):
+        # use whichever format is smaller.
+        # (format 1 is 2 bytes per glyph, format 2 is 6 bytes per range.)
+        if 6 * len(self.ranges) < 2 * len(self.glyphIDs):
+            coverage = struct.pack(">HH", 2, len(self.ranges)) # coverageFormat, rangeCount (UInt16s)
+
+            for startGlyphID, endGlyphID, startCoverageIndex in self.ranges:
+                coverage += struct.pack(">HHH", startGlyphID, endGlyphID, startCoverageIndex) # UInt16s
+
+            return coverage
+
+        else:
+            return struct.pack(f">HH{len(self.glyphIDs)}H", 1, len(self.glyphIDs), *self.glyphIDs) # coverageFormat, glyphCount, glyphArray (UInt16s)
+
+
+    @staticmethod
+    def maxLength(glyphCount):
+        """
+        The most bytes a Coverage table with this many glyphs could take up.
+        """
+        return 4 + 2 * glyphCount
+
+
+
 class LookupType4:
     """
     Table somewhat representing a LookupType 4.
@@ -52,6 +98,36 @@ class LookupType4:
         self.ligatureSubst = ligatureSubst
 
 
+        # the same thing again, but as glyph IDs (for bytes compilation).
+        # ---------------------------------------------------------------
+
+        # glyph IDs of every glyph that exists in the font,
+        # and the glyph ID each codepoint maps to in the cmap.
+        glyphIDs = {g.codepoints: id for id, g in enumerate(glyphs['img_empty'])}
+        codepointIDs = dict(makeMappings([g for g in glyphs['all'] if len(g.codepoints) == 1], glyphIDs))
+
+        ligatureSets = {} # first glyph ID -> list of (ligature glyph ID, component glyph IDs)
+
+        for g in glyphs['all']:
+            if len(g.codepoints) > 1:
+                if g.alias:
+                    ligatureGlyph = glyphIDs[g.alias]
+                else:
+                    ligatureGlyph = glyphIDs[g.codepoints]
+
+                firstGlyph = codepointIDs[g.codepoints.seq[0]]
+                components = tuple(codepointIDs[c] for c in g.codepoints.seq[1:])
+
+                if firstGlyph not in ligatureSets:
+                    ligatureSets[firstGlyph] = []
+
+                ligatureSets[firstGlyph].append((ligatureGlyph, components))
+
+        # (longest ligatures first, for the same reason as in toTTX.)
+        self.ligatureSets = [(firstGlyph, sorted(ligatureSets[firstGlyph], key=lambda l: len(l[1]), reverse=True))
+                             for firstGlyph in sorted(ligatureSets)]
+
+
     def toTTX(self, index):
         lookup = Element("Lookup", {"index": str(index) })
 
@@ -91,10 +167,190 @@ class LookupType4:
 
 
 
+    def splitSubtables(self):
+        """
+        Splits the ligature sets into groups that each fit in one LigatureSubst
+        subtable. (every offset in a subtable is an Offset16, so a subtable can't
+        be bigger than 64KB.)
+
+        This is done in a single pass, using the most space each ligature set could
+        take up, so a group is never too big once it's compiled.
+        """
+        groups = [[]]
+        size = 6 + Coverage.maxLength(0) # LigatureSubst header + an empty coverage
+
+        for firstGlyph, ligatures in self.ligatureSets:
+
+            # a ligature set offset, a coverage entry, the ligature set and all of its ligatures.
+            setSize = 2 + 2 + (2 + 2 * len(ligatures)) + sum(4 + 2 * len(components) for ligatureGlyph, components in ligatures)
+
+            if size + setSize > 0xffff and groups[-1]:
+                groups.append([])
+                size = 6 + Coverage.maxLength(0)
+
+            if size + setSize > 0xffff:
+                raise ValueError(f"There are too many ligatures that start with the same glyph (glyph ID {firstGlyph}) to fit in a GSUB subtable.")
+
+            groups[-1].append((firstGlyph, ligatures))
+            size += setSize
+
+        return groups
+
+
+    def subtableToBytes(self, ligatureSets):
+        """
+        Compiles a LigatureSubst (format 1) subtable from a list of
+        (first glyph ID, ligatures) tuples, sorted by glyph ID.
+
+        Identical LigatureSets and Ligature tables are only stored once.
+        They're laid out after the coverage table like this, so every offset
+        points forwards:
+
+        [header + LigatureSet offsets][coverage][LigatureSets][Ligatures]
+        """
+        coverage = Coverage([firstGlyph for firstGlyph, ligatures in ligatureSets]).toBytes()
+
+
+        # work out which LigatureSets and Ligatures are unique.
+        uniqueSets = dict() # tuple of ligatures -> position in uniqueSets
+        uniqueLigatures = dict() # ligature -> offset in the ligature pool
+        ligaturePool = []
+        ligaturePoolLength = 0
+
+        for firstGlyph, ligatures in ligatureSets:
+            key = tuple(ligatures)
+
+            if key not in uniqueSets:
+                uniqueSets[key] = len(uniqueSets)
+
+                for ligatureGlyph, components in ligatures:
+                    if (ligatureGlyph, components) not in uniqueLigatures:
+                        ligature = struct.pack(f">HH{len(components)}H", ligatureGlyph, len(components) + 1, *components) # ligatureGlyph, componentCount, componentGlyphIDs (UInt16s)
+
+                        uniqueLigatures[(ligatureGlyph, components)] = ligaturePoolLength
+                        ligaturePool.append(ligature)
+                        ligaturePoolLength += len(ligature)
+
+
+        # lay out the LigatureSets.
+        setsStart = 6 + 2 * len(ligatureSets) + len(coverage)
+        setOffsets = []
+        position = setsStart
+
+        for key in uniqueSets:
+            setOffsets.append(position)
+            position += 2 + 2 * len(key)
+
+        ligaturePoolStart = position
+
+        setData = []
+
+        for key, setOffset in zip(uniqueSets, setOffsets):
+            ligatureOffsets = [ligaturePoolStart + uniqueLigatures[l] - setOffset for l in key]
+            setData.append(struct.pack(f">H{len(key)}H", len(key), *ligatureOffsets)) # ligatureCount, ligatureOffsets (Offset16s)
+
+
+        header = struct.pack( f">HHH{len(ligatureSets)}H"
+                            , 1 # substFormat, UInt16
+                            , 6 + 2 * len(ligatureSets) # coverageOffset, Offset16
+                            , len(ligatureSets) # ligatureSetCount, UInt16
+                            , *[setOffsets[uniqueSets[tuple(ligatures)]] for firstGlyph, ligatures in ligatureSets] # ligatureSetOffsets, Offset16s
+                            )
+
+        subtable = header + coverage + b''.join(setData) + b''.join(ligaturePool)
+
+        if len(subtable) > 0xffff:
+            raise ValueError(f"A GSUB LigatureSubst subtable came out too big ({len(subtable)} bytes).")
+
+        return subtable
+
+
+    def toBytes(self):
+        """
+        Compiles the lookup into bytes.
+
+        If the subtables are too big to all be pointed to from the lookup with
+        Offset16s, the lookup becomes an Extension lookup (type 7) instead, which
+        points to them with Offset32s.
+        """
+        subtables = [self.subtableToBytes(group) for group in self.splitSubtables() if group]
+
+        self.subtableCount = len(subtables)
+        self.extension = False
+
+        headerLength = 6 + 2 * len(subtables)
+
+        # the start of the last subtable is the furthest an offset has to go.
+        if headerLength + sum(len(s) for s in subtables[:-1]) <= 0xffff:
+            subtableOffsets = []
+            position = headerLength
+
+            for s in subtables:
+                subtableOffsets.append(position)
+                position += len(s)
+
+            header = struct.pack( f">HHH{len(subtables)}H"
+                                , self.lookupType # UInt16
+                                , self.lookupFlag # UInt16
+                                , len(subtables) # subTableCount, UInt16
+                                , *subtableOffsets # Offset16s
+                                )
+
+            return header + b''.join(subtables)
+
+
+        # extension lookup
+        # -----------------------------------------------------------------
+        # (https://docs.microsoft.com/en-us/typography/opentype/spec/gsub#lookuptype-7-extension-substitution)
+        self.extension = True
+
+        extensionLength = 8
+        extensionsStart = headerLength
+
+        header = struct.pack( f">HHH{len(subtables)}H"
+                            , 7 # lookupType, UInt16
+                            , self.lookupFlag # UInt16
+                            , len(subtables) # subTableCount, UInt16
+                            , *[extensionsStart + extensionLength * n for n in range(len(subtables))] # Offset16s
+                            )
+
+        extensions = b''
+        position = extensionsStart + extensionLength * len(subtables)
+
+        for num, s in enumerate(subtables):
+            extensionOffset = extensionsStart + extensionLength * num
+
+            extensions += struct.pack( ">HHI"
+                                     , 1 # substFormat, UInt16
+                                     , self.lookupType # extensionLookupType, UInt16
+                                     , position - extensionOffset # extensionOffset, Offset32
+                                     )
+            position += len(s)
+
+        return header + extensions + b''.join(subtables)
+
+
+
+
 class LookupList:
     def __init__(self, glyphs):
         self.lookups = [LookupType4(glyphs)]
 
+    def toBytes(self):
+        lookups = [l.toBytes() for l in self.lookups]
+
+        lookupOffsets = []
+        position = 2 + 2 * len(lookups)
+
+        for l in lookups:
+            lookupOffsets.append(position)
+            position += len(l)
+
+        if lookupOffsets and lookupOffsets[-1] > 0xffff:
+            raise ValueError(f"The GSUB LookupList is too big for its lookups to be found with Offset16s.")
+
+        return struct.pack(f">H{len(lookups)}H", len(lookups), *lookupOffsets) + b''.join(lookups) # lookupCount, lookupOffsets (Offset16s)
+
     def toTTX(self):
         lookupList = Element("LookupList")
 
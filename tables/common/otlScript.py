@@ -1,5 +1,7 @@
+import struct
 from lxml.etree import Element
 from data import Tag
+from transform.bytes import generateOffsets
 
 
 # OTLScript
@@ -14,7 +16,7 @@ class Script:
     Class representing a placeholder Script table.
     Currently not editable atm - it's just designed to have the right data for forc's particular context.
     """
-    def __init(self):
+    def __init__(self):
         self.whatever = 0
 
     def toTTX(self):
@@ -30,6 +32,20 @@ class Script:
         return script
 
 
+    def toBytes(self):
+        langSys = struct.pack( ">HHHH"
+                             , 0 # lookupOrderOffset (reserved), Offset16
+                             , 0xffff # requiredFeatureIndex, UInt16
+                             , 1 # featureIndexCount, UInt16
+                             , 0 # featureIndices[0], UInt16
+                             )
+
+        return struct.pack( ">HH"
+                          , 4 # defaultLangSysOffset (straight after this), Offset16
+                          , 0 # langSysCount, UInt16
+                          ) + langSys
+
+
 
 class ScriptRecord:
     """
@@ -52,12 +68,8 @@ class ScriptRecord:
         return scriptRecord
 
 
-    def toBytes(self):
-        # TODO: need to input the offset from ScriptList building.
-        return struct.pack( '>4b'
-                          , self.scriptTag.toBytes() # Tag (4 bytes/UInt32)
-                          # TODO: Offset16 to script table from the beginning of scriptList
-                          )
+    def toBytes(self, offset):
+        return self.scriptTag.toBytes() + struct.pack(">H", offset) # Tag, Offset16 to the script table from the beginning of scriptList
 
 
 
@@ -79,7 +91,11 @@ class ScriptList:
 
 
     def toBytes(self):
-        return struct.pack( '>H'
-                          , len(self.scriptRecords) # UInt16
-                          # TODO: insert the scriptRecords themselves.
-                          )
+        scripts = generateOffsets([sr.script for sr in self.scriptRecords], 16, 2 + 6 * len(self.scriptRecords))
+
+        scriptList = struct.pack(">H", len(self.scriptRecords)) # scriptCount, UInt16
+
+        for sr, offset in zip(self.scriptRecords, scripts["offsetInts"]):
+            scriptList += sr.toBytes(offset)
+
+        return scriptList + scripts["bytes"]
@@ -1,11 +1,13 @@
 import struct
+
+import log
 from lxml.etree import Element, ElementTree, fromstring
 
 from data import VFixed
 from tables.common.otlScript import ScriptList, ScriptRecord, Script
 from tables.common.otlFeature import FeatureList, FeatureRecord, Feature
 from tables.common.otlLookup import LookupList, LookupType4
-from transform.bytes import outputTableBytes
+from transform.bytes import generateOffsets, outputTableBytes
 
 
 class GSUB:
@@ -33,22 +35,17 @@ class GSUB:
         return gsub
 
     def toBytes(self):
+        lists = generateOffsets([self.scriptList, self.featureList, self.lookupList], 16, 10)
 
-        # TODO: make toBytes functions for OTL scripts, features and lookups.
-        # TODO: learn how to generate offsets for OTL scripts, features and lookups.
-
-        # - generate the scriptList, featureList, and lookup list, generate offsets.
-
-        gsub = struct.pack( ">HH"
+        gsub = struct.pack( ">HH3H"
                           , self.majorVersion # UInt16
                           , self.minorVersion # UInt16
-
-                          # offset to scriptList # Offset16
-                          # offset to featureList # Offset16
-                          # offset to lookupList # Offset16
+                          , *lists["offsetInts"] # scriptListOffset, featureListOffset, lookupListOffset (Offset16s)
                           )
 
-        # - dump the lists immediately after this information
-        # - return the table.
+        gsub += lists["bytes"]
+
+        for lookup in self.lookupList.lookups:
+            log.out(f"GSUB: {len(lookup.ligatureSets)} ligature sets in {lookup.subtableCount} subtable(s){' (as extension lookups)' if lookup.extension else ''}, {len(gsub)} bytes total.", 90)
 
         return outputTableBytes(gsub)
@@ -2,7 +2,7 @@ import struct
 import sys
 from lxml.etree import Element
 from data import Tag, BFlags
-from transform.bytes import generateOffsets, outputTableBytes
+from transform.bytes import FileChunk, chunksToBytes, generateChunkOffsets, outputTableChunks
 
 
 
@@ -41,18 +41,28 @@ class sbixBitmap:
             return sbixBitmap
 
 
-    def toBytes(self):
+    def toChunks(self):
+        """
+        Returns the bitmap as a list of chunks. (the PNG itself isn't loaded - see FileChunk.)
+        """
+
+        # bitmaps with no image data take up no space at all.
+        # (the strike's offsets for them will just be the same as the next one.)
+        if self.img is None:
+            return []
+
         metadata = struct.pack( ">hh4s"
                             , self.originOffsetX # Int16
                             , self.originOffsetY # Int16
                             , self.graphicType.toBytes() # Tag (4 bytes/UInt32)
                             )
 
-        if self.img is None:
-            return metadata
-        else:
-            return metadata + self.img.getBytes()
-            # TODO: figure out if you need to make some sort of big-endian version of this.
+        return [metadata, FileChunk(self.img.path)]
+        # TODO: figure out if you need to make some sort of big-endian version of this.
+
+
+    def toBytes(self):
+        return chunksToBytes(self.toChunks())
 
 
 
@@ -87,15 +97,40 @@ class sbixStrike:
         return strike
 
 
-    def toBytes(self):
+    def writeTTX(self, xf):
+        """
+        Writes the strike's TTX to an lxml xmlfile one bitmap at a time,
+        so only one bitmap's hexdump is ever in memory.
+        """
+        with xf.element("strike"):
+            xf.write("\n")
+            xf.write(Element("ppem", {"value": str(self.ppem) }), pretty_print=True)
+            xf.write(Element("resolution", {"value": str(self.ppi) }), pretty_print=True)
+
+            for bitmap in self.bitmaps:
+                xf.write(bitmap.toTTX(), pretty_print=True)
+        xf.write("\n")
+
+
+    def toChunks(self):
+        """
+        Returns the strike as a list of chunks.
+        """
         strikeMetadata = struct.pack ( ">HH"
                              , self.ppem # UInt16
                              , self.ppi # UInt16
                              )
 
-        bitmapBytes = generateOffsets(self.bitmaps, 32, 4) # long offsets (UInt32)
-        # TODO: there's meant to be an extra offset in glyphDataOffsets. it's unclear what that is.
-        return strikeMetadata + bitmapBytes["offsetBytes"] + bitmapBytes["bytes"]
+        # glyphDataOffsets has one more offset than there are glyphs, so the last
+        # bitmap's length can be worked out. (offsets start from the beginning of the strike.)
+        bitmapChunks = generateChunkOffsets([b.toChunks() for b in self.bitmaps], 32, 4 + 4 * (len(self.bitmaps) + 1)) # long offsets (UInt32)
+        endOffset = struct.pack(">I", bitmapChunks["endOffset"])
+
+        return [strikeMetadata, bitmapChunks["offsetBytes"], endOffset] + bitmapChunks["chunks"]
+
+
+    def toBytes(self):
+        return chunksToBytes(self.toChunks())
 
 
 
@@ -129,12 +164,37 @@ class sbix:
 
         return sbix
 
-    def toBytes(self):
+
+    def writeTTX(self, xf):
+        """
+        Writes the sbix table's TTX to an lxml xmlfile one strike at a time.
+        """
+        with xf.element("sbix"):
+            xf.write("\n")
+            xf.write(Element("version", {"value": str(self.version) }), pretty_print=True) # hard-coded
+            xf.write(Element("flags", {"value": self.flags.toTTXStr() }), pretty_print=True) # hard-coded
+
+            for strike in self.strikes:
+                strike.writeTTX(xf)
+        xf.write("\n")
+
+
+    def toChunks(self):
+        """
+        Returns the table as a (padded) list of chunks and its original length,
+        so it can be streamed into a font file without loading any PNGs.
+        """
         header = struct.pack( ">H2sI"
                           , self.version # UInt16
                           , self.flags.toBytes() # 2 bytes/UInt16
                           , len(self.strikes) # UInt32
                           )
 
-        strikeBytes = generateOffsets(self.strikes, 32, 8) # long offsets (UInt32)
-        return outputTableBytes(header + strikeBytes["offsetBytes"] + strikeBytes["bytes"])
+        # (offsets start from the beginning of the sbix table.)
+        strikeChunks = generateChunkOffsets([s.toChunks() for s in self.strikes], 32, 8 + 4 * len(self.strikes)) # long offsets (UInt32)
+        return outputTableChunks([header, strikeChunks["offsetBytes"]] + strikeChunks["chunks"])
+
+
+    def toBytes(self):
+        chunks, length = self.toChunks()
+        return (chunksToBytes(chunks), length)
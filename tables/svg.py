@@ -1,69 +1,208 @@
+import gzip
 import struct
 import lxml.etree as etree
 from io import BytesIO
 
 
 from transform.svg import stripStyles, affinityDesignerCompensate, viewboxCompensate
-from transform.bytes import outputTableBytes
+from transform.bytes import generateOffsets, outputTableBytes
+
+
+svgNamespace = "http://www.w3.org/2000/svg"
+xlinkNamespace = "http://www.w3.org/1999/xlink"
 
 
 class SVGDoc:
     """
     Class representing an SVG document in an SVG table.
+
+    A document can be used by more than one glyph (if their compensated SVGs
+    are byte-identical). Every glyph it's used by is listed in glyphIDs.
     """
 
     def __init__(self, glyphID, glyph):
         self.img = glyph.imgDict['svg']
-        self.ID = glyphID
+        self.glyphIDs = [glyphID]
+        self.data = None
 
-    def toTTX(self):
+
+    def ranges(self):
+        """
+        Returns the (startGlyphID, endGlyphID) ranges of consecutive glyph IDs that use this document.
+        """
+        ranges = []
+
+        for glyphID in self.glyphIDs:
+            if ranges and glyphID == ranges[-1][1] + 1:
+                ranges[-1][1] = glyphID
+            else:
+                ranges.append([glyphID, glyphID])
+
+        return [tuple(r) for r in ranges]
+
+
+    def getSVGBytes(self):
+        """
+        Returns the document as bytes, with an id for every glyph that uses it.
+
+        A document that's only used by one glyph just gets its root's id set to
+        that glyph. Shared documents can't do that (there has to be a 'glyph<ID>'
+        element for every glyph), so the contents get wrapped in a group for the
+        first glyph, and every other glyph gets a <use> that points to it.
+        """
+        if self.data is not None:
+            return self.data
+
+        if len(self.glyphIDs) == 1:
+            self.data = self.img.getSVGBytes(self.glyphIDs[0])
+            return self.data
+
+        root = etree.fromstring(self.img.getSVGBytes())
+
+        # (a new root, so xlink can be declared there.)
+        attrib = {k: v for k, v in root.attrib.items() if k != "id"}
+        sharedRoot = etree.Element(root.tag, attrib, nsmap={**root.nsmap, "xlink": xlinkNamespace})
+
+        firstGlyph = etree.SubElement(sharedRoot, f"{{{svgNamespace}}}g", {"id": f"glyph{self.glyphIDs[0]}"})
+        firstGlyph.text = root.text
+        firstGlyph.extend(list(root))
+
+        for glyphID in self.glyphIDs[1:]:
+            etree.SubElement(sharedRoot, f"{{{svgNamespace}}}use", { "id": f"glyph{glyphID}"
+                                                                   , f"{{{xlinkNamespace}}}href": f"#glyph{self.glyphIDs[0]}"
+                                                                   })
+
+        self.data = etree.tostring(sharedRoot, method="xml", pretty_print=False, xml_declaration=True, encoding="UTF-8")
+        return self.data
+
+
+    def toBytes(self, compress=False):
+        """
+        Returns the document as bytes for the binary table.
+
+        If compress is True, it's gzipped (if that actually makes it smaller).
+        """
+        data = self.getSVGBytes()
+
+        if compress:
+            # (mtime=0 leaves out the timestamp, so builds are reproducible.)
+            compressed = BytesIO()
+
+            with gzip.GzipFile(None, "w", fileobj=compressed, mtime=0) as gzipFile:
+                gzipFile.write(data)
+
+            compressed = compressed.getvalue()
+
+            if len(compressed) < len(data):
+                return compressed
+
+        return data
+
+
+    def toTTX(self, startGlyphID, endGlyphID, compress=False):
         # create the structure that encapsulates the SVG image
-        svgDoc = etree.Element("svgDoc", {"startGlyphID": str(self.ID), "endGlyphID" : str(self.ID) })
+        attrs = {"startGlyphID": str(startGlyphID), "endGlyphID" : str(endGlyphID) }
 
-        # Add a glyph ID to the SVG.
-        svgRoot = self.img.data.getroot()
-        svgRoot.attrib["id"] = f"glyph{self.ID}"
-        newSVGTree = svgRoot.getroottree()
-        finishedSVG = newSVGTree
+        if compress:
+            attrs["compressed"] = "1"
 
+        svgDoc = etree.Element("svgDoc", attrs)
 
-        cdata = etree.CDATA(etree.tostring(finishedSVG, method="xml", pretty_print=False, xml_declaration=True, encoding="UTF-8"))
+        cdata = etree.CDATA(self.getSVGBytes())
         svgDoc.text = cdata
 
         return svgDoc
 
 
+
+
 class SVG:
     """
     Class representing an SVG table.
     """
 
-    def __init__(self, m, glyphs):
+    def __init__(self, m, glyphs, compress=False):
         self.version = 0 # hardcoded; the only version.
         self.SVGDocumentList = []
         self.reserved = 0 # reserved; set to 0.
+        self.compress = compress # whether documents are gzipped (--svg-gzip).
+
+
+        # byte-identical SVGs share a document.
+        docs = dict() # compensated SVG (with the id placeholder) -> SVGDoc
 
         for ID, g in enumerate(glyphs["img_empty"]):  # it has to be img_empty because we need those glyph indexes.
             if g.imgDict:
-                self.SVGDocumentList.append(SVGDoc(ID, g))
+                svgData = g.imgDict['svg'].getSVGBytes()
+
+                if svgData in docs:
+                    docs[svgData].glyphIDs.append(ID)
+                else:
+                    docs[svgData] = SVGDoc(ID, g)
+
+        self.SVGDocumentList = list(docs.values())
+
+
+        # each range of glyphs that share a document gets a record.
+        # (records have to be in glyph ID order.)
+        self.records = [] # (startGlyphID, endGlyphID, SVGDoc)
+
+        for doc in self.SVGDocumentList:
+            for startGlyphID, endGlyphID in doc.ranges():
+                self.records.append((startGlyphID, endGlyphID, doc))
+
+        self.records.sort(key=lambda r: r[0])
 
 
     def toTTX(self):
         svgTable = etree.Element("SVG")
         # - TTX doesnt have version for SVG table.
-        for svgDoc in self.SVGDocumentList:
-            svgTable.append(svgDoc.toTTX())
+        for startGlyphID, endGlyphID, svgDoc in self.records:
+            svgTable.append(svgDoc.toTTX(startGlyphID, endGlyphID, self.compress))
 
         return svgTable
 
 
+    def writeTTX(self, xf):
+        """
+        Writes the SVG table's TTX to an lxml xmlfile one SVG document at a time.
+        """
+        with xf.element("SVG"):
+            xf.write("\n")
+            for startGlyphID, endGlyphID, svgDoc in self.records:
+                xf.write(svgDoc.toTTX(startGlyphID, endGlyphID, self.compress), pretty_print=True)
+        xf.write("\n")
+
+
     def toBytes(self):
-        # TODO: compile and attach SVGDocumentList.
-        # - compile and calculate Offset32 to SVGDocumentList here
-        svg = struct.pack( ">HI"
+
+        # each document is only stored once, straight after the records.
+        docs = [d.toBytes(self.compress) for d in self.SVGDocumentList]
+        docOffsets = generateOffsets(docs, 32, 2 + 12 * len(self.records), usingClasses=False)
+
+        docLocations = dict() # id of SVGDoc -> (offset, length)
+
+        for d, offset, data in zip(self.SVGDocumentList, docOffsets["offsetInts"], docs):
+            docLocations[id(d)] = (offset, len(data))
+
+
+        documentList = struct.pack(">H", len(self.records)) # numEntries, UInt16
+
+        for startGlyphID, endGlyphID, svgDoc in self.records:
+            offset, length = docLocations[id(svgDoc)]
+
+            documentList += struct.pack( ">HHII"
+                                       , startGlyphID # UInt16
+                                       , endGlyphID # UInt16
+                                       , offset # svgDocOffset (from the start of the SVGDocumentList), Offset32
+                                       , length # svgDocLength, UInt32
+                                       )
+
+
+        svg = struct.pack( ">HII"
                          , self.version # UInt16
-                         # - offsetToSVGDocumentList # Offset32/UInt32
+                         , 10 # offsetToSVGDocumentList (straight after this), Offset32
                          , self.reserved # UInt32
                          )
-        return outputTableBytes(svg) # placeholder
-        # Attach SVGDocumentList afterwards.
+
+        return outputTableBytes(svg + documentList + docOffsets["bytes"])
@@ -1,12 +1,26 @@
+import os
 import sys
+import mmap
+import shutil
 import struct
+from array import array
 from math import floor
 
+try:
+    import numpy
+except ImportError:
+    numpy = None # (optional. checksums use the array module without it.)
+
+
+
 def generateOffsets(list, length, offsetStart, usingClasses=True):
     """
     Takes a list of classes that have a .toBytes() function (or a list of bytes objects),
     converts it to a large blob of connected bytes, with a matching list of offsets.
 
+    Each item is only converted to bytes once, and the blob is joined together
+    in one go at the end, so this takes linear time no matter how big the list is.
+
     inputs:
     - array: the array of classes that has a .toBytes() function.
     - length: length of each offset: 32 (4 bytes/UInt32) or 16 (2 bytes/UInt16).
@@ -17,6 +31,7 @@ def generateOffsets(list, length, offsetStart, usingClasses=True):
     Returns a dict with:
     - ["offsetBytes"] - the offsets as a list of bytes objects, encoded by the given length
     - ["offsetInts"] - the offsets as a list of ints
+    - ["endOffset"] - the offset just after the end of the blob (for tables that need one more offset than items)
     - ["bytes"] - the compiled blob of bytes.
 
     - https://docs.microsoft.com/en-us/typography/opentype/spec/otff#data-types
@@ -24,93 +39,279 @@ def generateOffsets(list, length, offsetStart, usingClasses=True):
 
     # check the input first
 
-    if length not in [16, 32]:
+    if length == 16:
+        offsetFormat = ">H" # Offset16 (UInt16)
+    elif length == 32:
+        offsetFormat = ">I" # Offset32 (UInt32)
+    else:
         raise ValueError(f"generateOffsets requires a bit length of either '16' or '32'. You gave '{length}'.")
 
-    if usingClasses:
-        for num, x in enumerate(list):
-            try:
-                temp = x.toBytes()
-            except ValueError as e:
-                raise ValueError(f"The list given to generateOffsets must be classes that all have a toBytes() function. Item {num} in this list doesn't.")
-
     if offsetStart < 0:
         raise ValueError(f"The offsetStart given was a negative number ({offsetStart}). It can't be a negative number.")
 
 
     # now do the conversion
 
-    offsetBytes = b'' # each offset number as bytes, cumulatively calculated
-    bytesBlob = b'' # the entire compacted blob of bytes
+    chunks = [] # each item as bytes, to be joined into The Blob at the end.
+    offsetInts = [] # each offset as ints
 
-    offsetInts = [] # each offset as ints, to temporarily run totals on
+    offsetInt = offsetStart
 
-    for x in range(0, len(list)):
+    for num, x in enumerate(list):
 
-        # convert this object into bytes, add it to The Blob.
+        # convert this object into bytes (just the once).
         if usingClasses:
-            objectInBytes = list[x].toBytes()
+            try:
+                objectInBytes = x.toBytes()
+            except AttributeError:
+                raise ValueError(f"The list given to generateOffsets must be classes that all have a toBytes() function. Item {num} in this list doesn't.")
         else:
-            objectInBytes = list[x]
+            objectInBytes = x
+
+        chunks.append(objectInBytes)
+        offsetInts.append(offsetInt)
+
+        # the next item starts where this one ends.
+        offsetInt += len(objectInBytes)
+
+
+    if offsetInts and offsetInts[-1] >= 1 << length:
+        raise ValueError(f"The data given to generateOffsets is too big for {length}-bit offsets. (it needs to go up to {offsetInts[-1]}.)")
+
+    offsetBytes = struct.pack(">" + offsetFormat[1] * len(offsetInts), *offsetInts)
+
+    return {"offsetBytes": offsetBytes, "offsetInts": offsetInts, "endOffset": offsetInt, "bytes": b''.join(chunks)}
+
+
+
+
+class FileChunk:
+    """
+    Class representing a whole file that's part of a table's data, without loading it.
+
+    Tables that are mostly made of image files (like sbix) can be described as a
+    list of chunks - bytes objects and FileChunks - so a streaming writer can
+    copy the images straight from file to file instead of holding them in memory.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        try:
+            self.length = os.path.getsize(path)
+        except OSError as e:
+            raise ValueError(f"The size of '{path}' couldn't be found. → {e}")
+
+
+    def read(self):
+        """
+        Loads and returns the file's bytes.
+        """
+        try:
+            with open(self.path, "rb") as read_file:
+                return read_file.read()
+        except OSError as e:
+            raise ValueError(f"'{self.path}' couldn't be read. → {e}")
+
+
+    def copyTo(self, file, checksum=None):
+        """
+        Copies the file into an open (binary, writable) file object at its current position.
+
+        Uses os.sendfile() on Linux, so the data never passes through Python.
+        (other systems - and files sendfile doesn't work with - are copied normally.)
+        If a TableChecksum is given, the file is added to it (through mmap, so it
+        still isn't loaded into memory).
+        """
+        file.flush()
+
+        with open(self.path, "rb") as src:
+            if checksum is not None and self.length:
+                with mmap.mmap(src.fileno(), self.length, access=mmap.ACCESS_READ) as mapped:
+                    checksum.update(mapped)
+
+            # (macOS has os.sendfile() too, but it only sends to sockets.)
+            if not sys.platform.startswith("linux"):
+                shutil.copyfileobj(src, file)
+                return
+
+            offset = 0
+            while offset < self.length:
+                try:
+                    sent = os.sendfile(file.fileno(), src.fileno(), offset, self.length - offset)
+                except OSError as e:
+                    if offset:
+                        raise ValueError(f"'{self.path}' couldn't be copied into the font. → {e}")
+
+                    # (nothing's been written yet, so it can just be copied normally instead.)
+                    shutil.copyfileobj(src, file)
+                    return
+
+                if sent == 0:
+                    raise ValueError(f"'{self.path}' got smaller while it was being copied into the font.")
+
+                offset += sent
+
+
+    def __len__(self):
+        return self.length
+
+
+
+def chunksLength(chunks):
+    """
+    Returns the total length of a list of chunks (bytes objects and FileChunks).
+    """
+    return sum(len(c) for c in chunks)
+
+
+
+def chunksToBytes(chunks):
+    """
+    Joins a list of chunks (bytes objects and FileChunks) into one bytes object.
+    """
+    return b''.join(c.read() if isinstance(c, FileChunk) else c for c in chunks)
+
+
+
+def generateChunkOffsets(chunkLists, length, offsetStart):
+    """
+    The same as generateOffsets, but for items that are each a list of chunks
+    (bytes objects and FileChunks) instead of classes or bytes.
+
+    Nothing is loaded or joined - the offsets come from the chunks' lengths.
+
+    Returns a dict with:
+    - ["offsetBytes"] - the offsets as bytes, encoded by the given length
+    - ["offsetInts"] - the offsets as a list of ints
+    - ["endOffset"] - the offset just after the end of the last item
+    - ["chunks"] - every item's chunks, one after the other.
+    """
 
-        bytesBlob += objectInBytes
+    if length == 16:
+        offsetFormat = "H" # Offset16 (UInt16)
+    elif length == 32:
+        offsetFormat = "I" # Offset32 (UInt32)
+    else:
+        raise ValueError(f"generateChunkOffsets requires a bit length of either '16' or '32'. You gave '{length}'.")
+
+    if offsetStart < 0:
+        raise ValueError(f"The offsetStart given was a negative number ({offsetStart}). It can't be a negative number.")
 
+    chunks = []
+    offsetInts = []
 
-        # cumulatively add the offset position for this particular section of The Blob.
-        if x == 0:
-            offsetInt = offsetStart
-        elif x > 0:
-            if usingClasses:
-                prevBytesLen = len(list[x-1].toBytes())
-            else:
-                prevBytesLen = len(list[x-1])
-            offsetInt = offsetInts[-1] + prevBytesLen
+    offsetInt = offsetStart
 
+    for item in chunkLists:
+        chunks.extend(item)
         offsetInts.append(offsetInt)
+        offsetInt += chunksLength(item)
 
-        # represent the offset position as bytes, ready for output into a neat list
-        offset = b''
-        if length == 16:
-            offset = struct.pack( ">H", offsetInt) # Offset16 (UInt16)
-        elif length == 32:
-            offset = struct.pack( ">I", offsetInt) # Offset32 (UInt32)
+    if offsetInts and offsetInts[-1] >= 1 << length:
+        raise ValueError(f"The data given to generateChunkOffsets is too big for {length}-bit offsets. (it needs to go up to {offsetInts[-1]}.)")
 
-        offsetBytes += offset
+    offsetBytes = struct.pack(">" + offsetFormat * len(offsetInts), *offsetInts)
 
-    return {"offsetBytes": offsetBytes, "offsetInts": offsetInts, "bytes": bytesBlob}
+    return {"offsetBytes": offsetBytes, "offsetInts": offsetInts, "endOffset": offsetInt, "chunks": chunks}
 
 
 
 
-def calculateTableChecksum(data):
+# an array typecode for unsigned 32-bit ints on this platform.
+longTypecode = "I" if array("I").itemsize == 4 else "L"
+
+
+
+def sumLongs(data):
     """
-    Calculates checksums for tables.
+    Returns the sum of a buffer of big-endian UInt32s, modulo 2^32.
 
-    If the data length is not a multiple of 4, it assumes it
-    should be padded with null bytes to make it so.
+    The buffer's length has to be a multiple of 4. NumPy is used if it's
+    installed (it can read the buffer in place), otherwise the array module is.
+    """
 
-    Should not be used on anything but the bytes output of a whole table.
+    if numpy is not None:
+        # (wrapping at 2^64 doesn't change the result modulo 2^32.)
+        return int(numpy.frombuffer(data, dtype=">u4").sum(dtype=numpy.uint64)) & 0xffffffff
+
+    value = 0
+    blockSize = 1024 * 1024
+
+    with memoryview(data) as view:
+        for i in range(0, len(view), blockSize):
+            longs = array(longTypecode)
+            longs.frombytes(view[i:i+blockSize])
+
+            if sys.byteorder == "little":
+                longs.byteswap()
+
+            value += sum(longs)
+
+    return value & 0xffffffff
+
+
+
+class TableChecksum:
+    """
+    Class for calculating a table's checksum a piece at a time (eg. while it's
+    being written), instead of all at once.
+
+    The pieces can be any length - anything that doesn't line up to 4 bytes is
+    carried over to the next update().
 
     - https://docs.microsoft.com/en-us/typography/opentype/spec/otff#calculating-checksums
-    (code being used from fonttools - https://github.com/fonttools/fonttools/blob/master/Lib/fontTools/ttLib/sfnt.py)
-    (I don't have to credit fonttools, I just wanted to~)
     """
+    def __init__(self):
+        self.total = 0
+        self.leftover = b''
 
-    remainder = len(data) % 4
 
-    if remainder:
-        data += b"\0" * (4 - remainder)
+    def update(self, data):
+        with memoryview(data) as view:
 
-    value = 0
-    blockSize = 4096
-    assert blockSize % 4 == 0
+            # finish off the last incomplete UInt32 first.
+            if self.leftover:
+                needed = 4 - len(self.leftover)
+                self.leftover += bytes(view[:needed])
+
+                if len(self.leftover) < 4:
+                    return
+
+                self.total = (self.total + sumLongs(self.leftover)) & 0xffffffff
+                self.leftover = b''
+                view = view[needed:]
 
-    for i in range(0, len(data), blockSize):
-        block = data[i:i+blockSize]
-        longs = struct.unpack(">%dL" % (len(block) // 4), block)
-        value = (value + sum(longs)) & 0xffffffff
+            end = len(view) - (len(view) % 4)
 
-    return value
+            self.total = (self.total + sumLongs(view[:end])) & 0xffffffff
+            self.leftover = bytes(view[end:])
+
+
+    def value(self):
+        """
+        Returns the checksum so far (as if the data was padded with null bytes to a multiple of 4).
+        """
+        if self.leftover:
+            return (self.total + sumLongs(self.leftover.ljust(4, b"\0"))) & 0xffffffff
+
+        return self.total
+
+
+
+def calculateTableChecksum(data):
+    """
+    Calculates checksums for tables.
+
+    If the data length is not a multiple of 4, it assumes it
+    should be padded with null bytes to make it so.
+
+    Should not be used on anything but the bytes output of a whole table.
+
+    - https://docs.microsoft.com/en-us/typography/opentype/spec/otff#calculating-checksums
+    """
+    checksum = TableChecksum()
+    checksum.update(data)
+    return checksum.value()
 
 
 
@@ -134,3 +335,23 @@ def outputTableBytes(data):
         return (data + b"\0" * (4 - remainder), len(data)) # pad with zeroes
     else:
         return (data, len(data))
+
+
+
+def outputTableChunks(chunks):
+    """
+    The same as outputTableBytes, but for tables that are output as a list of
+    chunks (bytes objects and FileChunks).
+
+    It returns a tuple containing:
+    [0] The list of chunks, with padding added to the end so it's 32-bit aligned.
+    [1] The length of the unpadded table.
+    """
+    length = chunksLength(chunks)
+    remainder = length % 4
+
+    if remainder:
+        return (chunks + [b"\0" * (4 - remainder)], length) # pad with zeroes
+    else:
+        return (chunks, length)
+
@@ -0,0 +1,398 @@
+import re
+
+
+# path.py
+# -------------------------------
+#
+# Parsing and writing SVG path data (the 'd' attribute).
+#
+# Paths are parsed into a list of absolute segments - (command, [numbers]) -
+# where the command is always uppercase. This makes them easy to transform
+# and compare, and then they're written back out in whatever form is shortest.
+# (https://www.w3.org/TR/SVG11/paths.html#PathData)
+
+
+
+paramCounts = { "M": 2, "L": 2, "H": 1, "V": 1
+              , "C": 6, "S": 4, "Q": 4, "T": 2
+              , "A": 7, "Z": 0
+              }
+
+numberRegex = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+separatorRegex = re.compile(r"[\s,]*")
+
+
+
+def parsePath(d):
+    """
+    Parses path data into a list of absolute segments.
+
+    Raises a ValueError if the path data isn't valid.
+    """
+    segments = []
+
+    position = separatorRegex.match(d, 0).end()
+    command = None
+
+    currentX, currentY = 0, 0
+    startX, startY = 0, 0
+
+    while position < len(d):
+        char = d[position]
+
+        if char.upper() in paramCounts:
+            command = char
+            position = separatorRegex.match(d, position + 1).end()
+
+        elif command is None or command in "Zz":
+            raise ValueError(f"The path data '{d}' has numbers where a command should be.")
+
+
+        # read this command's numbers.
+        # (arc flags are single characters that don't need anything between them.)
+        params = []
+
+        for index in range(paramCounts[command.upper()]):
+            if command in "Aa" and index in [3, 4]:
+                if position >= len(d) or d[position] not in "01":
+                    raise ValueError(f"The path data '{d}' has an arc without proper flags.")
+
+                params.append(float(d[position]))
+                position = separatorRegex.match(d, position + 1).end()
+                continue
+
+            number = numberRegex.match(d, position)
+
+            if number is None:
+                raise ValueError(f"The path data '{d}' has a '{command}' command without enough numbers.")
+
+            params.append(float(number.group(0)))
+            position = separatorRegex.match(d, number.end()).end()
+
+
+        # make it absolute.
+        relative = command.islower()
+        upper = command.upper()
+
+        if upper == "Z":
+            segments.append(("Z", []))
+            currentX, currentY = startX, startY
+
+        elif upper == "H":
+            x = params[0] + (currentX if relative else 0)
+            segments.append(("H", [x]))
+            currentX = x
+
+        elif upper == "V":
+            y = params[0] + (currentY if relative else 0)
+            segments.append(("V", [y]))
+            currentY = y
+
+        elif upper == "A":
+            x = params[5] + (currentX if relative else 0)
+            y = params[6] + (currentY if relative else 0)
+            segments.append(("A", params[:5] + [x, y]))
+            currentX, currentY = x, y
+
+        else:
+            points = []
+
+            for i in range(0, len(params), 2):
+                points += [params[i] + (currentX if relative else 0), params[i+1] + (currentY if relative else 0)]
+
+            segments.append((upper, points))
+            currentX, currentY = points[-2], points[-1]
+
+            if upper == "M":
+                startX, startY = currentX, currentY
+
+                # any more pairs after a moveto are linetos.
+                command = "l" if relative else "L"
+
+
+    return segments
+
+
+
+def transformPath(segments, scale, translateX, translateY):
+    """
+    Returns the segments with a uniform scale and translation applied to them.
+    """
+    transformed = []
+
+    for command, params in segments:
+        if command == "H":
+            transformed.append((command, [params[0] * scale + translateX]))
+
+        elif command == "V":
+            transformed.append((command, [params[0] * scale + translateY]))
+
+        elif command == "A":
+            rx, ry, rotation, largeArc, sweep, x, y = params
+            transformed.append((command, [rx * abs(scale), ry * abs(scale), rotation, largeArc, sweep if scale > 0 else 1 - sweep, x * scale + translateX, y * scale + translateY]))
+
+        else:
+            transformed.append((command, [p * scale + (translateX if i % 2 == 0 else translateY) for i, p in enumerate(params)]))
+
+    return transformed
+
+
+
+def pathBounds(segments):
+    """
+    Returns a bounding box (xMin, yMin, xMax, yMax) that the path is definitely
+    inside of, or None if the path is empty.
+
+    It's not tight - curves are bounded by their control points, and arcs by
+    how far they could possibly bulge out.
+    """
+    xs = []
+    ys = []
+
+    currentX, currentY = 0, 0
+    startX, startY = 0, 0
+
+    for command, params in segments:
+        if command == "Z":
+            currentX, currentY = startX, startY
+            continue
+
+        if command == "H":
+            currentX = params[0]
+        elif command == "V":
+            currentY = params[0]
+
+        elif command == "A":
+            rx, ry, rotation, largeArc, sweep, x, y = params
+
+            # (radii that are too small get scaled up until the arc fits between the endpoints.)
+            reach = 2 * max(abs(rx), abs(ry), abs(x - currentX), abs(y - currentY))
+
+            xs += [currentX - reach, currentX + reach]
+            ys += [currentY - reach, currentY + reach]
+            currentX, currentY = x, y
+
+        else:
+            xs += params[0::2]
+            ys += params[1::2]
+            currentX, currentY = params[-2], params[-1]
+
+            if command == "M":
+                startX, startY = currentX, currentY
+
+        xs.append(currentX)
+        ys.append(currentY)
+
+    if not xs:
+        return None
+
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+
+def formatNumber(value, precision):
+    """
+    Writes a number rounded to a number of decimal places, as short as possible.
+    """
+    rounded = f"{round(value, precision):.{precision}f}"
+
+    if "." in rounded:
+        rounded = rounded.rstrip("0").rstrip(".")
+
+    if rounded in ["-0", ""]:
+        rounded = "0"
+
+    # (leading zeroes aren't needed in SVG numbers.)
+    if rounded.startswith("0."):
+        rounded = rounded[1:]
+    elif rounded.startswith("-0."):
+        rounded = "-" + rounded[2:]
+
+    return rounded
+
+
+
+def joinNumbers(numbers):
+    """
+    Joins a list of formatted numbers with as few separators as possible.
+    """
+    joined = ""
+
+    for number in numbers:
+        if joined and not (number.startswith("-") or (number.startswith(".") and "." in previous)):
+            joined += " "
+
+        joined += number
+        previous = number
+
+    return joined
+
+
+
+def roundSegments(segments, precision):
+    """
+    Rounds every number in a list of segments.
+    (arc flags and rotations are kept as they are.)
+    """
+    rounded = []
+
+    for command, params in segments:
+        if command == "A":
+            rounded.append((command, [round(p, precision) if i not in [3, 4] else p for i, p in enumerate(params)]))
+        else:
+            rounded.append((command, [round(p, precision) for p in params]))
+
+    return rounded
+
+
+
+def removeZeroLengthSegments(segments, stroked):
+    """
+    Removes segments that don't draw anything.
+
+    - movetos that are straight away followed by another moveto (or nothing)
+    - arcs that end where they start (renderers skip these anyway)
+    - lines and curves that don't go anywhere, if the path isn't stroked.
+      (a stroked zero-length line can still draw a dot because of line caps.)
+
+    Anything straight before a smooth curve is kept, because the smooth curve
+    takes its first control point from whatever comes before it.
+    """
+    cleaned = []
+
+    currentX, currentY = 0, 0
+    startX, startY = 0, 0
+
+    for index, (command, params) in enumerate(segments):
+        nextCommand = segments[index + 1][0] if index + 1 < len(segments) else None
+
+        if command == "M":
+            if nextCommand in ["M", None]:
+                continue
+
+            cleaned.append((command, params))
+            currentX, currentY = startX, startY = params
+            continue
+
+        if command == "Z":
+            cleaned.append((command, params))
+            currentX, currentY = startX, startY
+            continue
+
+        if command == "H":
+            endX, endY = params[0], currentY
+        elif command == "V":
+            endX, endY = currentX, params[0]
+        else:
+            endX, endY = params[-2], params[-1]
+
+        if command == "A":
+            drawsNothing = (endX, endY) == (currentX, currentY)
+
+        elif not stroked:
+            # every point (including control points) is the current point.
+            points = [(endX, endY)] if command in "HV" else list(zip(params[0::2], params[1::2]))
+            drawsNothing = all(p == (currentX, currentY) for p in points)
+
+        else:
+            drawsNothing = False
+
+        # (removing it would change which control point gets reflected.)
+        if nextCommand in ["S", "T"]:
+            drawsNothing = False
+
+        if not drawsNothing:
+            cleaned.append((command, params))
+
+        currentX, currentY = endX, endY
+
+    return cleaned
+
+
+
+def writePath(segments, precision):
+    """
+    Writes a list of absolute segments as short path data, choosing between the
+    absolute and relative form of every segment (whichever is shorter).
+
+    The segments should already be rounded (see roundSegments), so that relative
+    numbers add back up to exactly the same absolute positions.
+    """
+    d = ""
+    lastCommand = None
+    lastNumber = None
+
+    currentX, currentY = 0, 0
+    startX, startY = 0, 0
+
+    for command, params in segments:
+
+        if command == "Z":
+            if lastCommand != "z":
+                d += "z"
+                lastCommand = "z"
+                lastNumber = None
+
+            currentX, currentY = startX, startY
+            continue
+
+
+        # lines that are flat can be written as horizontal/vertical lines.
+        if command == "L":
+            if params[1] == currentY:
+                command, params = "H", [params[0]]
+            elif params[0] == currentX:
+                command, params = "V", [params[1]]
+
+
+        # work out both forms.
+        absolute = [formatNumber(p, precision) for p in params]
+
+        if command == "H":
+            relative = [formatNumber(params[0] - currentX, precision)]
+        elif command == "V":
+            relative = [formatNumber(params[0] - currentY, precision)]
+        elif command == "A":
+            relative = absolute[:5] + [formatNumber(params[5] - currentX, precision), formatNumber(params[6] - currentY, precision)]
+        else:
+            relative = [formatNumber(p - (currentX if i % 2 == 0 else currentY), precision) for i, p in enumerate(params)]
+
+        if command == "A":
+            # (flags are always written as separate numbers.)
+            absolute[3] = str(int(params[3]))
+            absolute[4] = str(int(params[4]))
+            relative[3] = absolute[3]
+            relative[4] = absolute[4]
+
+        options = []
+
+        for letter, numbers in [(command, absolute), (command.lower(), relative)]:
+
+            # commands don't need repeating, and linetos straight after a moveto are implied.
+            implied = (letter == lastCommand and letter not in "Mm") or (letter, lastCommand) in [("L", "M"), ("l", "m")]
+
+            options.append((letter, ("" if implied else letter) + joinNumbers(numbers), implied))
+
+        letter, written, implied = min(options, key=lambda o: len(o[1]))
+
+        # (if the command letter's left off, it might need separating from the last number.)
+        if implied and lastNumber is not None and not (written.startswith("-") or (written.startswith(".") and "." in lastNumber)):
+            d += " "
+
+        d += written
+        lastCommand = letter
+        lastNumber = (absolute if letter.isupper() else relative)[-1]
+
+
+        # move the current point.
+        if command == "H":
+            currentX = params[0]
+        elif command == "V":
+            currentY = params[0]
+        else:
+            currentX, currentY = params[-2], params[-1]
+
+        if command == "M":
+            startX, startY = currentX, currentY
+
+    return d
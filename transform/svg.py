@@ -1,6 +1,10 @@
+import re
+import copy
 import lxml.etree as etree
 import lxml.builder as builder
 
+from transform.path import parsePath, transformPath, pathBounds, roundSegments, removeZeroLengthSegments, writePath, formatNumber
+
 def stripStyles(svgImage):
     """
     Converts all instances of CSS style attibutes in an SVG to basic XML attributes.
@@ -139,3 +143,660 @@ def compensateSVG(svgImage, m, afsc):
         return viewboxCompensate(metrics, svgImage)
     else:
         return svgImage
+
+
+
+
+# SVG minification
+# ---------------------------------------------------------------------------
+
+svgNS = "http://www.w3.org/2000/svg"
+
+# namespaces that only mean something to the software an SVG was made in.
+editorNamespaces = [ "http://www.inkscape.org/namespaces/inkscape"
+                   , "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+                   , "http://www.serif.com/"
+                   , "http://www.bohemiancoding.com/sketch/ns"
+                   , "http://ns.adobe.com/AdobeIllustrator/10.0/"
+                   , "http://ns.adobe.com/Graphs/1.0/"
+                   , "http://ns.adobe.com/AdobeSVGViewerExtensions/3.0/"
+                   , "http://ns.adobe.com/Extensibility/1.0/"
+                   , "http://ns.adobe.com/Flows/1.0/"
+                   , "http://ns.adobe.com/ImageReplacement/1.0/"
+                   , "http://ns.adobe.com/SaveForWeb/1.0/"
+                   , "http://ns.adobe.com/Variables/1.0/"
+                   , "http://ns.adobe.com/xap/1.0/"
+                   , "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+                   , "http://creativecommons.org/ns#"
+                   , "http://purl.org/dc/elements/1.1/"
+                   ]
+
+# elements that never affect how an SVG looks.
+metadataElems = ["metadata", "title", "desc"]
+
+# elements whose contents are only drawn when something else uses them
+# (and inherit from whatever that is, not from their own ancestors).
+templateElems = ["defs", "symbol", "clipPath", "mask", "pattern", "marker"]
+
+# inherited presentation attributes and their initial values.
+# (these can only be removed if nothing above them sets them to something else.)
+inheritedDefaults = { "fill-opacity": "1"
+                    , "fill-rule": "nonzero"
+                    , "clip-rule": "nonzero"
+                    , "stroke": "none"
+                    , "stroke-opacity": "1"
+                    , "stroke-width": "1"
+                    , "stroke-linecap": "butt"
+                    , "stroke-linejoin": "miter"
+                    , "stroke-miterlimit": "4"
+                    , "stroke-dasharray": "none"
+                    , "stroke-dashoffset": "0"
+                    , "visibility": "visible"
+                    }
+
+# presentation attributes that aren't inherited, and their initial values.
+uninheritedDefaults = { "opacity": "1"
+                      , "display": "inline"
+                      }
+
+# geometry attributes that default to 0 for particular elements.
+geometryDefaults = { "rect": ["x", "y"]
+                   , "circle": ["cx", "cy"]
+                   , "ellipse": ["cx", "cy"]
+                   }
+
+# attributes that are only made of coordinates and lengths, so their numbers can be rounded.
+# (transforms aren't rounded - a small change to a scale can move things a lot.)
+numericAttrs = [ "d", "points"
+               , "x", "y", "x1", "y1", "x2", "y2"
+               , "cx", "cy", "r", "rx", "ry", "fx", "fy"
+               , "width", "height"
+               , "stroke-width", "stroke-dashoffset", "stroke-dasharray"
+               ]
+
+numberRegex = re.compile(r"[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?")
+idReferenceRegex = re.compile(r"#([^\s\"'()#,;]+)")
+
+
+
+def localName(tag):
+    return etree.QName(tag).localname
+
+
+def namespace(tag):
+    return etree.QName(tag).namespace
+
+
+def isSVGElement(e):
+    """
+    Checks if an element is an SVG element.
+    (elements forc adds, like viewboxCompensate()'s group, don't have a namespace
+    until they're serialized under the SVG root's default namespace.)
+    """
+    return isinstance(e.tag, str) and namespace(e.tag) in [svgNS, None]
+
+
+def findReferencedIDs(root):
+    """
+    Returns the set of every id that's referred to in an SVG (with '#id' or
+    'url(#id)', in attributes or style elements).
+    """
+    referencedIDs = set()
+
+    for e in root.iter(etree.Element):
+        for value in e.attrib.values():
+            if "#" in value:
+                referencedIDs.update(idReferenceRegex.findall(value))
+
+        if localName(e.tag) == "style" and e.text:
+            referencedIDs.update(idReferenceRegex.findall(e.text))
+
+    return referencedIDs
+
+
+def isInstanced(e, referencedIDs):
+    """
+    Checks whether an element might be drawn somewhere else (eg. by a <use>),
+    inheriting from there instead of its ancestors - ie. if it's inside a
+    template element, or it (or one of its ancestors) is referred to by id.
+    """
+    while e is not None and e.getparent() is not None:
+        if localName(e.tag) in templateElems or e.attrib.get("id") in referencedIDs:
+            return True
+
+        e = e.getparent()
+
+    return False
+
+
+def sameValue(a, b):
+    """
+    Checks if two attribute values are the same, treating numbers numerically. ('1' == '1.0')
+    """
+    a = a.strip()
+    b = b.strip()
+
+    try:
+        return float(a) == float(b)
+    except ValueError:
+        return a == b
+
+
+def roundNumber(match, precision):
+    """
+    Rounds a number found with numberRegex to a number of decimal places,
+    writing it as short as possible.
+
+    Whole numbers are left exactly as they are, because path arc flags can
+    be written right next to each other (ie. '0110' is 4 numbers, not 1).
+    """
+    number = match.group(0)
+
+    if "." not in number and "e" not in number.lower():
+        return number
+
+    return formatNumber(float(number), precision)
+
+
+
+def removeElement(e):
+    """
+    Removes an element, keeping the text that comes after it.
+    """
+    parent = e.getparent()
+
+    if e.tail and e.tail.strip():
+        previous = e.getprevious()
+
+        if previous is not None:
+            previous.tail = (previous.tail or "") + e.tail
+        else:
+            parent.text = (parent.text or "") + e.tail
+
+    parent.remove(e)
+
+
+
+def minifySVG(svgImage, precision=3):
+    """
+    Makes an SVG as small as possible without changing how it looks.
+
+    - removes comments, processing instructions, metadata and anything
+      in an editor's namespace (Inkscape, Affinity, Illustrator, etc.)
+    - removes ids that nothing refers to
+    - removes attributes that are set to their default values
+    - collapses whitespace
+    - rounds coordinates to a number of decimal places
+
+    Returns the minified SVG tree.
+    """
+    root = svgImage.getroot()
+
+
+    # comments, processing instructions, metadata and editor stuff
+    # ---------------------------------------------------------------------------
+    for e in list(root.iter(etree.Comment, etree.ProcessingInstruction)):
+        removeElement(e)
+
+    # (comments before and after the root element can't be removed from the
+    # tree they're in, so the root gets moved into a new one without them.)
+    if root.getprevious() is not None or root.getnext() is not None:
+        root = copy.deepcopy(root)
+        svgImage = etree.ElementTree(root)
+
+
+    for e in list(root.iter(etree.Element)):
+        if e.getparent() is None:
+            continue
+
+        if namespace(e.tag) in editorNamespaces or (namespace(e.tag) == svgNS and localName(e.tag) in metadataElems):
+            removeElement(e)
+
+    for e in root.iter(etree.Element):
+        for attr in list(e.attrib):
+            if namespace(attr) in editorNamespaces:
+                del e.attrib[attr]
+
+
+    # find every id that's referred to
+    # ---------------------------------------------------------------------------
+    referencedIDs = findReferencedIDs(root)
+
+
+    # attributes
+    # ---------------------------------------------------------------------------
+    def minifyElement(e, parentInherited, parentInstanced):
+        tag = localName(e.tag)
+
+        # (inherited values are only tracked for the attributes that have defaults.)
+        inherited = {**parentInherited, **{a: v for a, v in e.attrib.items() if a in inheritedDefaults}}
+
+        # elements that might be drawn somewhere else inherit from wherever that
+        # is, so their inherited defaults might be overriding something. (see isInstanced())
+        instanced = parentInstanced or (e is not root and (tag in templateElems or e.attrib.get("id") in referencedIDs))
+
+        for attr in list(e.attrib):
+            value = e.attrib[attr]
+
+            if attr == "id" and e is not root and value not in referencedIDs:
+                del e.attrib[attr]
+                continue
+
+            if attr in inheritedDefaults and sameValue(value, inheritedDefaults[attr]) and not instanced:
+                parentValue = parentInherited.get(attr)
+
+                if parentValue is None or sameValue(parentValue, inheritedDefaults[attr]):
+                    del e.attrib[attr]
+                    continue
+
+            if attr in uninheritedDefaults and sameValue(value, uninheritedDefaults[attr]):
+                del e.attrib[attr]
+                continue
+
+            if attr in geometryDefaults.get(tag, []) and sameValue(value, "0"):
+                del e.attrib[attr]
+                continue
+
+            value = " ".join(value.split())
+
+            if attr in numericAttrs:
+                value = numberRegex.sub(lambda m: roundNumber(m, precision), value)
+
+            e.attrib[attr] = value
+
+        return inherited, instanced
+
+
+    # (this goes through the tree top-down, keeping track of what each element inherits.)
+    stack = [(root, dict(), False)]
+
+    while stack:
+        e, parentInherited, parentInstanced = stack.pop()
+        inherited, instanced = minifyElement(e, parentInherited, parentInstanced)
+
+        for child in e.iterchildren(etree.Element):
+            stack.append((child, inherited, instanced))
+
+
+    # whitespace between elements
+    # ---------------------------------------------------------------------------
+    for e in root.iter(etree.Element):
+        if e.text is not None and not e.text.strip():
+            e.text = None
+
+        if e.tail is not None and not e.tail.strip():
+            e.tail = None
+
+    etree.cleanup_namespaces(svgImage)
+
+    return svgImage
+
+
+
+
+# SVG geometry
+# ---------------------------------------------------------------------------
+
+# the elements bakeTransforms() knows how to move, and which of their
+# attributes are coordinates (x, y) or lengths.
+bakeableElems = { "g": ([], [])
+                , "path": ([], [])
+                , "rect": ([("x", "y")], ["width", "height", "rx", "ry"])
+                , "circle": ([("cx", "cy")], ["r"])
+                , "ellipse": ([("cx", "cy")], ["rx", "ry"])
+                , "line": ([("x1", "y1"), ("x2", "y2")], [])
+                , "polygon": ([], [])
+                , "polyline": ([], [])
+                }
+
+# lengths that are inherited, so they might need scaling even if they're set above a transform.
+strokeLengths = ["stroke-width", "stroke-dashoffset", "stroke-dasharray"]
+
+transformRegex = re.compile(r"\s*(translate|scale)\s*\(([^)]*)\)\s*,?")
+
+
+
+def inheritedValue(e, attr):
+    """
+    Returns the value an element gets for an inherited attribute (from
+    itself or the closest ancestor that sets it), or None if nothing sets it.
+    """
+    while e is not None:
+        if attr in e.attrib:
+            return e.attrib[attr]
+        e = e.getparent()
+
+    return None
+
+
+def isStroked(e):
+    stroke = inheritedValue(e, "stroke")
+    return stroke is not None and stroke.strip() != "none"
+
+
+def parseUniformTransform(transform):
+    """
+    Parses a transform made of translate()s and uniform scale()s (like the one
+    viewboxCompensate() makes) into a (scale, translateX, translateY) tuple.
+
+    Returns None for anything else.
+    """
+    scale, translateX, translateY = 1, 0, 0
+    position = 0
+
+    while position < len(transform.strip()):
+        match = transformRegex.match(transform, position)
+
+        if match is None:
+            return None
+
+        try:
+            values = [float(v) for v in re.split(r"[\s,]+", match.group(2).strip())]
+        except ValueError:
+            return None
+
+        if match.group(1) == "translate" and len(values) in [1, 2]:
+            tx, ty = values[0], values[1] if len(values) == 2 else 0
+            translateX, translateY = translateX + scale * tx, translateY + scale * ty
+
+        elif match.group(1) == "scale" and (len(values) == 1 or (len(values) == 2 and values[0] == values[1])):
+            scale *= values[0]
+
+        else:
+            return None
+
+        position = match.end()
+
+    return (scale, translateX, translateY)
+
+
+
+def canBake(group, referencedIDs):
+    """
+    Checks that everything inside a group can have the group's transform
+    baked into it, without the way it looks changing.
+    """
+
+    # anything that's drawn somewhere else (eg. by a <use>) has to keep the
+    # transform, and inherits strokes from there. (see isInstanced().)
+    if isInstanced(group, referencedIDs):
+        return False
+
+    for e in group.iter():
+        if not isinstance(e.tag, str):
+            continue
+
+        if not isSVGElement(e) or localName(e.tag) not in bakeableElems:
+            return False
+
+        if e.attrib.get("id") in referencedIDs:
+            return False
+
+        if e is not group and "transform" in e.attrib:
+            return False
+
+        # (styles aren't looked inside of, and non-scaling strokes shouldn't be scaled.)
+        if "style" in e.attrib or "vector-effect" in e.attrib:
+            return False
+
+        for attr, value in e.attrib.items():
+
+            # anything that refers to something else (gradients, clip paths, etc.)
+            # might be in a different coordinate system.
+            if "url(" in value:
+                return False
+
+            if attr in strokeLengths and "%" in value:
+                return False
+
+        coordinates, lengths = bakeableElems[localName(e.tag)]
+
+        for attr in [a for pair in coordinates for a in pair] + lengths:
+            if attr in e.attrib:
+                try:
+                    float(e.attrib[attr])
+                except ValueError:
+                    return False
+
+        if localName(e.tag) == "path" and "d" in e.attrib:
+            try:
+                parsePath(e.attrib["d"])
+            except ValueError:
+                return False
+
+    # dashes set above the group would need scaling too,
+    # and percentage widths don't mean the same thing in the new coordinates.
+    parent = group.getparent()
+
+    if parent is not None:
+        if inheritedValue(parent, "stroke-dasharray") not in [None, "none"]:
+            return False
+
+        if "%" in (inheritedValue(parent, "stroke-width") or ""):
+            return False
+
+    return True
+
+
+
+def scaleLengths(value, scale, precision):
+    return numberRegex.sub(lambda m: formatNumber(float(m.group(0)) * scale, precision), value)
+
+
+
+def bakeGroup(group, scale, translateX, translateY, precision):
+    """
+    Applies a (scale, translateX, translateY) transform directly to the coordinates
+    of everything in a group, and removes the group's transform.
+    """
+
+    def move(x, y):
+        return (formatNumber(x * scale + translateX, precision), formatNumber(y * scale + translateY, precision))
+
+
+    # stroke widths are scaled by the transform too.
+    # (including widths that are set above the group and inherited.)
+    if any(isStroked(e) for e in group.iter(etree.Element)):
+        if "stroke-width" not in group.attrib:
+            inheritedWidth = inheritedValue(group.getparent(), "stroke-width") if group.getparent() is not None else None
+            group.attrib["stroke-width"] = inheritedWidth or "1"
+
+        if "stroke-dashoffset" not in group.attrib and group.getparent() is not None:
+            inheritedOffset = inheritedValue(group.getparent(), "stroke-dashoffset")
+
+            if inheritedOffset is not None:
+                group.attrib["stroke-dashoffset"] = inheritedOffset
+
+    for e in group.iter(etree.Element):
+        tag = localName(e.tag)
+        coordinates, lengths = bakeableElems[tag]
+
+        for xAttr, yAttr in coordinates:
+            x, y = move(float(e.attrib.get(xAttr, 0)), float(e.attrib.get(yAttr, 0)))
+            e.attrib[xAttr] = x
+            e.attrib[yAttr] = y
+
+        for attr in lengths:
+            if attr in e.attrib:
+                e.attrib[attr] = formatNumber(float(e.attrib[attr]) * abs(scale), precision)
+
+        for attr in strokeLengths:
+            if attr in e.attrib and e.attrib[attr].strip() != "none":
+                e.attrib[attr] = scaleLengths(e.attrib[attr], abs(scale), precision)
+
+        if tag == "path" and "d" in e.attrib:
+            segments = transformPath(parsePath(e.attrib["d"]), scale, translateX, translateY)
+            e.attrib["d"] = writePath(roundSegments(segments, precision), precision)
+
+        if tag in ["polygon", "polyline"] and "points" in e.attrib:
+            numbers = [float(n) for n in numberRegex.findall(e.attrib["points"])]
+            e.attrib["points"] = " ".join(",".join(move(x, y)) for x, y in zip(numbers[0::2], numbers[1::2]))
+
+    del group.attrib["transform"]
+
+
+
+def bakeTransforms(svgImage, precision=3):
+    """
+    Bakes the transforms of groups (like the one viewboxCompensate() wraps
+    everything in) into the coordinates of what's inside them, so renderers
+    don't have to apply a transform every time they draw a glyph.
+
+    Only translations and uniform scales are baked, and only when everything
+    inside the group is a basic shape or path that doesn't refer to anything
+    else. Anything else is left alone.
+    """
+    root = svgImage.getroot()
+    referencedIDs = findReferencedIDs(root)
+
+    # (innermost groups first, so their transforms are out of the way of the outer ones.)
+    for group in reversed(list(root.iter(f"{{{svgNS}}}g", "g"))):
+        if "transform" not in group.attrib:
+            continue
+
+        transform = parseUniformTransform(group.attrib["transform"])
+
+        # (flipped shapes like rects can't just have their corners moved.)
+        if transform is None or transform[0] <= 0 or not canBake(group, referencedIDs):
+            continue
+
+        bakeGroup(group, *transform, precision)
+
+        # a group that doesn't have anything left on it doesn't do anything.
+        if not group.attrib and group.getparent() is not None:
+            for child in list(group):
+                group.addprevious(child)
+
+            removeElement(group)
+
+
+
+def optimizePaths(svgImage, precision=3):
+    """
+    Rewrites every path's data in its shortest form, and removes segments
+    that don't draw anything.
+
+    Paths with data that can't be parsed are left alone.
+    """
+    root = svgImage.getroot()
+    referencedIDs = findReferencedIDs(root)
+
+    for e in root.iter(f"{{{svgNS}}}path", "path"):
+        if "d" not in e.attrib:
+            continue
+
+        try:
+            segments = roundSegments(parsePath(e.attrib["d"]), precision)
+        except ValueError:
+            continue
+
+        # (paths that are drawn somewhere else could get a stroke from there.)
+        stroked = isStroked(e) or isInstanced(e, referencedIDs)
+
+        e.attrib["d"] = writePath(removeZeroLengthSegments(segments, stroked), precision)
+
+
+
+def canMergePath(e, referencedIDs):
+    """
+    Checks whether a path could be merged with another one, as long as they
+    look the same and don't overlap.
+    """
+    if not isSVGElement(e) or localName(e.tag) != "path" or "d" not in e.attrib or len(e) or "id" in e.attrib:
+        return False
+
+    if e.text and e.text.strip():
+        return False
+
+    for attr, value in e.attrib.items():
+        # gradients and patterns are stretched over a path's bounding box,
+        # and clip paths, masks and filters can be too.
+        if "url(" in value:
+            return False
+
+        if attr == "opacity" and not sameValue(value, "1"):
+            return False
+
+    # (overlapping strokes or see-through fills would look different.)
+    if isStroked(e):
+        return False
+
+    # paths that are drawn somewhere else (eg. by a <use>) inherit from there,
+    # so they could be stroked or see-through. (see isInstanced().)
+    if isInstanced(e, referencedIDs):
+        return False
+
+    fillOpacity = inheritedValue(e, "fill-opacity")
+
+    if fillOpacity is not None and not sameValue(fillOpacity, "1"):
+        return False
+
+    return True
+
+
+
+def mergePaths(svgImage, precision=3):
+    """
+    Merges sibling paths that are right next to each other and look the same
+    (same attributes, solid fill, no stroke) into one, if they don't overlap.
+
+    Paths that don't overlap look exactly the same whether they're drawn one
+    at a time or together, whatever their fill rule.
+    """
+    root = svgImage.getroot()
+    referencedIDs = findReferencedIDs(root)
+
+    for parent in list(root.iter(etree.Element)):
+        merged = None # the path that others are being merged into
+        mergedSegments = None
+        mergedBounds = None
+
+        for e in list(parent):
+            if not canMergePath(e, referencedIDs):
+                merged = None
+                continue
+
+            try:
+                segments = parsePath(e.attrib["d"])
+            except ValueError:
+                merged = None
+                continue
+
+            bounds = pathBounds(segments)
+
+            attrs = {k: v for k, v in e.attrib.items() if k != "d"}
+
+            if ( merged is not None
+                and bounds is not None
+                and attrs == {k: v for k, v in merged.attrib.items() if k != "d"}
+                and ( bounds[2] <= mergedBounds[0] or mergedBounds[2] <= bounds[0]
+                   or bounds[3] <= mergedBounds[1] or mergedBounds[3] <= bounds[1]
+                    )
+               ):
+                mergedSegments += segments
+                mergedBounds = ( min(bounds[0], mergedBounds[0]), min(bounds[1], mergedBounds[1])
+                               , max(bounds[2], mergedBounds[2]), max(bounds[3], mergedBounds[3])
+                               )
+                merged.attrib["d"] = writePath(roundSegments(mergedSegments, precision), precision)
+                removeElement(e)
+
+            elif bounds is not None:
+                merged = e
+                mergedSegments = segments
+                mergedBounds = bounds
+
+            else:
+                merged = None
+
+
+
+def optimizeGeometry(svgImage, precision=3, bake=False):
+    """
+    Runs the geometry stages on a compensated SVG.
+    (bakes transforms if asked to, then rewrites and merges paths.)
+    """
+    if bake:
+        bakeTransforms(svgImage, precision)
+
+    optimizePaths(svgImage, precision)
+    mergePaths(svgImage, precision)
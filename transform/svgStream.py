@@ -0,0 +1,315 @@
+import re
+import lxml.etree as etree
+
+from validate.svg import elementViolations, restrictedElemTags, unenforcedElemTags, restrictedAttrSet, unenforcedAttrSet
+
+
+# svgStream.py
+# -------------------------------
+#
+# Validating and compensating SVGs in one pass while they're being parsed,
+# without building a tree.
+#
+# This does the same thing as isSVGValid() + compensateSVG() (and produces
+# exactly the same bytes), but only for SVGs where it can do that without
+# looking back at something it's already written. Anything else - SVGs
+# with problems that need reporting, unusual namespaces, DOCTYPEs, no
+# viewBox, etc. - makes it give up, and the SVG should go through the
+# normal tree-based path instead.
+
+
+
+svgNS = "http://www.w3.org/2000/svg"
+xlinkNS = "http://www.w3.org/1999/xlink"
+
+# the only namespaces this can handle on the root.
+# (anything else gets moved around by lxml in ways that aren't worth copying.)
+acceptedRootNamespaces = [ {"": svgNS}
+                         , {"": svgNS, "xlink": xlinkNS}
+                         ]
+
+# elements and attributes that validation rules might apply to.
+# (everything else can skip straight past elementViolations().)
+checkedTags = restrictedElemTags | unenforcedElemTags | {f"{{{svgNS}}}image", f"{{{svgNS}}}svg"}
+checkedAttrs = restrictedAttrSet | unenforcedAttrSet
+
+# (the same elements affinityDesignerCompensate() fills.)
+affinityFilledTags = frozenset(f"{{{svgNS}}}{e}" for e in ["path", "rect", "circle", "ellipse"])
+
+# attribute names that stripStyles() can set without lxml complaining.
+styleNameRegex = re.compile(r"[A-Za-z_][A-Za-z0-9_.\-]*\Z")
+
+# prefixed attribute names (prefix:name=).
+# parser targets aren't told when a prefix hasn't been declared (a normal
+# parse fails), so these have to be checked separately.
+attrPrefixRegex = re.compile(rb"""[\s"']([A-Za-z_][A-Za-z0-9_.\-]*):[A-Za-z_][A-Za-z0-9_.\-]*\s*=""")
+
+
+
+class FallBack(Exception):
+    """
+    Raised when an SVG needs to go through the tree-based path instead.
+    """
+    pass
+
+
+
+# (most text and attributes don't need escaping at all, so that's checked for first.)
+textSpecialRegex = re.compile(r"[&<>\r]")
+attrSpecialRegex = re.compile(r"[&<>\r\"\n\t]")
+
+
+def escapeText(text):
+    if textSpecialRegex.search(text) is None:
+        return text
+
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("\r", "&#13;")
+
+
+def escapeAttr(value):
+    if attrSpecialRegex.search(value) is None:
+        return value
+
+    return ( value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("\r", "&#13;")
+                  .replace('"', "&quot;")
+                  .replace("\n", "&#10;")
+                  .replace("\t", "&#9;")
+           )
+
+
+def attrName(name):
+    """
+    Returns how an attribute's name is written in a compensated SVG.
+    """
+    if name.startswith("{"):
+        if name.startswith(f"{{{xlinkNS}}}"):
+            return "xlink:" + name[len(xlinkNS) + 2:]
+
+        raise FallBack()
+
+    return name
+
+
+def writeAttrs(attrib):
+    # (usually nothing needs escaping or prefixing, so that's checked for all of them at once.)
+    if "{" in "".join(attrib) or attrSpecialRegex.search("".join(attrib.values())) is not None:
+        return "".join(f' {attrName(k)}="{escapeAttr(v)}"' for k, v in attrib.items())
+
+    return "".join([f' {k}="{v}"' for k, v in attrib.items()])
+
+
+
+
+class CompensatingTarget:
+    """
+    An lxml parser target that validates and compensates an SVG as it's
+    being parsed, and writes out the compensated SVG as it goes.
+    """
+
+    def __init__(self, metrics, afsc, nusc, rootID):
+        self.metrics = metrics
+        self.afsc = afsc
+        self.nusc = nusc
+        self.rootID = rootID
+
+        self.output = []
+        self.depth = 0 # how many elements deep the parser is.
+        self.openTag = False # whether the last start tag written still needs closing (with '>' or '/>').
+        self.rootHasChildren = False
+
+        self.skipDepth = None # the depth of the element being removed (see affinityDesignerCompensate()).
+        self.skipTail = False # whether the text straight after it is being removed too.
+        self.serifRectRemoved = False
+
+        self.rootNamespaces = dict()
+
+
+    def writing(self):
+        return self.skipDepth is None
+
+
+    def closeOpenTag(self):
+        if self.openTag:
+            self.output.append(">")
+            self.openTag = False
+
+
+    def doctype(self, *args):
+        raise FallBack()
+
+
+    def pi(self, target, data):
+        if self.depth:
+            raise FallBack()
+
+
+    def comment(self, text):
+        self.skipTail = False
+
+        # (comments outside of the root aren't kept by viewboxCompensate.)
+        if self.depth and self.writing():
+            self.closeOpenTag()
+            self.output.append(f"<!--{text}-->")
+            self.rootHasChildren = True
+
+
+    def data(self, data):
+        # (the root's text isn't kept by viewboxCompensate.)
+        if self.depth > 1 or (self.depth == 1 and self.rootHasChildren):
+            if self.writing() and not self.skipTail:
+                self.closeOpenTag()
+                self.output.append(escapeText(data))
+
+
+    def start(self, tag, attrib, nsmap):
+        self.depth += 1
+        self.skipTail = False
+
+        if self.depth == 1:
+            self.startRoot(tag, attrib, nsmap)
+            return
+
+        # namespaces can only be declared on the root.
+        if nsmap or not tag.startswith(f"{{{svgNS}}}"):
+            raise FallBack()
+
+        # validation is done on the SVG as it was, before it's compensated.
+        if tag in checkedTags or not checkedAttrs.isdisjoint(attrib):
+            restricted, unenforced = elementViolations(tag, attrib, self.nusc)
+
+            if restricted or unenforced:
+                raise FallBack() # (the tree-based path can say where they are.)
+
+        # (elements with attributes get a dict of their own that can just be changed.)
+        if type(attrib) is not dict:
+            attrib = dict(attrib)
+
+        # stripStyles()
+        # (this happens before the Affinity rect is removed, so it's done even for what's inside it.)
+        if "style" in attrib:
+            for style in attrib["style"].split(";"):
+                if style:
+                    splitStyle = style.split(":")
+
+                    if len(splitStyle) < 2 or not styleNameRegex.match(splitStyle[0]):
+                        raise FallBack()
+
+                    attrib[splitStyle[0]] = splitStyle[1]
+
+            attrib.pop("style")
+
+        if not self.writing():
+            return
+
+        # affinityDesignerCompensate()
+        if self.afsc:
+            if not self.serifRectRemoved and tag == f"{{{svgNS}}}rect" and "id" in attrib:
+                self.serifRectRemoved = True
+                self.skipDepth = self.depth
+                return
+
+            if tag in affinityFilledTags and "fill" not in attrib and "stroke" not in attrib:
+                attrib["fill"] = "#000000"
+
+        self.closeOpenTag()
+        self.output.append(f"<{tag[len(svgNS) + 2:]}{writeAttrs(attrib)}")
+        self.openTag = True
+        self.rootHasChildren = True
+
+
+    def startRoot(self, tag, attrib, nsmap):
+        """
+        Does the root checks from isSVGValid(), and writes the root that
+        viewboxCompensate() makes, and its transform group.
+        """
+        self.rootNamespaces = dict(nsmap)
+
+        if self.rootNamespaces not in acceptedRootNamespaces:
+            raise FallBack()
+
+        if attrib.get("version", "1.1") != "1.1":
+            raise FallBack()
+
+        if "viewBox" not in attrib or any(k.startswith("{") for k in attrib):
+            raise FallBack()
+
+        try:
+            viewBoxWidth = attrib['viewBox'].split(' ')[2]
+
+            xPos = str(self.metrics['xMin'])
+            yPos = str(-(self.metrics['yMax']))
+            scale = self.metrics['unitsPerEm'] / int(viewBoxWidth)
+        except (IndexError, ValueError, ZeroDivisionError):
+            raise FallBack()
+
+        rootAttrib = dict(attrib)
+        rootAttrib.pop("viewBox")
+        rootAttrib["version"] = "1.1"
+        rootAttrib["id"] = self.rootID
+
+        self.rootTag = etree.QName(tag).localname
+
+        self.output.append(f'<{self.rootTag} xmlns="{svgNS}" xmlns:xlink="{xlinkNS}"{writeAttrs(rootAttrib)}>')
+        self.output.append(f'<g transform="translate({xPos}, {yPos}) scale({scale})"')
+        self.openTag = True
+
+
+    def end(self, tag):
+        self.skipTail = False
+
+        if self.depth == 1:
+            if self.openTag:
+                self.output.append("/>")
+                self.openTag = False
+            else:
+                self.output.append("</g>")
+
+            self.output.append(f"</{self.rootTag}>")
+
+        # (lxml removes an element's tail along with it.)
+        elif self.skipDepth == self.depth:
+            self.skipDepth = None
+            self.skipTail = True
+
+        elif self.writing():
+            if self.openTag:
+                self.output.append("/>")
+                self.openTag = False
+            else:
+                self.output.append(f"</{tag[len(svgNS) + 2:]}>")
+
+        self.depth -= 1
+
+
+    def close(self):
+        return "".join(self.output).encode("utf-8")
+
+
+
+
+def streamCompensateSVG(path, m, afsc, nusc, rootID):
+    """
+    Validates and compensates an SVG file in one pass, without building a tree.
+
+    Returns the compensated SVG as bytes (the same bytes isSVGValid() +
+    compensateSVG() + serializing would give you, with the root's id set
+    to rootID), or None if the SVG needs to go through the tree-based path.
+    """
+    target = CompensatingTarget(m['metrics'], afsc, nusc, rootID)
+    parser = etree.XMLParser(target=target)
+
+    try:
+        with open(path, "rb") as svgFile:
+            svgSource = svgFile.read()
+
+        parser.feed(svgSource)
+        svgBody = parser.close()
+    except (FallBack, etree.LxmlError, OSError):
+        return None
+
+    declaredPrefixes = set(p.encode("utf-8") for p in target.rootNamespaces) | {b"xmlns", b"xml"}
+
+    if any(p not in declaredPrefixes for p in attrPrefixRegex.findall(svgSource)):
+        return None
+
+    return b"<?xml version='1.0' encoding='UTF-8'?>\n" + svgBody
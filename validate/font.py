@@ -0,0 +1,252 @@
+import os
+
+from fontTools import ttLib
+
+from transform.bytes import TableChecksum
+
+
+# Functions that verify a compiled font file.
+#
+# These load the font with fontTools and only check the things that have to
+# agree with each other across tables, instead of decompiling the entire font
+# to TTX. Tables are only decompiled when a check actually needs them.
+#
+# verifyFont() raises a ValueError describing every problem it finds.
+
+
+
+# checksums are worked out from the font file a block at a time, so the
+# font (or any big table, like sbix or CBDT) never has to be in memory at once.
+checksumBlockSize = 1024 * 1024
+
+
+
+def checksumFileRange(read_file, offset, length):
+    """
+    Returns the checksum of part of a file (as if it was padded with null
+    bytes to a multiple of 4), reading it a block at a time.
+    """
+    checksum = TableChecksum()
+    read_file.seek(offset)
+
+    while length > 0:
+        block = read_file.read(min(checksumBlockSize, length))
+
+        if not block:
+            break
+
+        checksum.update(block)
+        length -= len(block)
+
+    return checksum.value()
+
+
+
+def checkTableDirectory(ttFont, fontPath, fontSize):
+    """
+    Checks every table record's offset, length and checksum.
+    """
+    problems = []
+
+    with open(fontPath, "rb") as read_file:
+        for tag, entry in ttFont.reader.tables.items():
+
+            if entry.offset % 4:
+                problems.append(f"The '{tag}' table doesn't start on a 4-byte boundary (offset {entry.offset}).")
+
+            if entry.offset + entry.length > fontSize:
+                problems.append(f"The '{tag}' table (offset {entry.offset}, length {entry.length}) runs past the end of the font file ({fontSize} bytes).")
+                continue
+
+            # head's checksum is calculated as if checkSumAdjustment was 0.
+            if tag == "head":
+                checksum = TableChecksum()
+                read_file.seek(entry.offset)
+                data = read_file.read(entry.length)
+
+                checksum.update(data[:8] + b"\0\0\0\0" + data[12:])
+                checkSum = checksum.value()
+
+            else:
+                checkSum = checksumFileRange(read_file, entry.offset, entry.length)
+
+            if checkSum != entry.checkSum:
+                problems.append(f"The checksum for the '{tag}' table is wrong. (table record: {entry.checkSum:#010x}, actual: {checkSum:#010x})")
+
+    return problems
+
+
+
+def checkFontChecksum(ttFont, fontPath, fontSize):
+    """
+    Checks head.checkSumAdjustment against the checksum of the whole file.
+    """
+    with open(fontPath, "rb") as read_file:
+        fontChecksum = checksumFileRange(read_file, 0, fontSize)
+
+    # a correct checkSumAdjustment makes the entire file sum up to this.
+    if fontChecksum != 0xB1B0AFBA:
+        return [f"head.checkSumAdjustment ({ttFont['head'].checkSumAdjustment:#010x}) doesn't match the checksum of the whole font."]
+
+    return []
+
+
+
+def checkGlyphCounts(ttFont, numGlyphs):
+    """
+    Checks that every table that has an entry for each glyph agrees with maxp.numGlyphs.
+    """
+    problems = []
+
+    numberOfHMetrics = ttFont["hhea"].numberOfHMetrics
+    if not 0 < numberOfHMetrics <= numGlyphs:
+        problems.append(f"hhea.numberOfHMetrics ({numberOfHMetrics}) isn't between 1 and maxp.numGlyphs ({numGlyphs}).")
+
+    if len(ttFont["hmtx"].metrics) != numGlyphs:
+        problems.append(f"hmtx has {len(ttFont['hmtx'].metrics)} metrics, but maxp.numGlyphs is {numGlyphs}.")
+
+    if "vmtx" in ttFont and len(ttFont["vmtx"].metrics) != numGlyphs:
+        problems.append(f"vmtx has {len(ttFont['vmtx'].metrics)} metrics, but maxp.numGlyphs is {numGlyphs}.")
+
+    if "loca" in ttFont:
+        # fontTools trims loca down to numGlyphs when it decompiles it.
+        entries = ttFont.reader.tables["loca"].length // (4 if ttFont["head"].indexToLocFormat else 2)
+
+        if entries != numGlyphs + 1:
+            problems.append(f"loca has {entries} entries, but it should have one more than maxp.numGlyphs ({numGlyphs + 1}).")
+
+    return problems
+
+
+
+def checkCmap(ttFont, glyphNames):
+    """
+    Checks that every cmap subtable only maps to glyph IDs that exist.
+    """
+    problems = []
+
+    for subtable in ttFont["cmap"].tables:
+        name = f"cmap subtable (platform {subtable.platformID}, encoding {subtable.platEncID}, format {subtable.format})"
+
+        if subtable.format == 14:
+            for vs, mappings in subtable.uvsDict.items():
+                for codepoint, glyphName in mappings:
+                    if glyphName is not None and glyphName not in glyphNames:
+                        problems.append(f"The {name} maps U+{codepoint:x} U+{vs:x} to a glyph that doesn't exist ({glyphName}).")
+
+        else:
+            for codepoint, glyphName in subtable.cmap.items():
+                if glyphName not in glyphNames:
+                    problems.append(f"The {name} maps U+{codepoint:x} to a glyph that doesn't exist ({glyphName}).")
+
+    return problems
+
+
+
+def checkGSUB(ttFont, glyphNames):
+    """
+    Checks that every ligature in GSUB is made of (and results in) glyphs that exist.
+    """
+    problems = []
+
+    lookupList = ttFont["GSUB"].table.LookupList
+
+    if lookupList is None:
+        return problems
+
+    for index, lookup in enumerate(lookupList.Lookup):
+        for subtable in lookup.SubTable:
+
+            # ligatures might be wrapped in extension subtables.
+            if lookup.LookupType == 7:
+                subtable = subtable.ExtSubTable
+
+            if subtable.LookupType != 4:
+                continue
+
+            for firstGlyph, ligatures in subtable.ligatures.items():
+                for ligature in ligatures:
+                    for glyphName in [firstGlyph, ligature.LigGlyph, *ligature.Component]:
+                        if glyphName not in glyphNames:
+                            problems.append(f"A ligature in GSUB lookup {index} uses a glyph that doesn't exist ({glyphName}).")
+
+    return problems
+
+
+
+def checkStrikes(ttFont, numGlyphs):
+    """
+    Checks that bitmap strikes (sbix, CBLC/CBDT) agree with the number of glyphs.
+    """
+    problems = []
+
+    if "sbix" in ttFont:
+        for ppem, strike in ttFont["sbix"].strikes.items():
+            if len(strike.glyphs) != numGlyphs:
+                problems.append(f"The sbix strike for {ppem}ppem has {len(strike.glyphs)} bitmaps, but maxp.numGlyphs is {numGlyphs}.")
+
+    if "CBLC" in ttFont:
+        strikes = ttFont["CBLC"].strikes
+        strikeData = ttFont["CBDT"].strikeData
+
+        if len(strikes) != len(strikeData):
+            problems.append(f"CBLC has {len(strikes)} strikes, but CBDT has {len(strikeData)}.")
+
+        for index, (strike, bitmaps) in enumerate(zip(strikes, strikeData)):
+            glyphCount = 0
+
+            for indexSubTable in strike.indexSubTables:
+                if indexSubTable.lastGlyphIndex >= numGlyphs:
+                    problems.append(f"An index subtable in CBLC strike {index} goes up to glyph ID {indexSubTable.lastGlyphIndex}, but maxp.numGlyphs is {numGlyphs}.")
+
+                glyphCount += len(indexSubTable.names)
+
+            if glyphCount != len(bitmaps):
+                problems.append(f"CBLC strike {index} indexes {glyphCount} bitmaps, but CBDT strike {index} has {len(bitmaps)}.")
+
+    return problems
+
+
+
+def verifyFont(fontPath):
+    """
+    Verifies a compiled font file.
+    """
+
+    try:
+        ttFont = ttLib.TTFont(fontPath, lazy=True)
+    except Exception as e:
+        raise ValueError(f"The font couldn't be opened. → {e}")
+
+    try:
+        fontSize = os.path.getsize(fontPath)
+
+        problems = checkTableDirectory(ttFont, fontPath, fontSize)
+        problems += checkFontChecksum(ttFont, fontPath, fontSize)
+
+        numGlyphs = ttFont["maxp"].numGlyphs
+        glyphNames = set(ttFont.getGlyphOrder())
+
+        if len(glyphNames) != numGlyphs:
+            problems.append(f"The font has {len(glyphNames)} glyph names, but maxp.numGlyphs is {numGlyphs}.")
+
+        problems += checkGlyphCounts(ttFont, numGlyphs)
+        problems += checkCmap(ttFont, glyphNames)
+
+        if "GSUB" in ttFont:
+            problems += checkGSUB(ttFont, glyphNames)
+
+        problems += checkStrikes(ttFont, numGlyphs)
+
+    except Exception as e:
+        raise ValueError(f"Part of the font couldn't be read. → {e}")
+
+    finally:
+        ttFont.close()
+
+
+    if len(problems) == 1:
+        raise ValueError(problems[0])
+
+    elif problems:
+        raise ValueError(f"There are {len(problems)} problems with the font:\n" + '\n'.join(f"- {p}" for p in problems))
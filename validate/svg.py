@@ -145,11 +145,129 @@ xlinkNS = '{http://www.w3.org/1999/xlink}'
 
 
 
+# the lists above, compiled so every element can be checked against them in one go.
+restrictedElemTags = frozenset(xmlns + e for e in restrictedElems)
+unenforcedElemTags = frozenset(xmlns + e for e in unenforcedElems)
+
+restrictedAttrSet = frozenset(restrictedAttrs)
+unenforcedAttrSet = frozenset(unenforcedAttrs)
+
+acceptedImageExtensions = ('.png', '.jpg', '.jpeg', '.jpe', '.jif', '.jfif', '.jfi')
+
+
+
+def elementPath(e):
+    """
+    Returns a short, readable path to an element (eg. 'svg/g[2]/path') for error messages.
+    """
+    path = []
+
+    while e is not None:
+        name = etree.QName(e).localname
+        parent = e.getparent()
+
+        if parent is not None:
+            sameTag = [s for s in parent if s.tag == e.tag]
+
+            if len(sameTag) > 1:
+                name += f"[{sameTag.index(e) + 1}]"
+
+        path.append(name)
+        e = parent
+
+    return "/".join(reversed(path))
+
+
+
+def elementViolations(tag, attrib, ignoreUnenforcedContents=False):
+    """
+    Checks a single element (its tag and attributes) against all of the
+    restricted and unenforced contents rules.
+
+    Returns two lists of what was found - (restricted, unenforced).
+    """
+    restricted = []
+    unenforced = []
+
+    # elements
+    if tag in restrictedElemTags:
+        restricted.append(f"a '{etree.QName(tag).localname}' element")
+
+    elif not ignoreUnenforcedContents:
+        if tag in unenforcedElemTags:
+            unenforced.append(f"a '{etree.QName(tag).localname}' element")
+
+        # there should be no SVG child elements.
+        elif etree.QName(tag).localname == "svg":
+            unenforced.append(f"a child svg element")
+
+
+    # attributes
+    for attr in attrib:
+        if attr in restrictedAttrSet:
+            restricted.append(f"a '{attr}' attribute")
+
+        elif attr in unenforcedAttrSet and not ignoreUnenforcedContents:
+            unenforced.append(f"a '{attr}' attribute")
+
+
+    # image elements can only link to JPEGs or PNGs (and definitely not SVGs).
+    if tag == xmlns + "image":
+        href = attrib.get(xlinkNS + 'href')
+
+        if href:
+            if href.endswith('.svg'):
+                restricted.append(f"an image element that links to an SVG file")
+
+            if not ignoreUnenforcedContents and not href.endswith(acceptedImageExtensions):
+                unenforced.append(f"an image element that links to a file that is not a JPEG or PNG image")
+
+    return (restricted, unenforced)
+
+
+
+def findViolations(svgImage, ignoreUnenforcedContents=False):
+    """
+    Walks through every element in an SVG once, checking it against all of the
+    restricted and unenforced contents rules.
+
+    Returns two lists of messages - (restricted, unenforced) - that say what
+    was found and where.
+
+    (The root element is checked on its own in isSVGValid, so only the
+    elements inside it are looked at here.)
+    """
+    restricted = []
+    unenforced = []
+
+    root = svgImage.getroot()
+
+    for e in root.iterdescendants():
+
+        # (comments and processing instructions.)
+        if not isinstance(e.tag, str):
+            continue
+
+        elemRestricted, elemUnenforced = elementViolations(e.tag, e.attrib, ignoreUnenforcedContents)
+
+        if elemRestricted or elemUnenforced:
+            path = elementPath(e)
+
+            restricted += [f"{v} (at {path})" for v in elemRestricted]
+            unenforced += [f"{v} (at {path})" for v in elemUnenforced]
+
+    return (restricted, unenforced)
+
+
+
 def isSVGValid(svgImage, ignoreUnenforcedContents=False):
     """
     Evaluates if a glyphs' SVG file is compliant with the SVGinOT standard.
     This checks for most things.
 
+    Every problem that's found is listed in the error (with where it is),
+    not just the first one.
+
     Checks that currently don't exist:
 
     restricted (explicitly forbidden) contents:
@@ -163,11 +281,6 @@ def isSVGValid(svgImage, ignoreUnenforcedContents=False):
     """
 
 
-    svgEmbeddedImages = svgImage.findall("//" + xmlns + "image")
-
-
-
-
 
     # Stuff relating to the root tag
     # --------------------------------------------------------------------
@@ -193,93 +306,39 @@ def isSVGValid(svgImage, ignoreUnenforcedContents=False):
             raise ValueError(f"The version of This SVG image is set to '{svgImageVersion}'. It needs to either be set to 1.1 or removed entirely.")
 
 
+    # XSL processing instructions exist in the file
+    if "xsl" in svgImage.getroot().nsmap:
+        raise ValueError(f"This SVG image contains XSL. This is not compatible in SVGinOT fonts.")
 
 
 
 
 
-
-    # Restricted contents
+    # Restricted and Unenforced contents
     # --------------------------------------------------------------------
-    # These are explicitly not in the spec and should be disallowed under all circumstances.
-
-    # elements
-    for elem in restrictedElems:
-        if svgImage.find('//' + xmlns + elem) is not None:
-            raise ValueError(f"This SVG image has a '{elem}' element. These are not compatible in SVGinOT fonts.")
-
-    # attributes
-    for attr in restrictedAttrs:
-        if svgImage.find(f"//*[@{attr}]") is not None:
-            raise ValueError(f"This SVG image has a '{attr}' attribute. These are not compatible in SVGinOT fonts.")
-
-    # image elements that contain SVGs
-    if svgEmbeddedImages:
-        for i in svgEmbeddedImages:
-            href = i.attrib[xlinkNS + 'href']
-
-            if href:
-                if href.endswith('.svg'):
-                    raise ValueError(f"This SVG image has an 'image' attribute that links to an SVG file. These are not compatible in SVGinOT fonts.")
-
-
-    # XSL processing instructions exist in the file
-    if "xsl" in svgImage.getroot().nsmap:
-        raise ValueError(f"This SVG image contains XSL. This is not compatible in SVGinOT fonts.")
-
-
+    # Restricted contents are explicitly not in the spec and should be disallowed under all circumstances.
+    # Unenforced contents are not enforced in the spec and are not guaranteed to work.
+    #
     # not included:
     #   - relative units (em, ex, etc.)
     #   - rgba() colors
     #   - CSS2 color values in styles
-
-
-
-
-
-    # Unenforced Contents
-    # --------------------------------------------------------------------
-    # These are not enforced in the spec and are
-    # not guaranteed to work.
+    #   - XML entities
 
     nuscMsg = "If you don't want forc to make an error when it detects this, use the --nusc build flag."
 
-    if not ignoreUnenforcedContents:
+    restricted, unenforced = findViolations(svgImage, ignoreUnenforcedContents)
 
-        # elements
-        for elem in unenforcedElems:
-            if svgImage.find('//' + xmlns + elem) is not None:
-                raise ValueError(f"This SVG image has a '{elem}' element. Compatibility with this is not mandatory in SVGinOT fonts so it is not recommended. {nuscMsg}")
-
-        # attributes
-        for attr in unenforcedAttrs:
-            if svgImage.find(f"//*[@{attr}]") is not None:
-                raise ValueError(f"This SVG image has a '{attr}' attribute. Compatibility with this is not mandatory in SVGinOT fonts so it is not recommended. {nuscMsg}")
-
-
-        # image elements that don't contain JPEGs or PNGs
-        acceptedImageExtensions = ['.png', '.jpg', '.jpeg', '.jpe', '.jif', '.jfif', '.jfi']
-
-        if svgEmbeddedImages:
-            for i in svgEmbeddedImages:
-                href = i.attrib[xlinkNS + 'href']
-
-                if href:
-                    count = 0
-
-                    for ext in acceptedImageExtensions:
-                        if not href.endswith(ext):
-                            count += 1
-
-                    if count == len(acceptedImageExtensions):
-                        raise ValueError(f"This SVG image has one or more image attribute(s) that links to a file that is not a JPEG or PNG image. Compatibility with any image type other than PNG or JPEG is not mandatory in SVGinOT fonts so it is not recommended. {nuscMsg}")
-
-
-        # there should be no SVG child elements.
-        if svgImage.find("//{*}svg") is not None:
-            raise ValueError(f"This SVG image has a child svg attribute. Compatibility with this is not mandatory in SVGinOT fonts so it is not recommended. {nuscMsg}")
+    problems = [f"{p}, which is not compatible in SVGinOT fonts." for p in restricted]
+    problems += [f"{p}, which is not mandatory for SVGinOT fonts to support so it is not recommended." for p in unenforced]
 
+    if problems:
+        if len(problems) == 1:
+            msg = f"This SVG image has {problems[0]}"
+        else:
+            msg = f"This SVG image has {len(problems)} problems:\n" + "\n".join(f"- {p}" for p in problems)
 
+        if unenforced:
+            msg += f" {nuscMsg}" if len(problems) == 1 else f"\n{nuscMsg}"
 
-        # not included:
-        #   - XML entities
+        raise ValueError(msg)
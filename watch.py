@@ -0,0 +1,148 @@
+import os
+import pathlib
+import time
+
+import log
+from start import start
+
+
+
+# watch.py
+# -------------------------------
+#
+# --watch mode. Builds once, then stays open and builds again whenever
+# the input folder, manifest or aliases file changes.
+#
+# Changes are found by polling - checking every file's size and modification
+# time - which works the same everywhere, and only takes a few milliseconds
+# even for input folders with thousands of images.
+#
+# Staying open means forc doesn't have to start up again for every build, and
+# glyph images that haven't changed are kept in memory between builds.
+# (Formats that nothing has changed for are skipped - see cache.InputIndex.)
+
+
+
+DEF_POLL_INTERVAL = 0.5 # seconds between each check for changes.
+DEF_DEBOUNCE = 0.5 # seconds the files have to stay the same for before building, so a burst of saves only builds once.
+
+
+
+def snapshot(inputPath, otherPaths, outputPath):
+    """
+    Returns the size and modification time of every file in the input folder
+    (apart from hidden files and folders, and the output folder if it's inside
+    it) and any other files given, as a dict of path -> (size, modification time).
+    """
+    files = dict()
+
+    for folder, subfolders, filenames in os.walk(inputPath):
+        subfolders[:] = [s for s in subfolders if not s.startswith(".") and pathlib.Path(folder, s) != outputPath]
+
+        for filename in filenames:
+            if not filename.startswith("."):
+                path = os.path.join(folder, filename)
+
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue # (it was deleted while this was looking.)
+
+                files[path] = (stat.st_size, stat.st_mtime_ns)
+
+    for path in otherPaths:
+        try:
+            stat = os.stat(path)
+            files[str(path)] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            files[str(path)] = None # (editors sometimes save by deleting and replacing.)
+
+    return files
+
+
+
+def waitForChanges(lastSnapshot, inputPath, otherPaths, outputPath):
+    """
+    Waits until something changes, and then until everything has stopped
+    changing for a moment.
+
+    Returns the new snapshot, and how many files changed.
+    """
+    current = lastSnapshot
+
+    while current == lastSnapshot:
+        time.sleep(DEF_POLL_INTERVAL)
+        current = snapshot(inputPath, otherPaths, outputPath)
+
+    while True:
+        time.sleep(DEF_DEBOUNCE)
+        settled = snapshot(inputPath, otherPaths, outputPath)
+
+        if settled == current:
+            break
+
+        current = settled
+
+    changed = set(path for path in set(current) | set(lastSnapshot) if current.get(path) != lastSnapshot.get(path))
+
+    return current, len(changed)
+
+
+
+def build(buildArgs, imgMemo):
+    """
+    Does a build, reporting (rather than raising) anything that goes wrong
+    with it, so forc can keep watching.
+    """
+    try:
+        start(*buildArgs, imgMemo=imgMemo)
+        log.out('All done!', 35)
+
+    except Exception as e:
+        log.out(f'\n!!! {e}', 31)
+
+
+
+def watch( inputPath
+          , outputPath
+          , manifestPath
+          , aliasesPath
+          , delim_codepoint
+
+          , outputFormats
+          , compiler
+          , flags
+          ):
+    """
+    Builds fonts, and then builds them again every time their inputs change,
+    until forc is stopped (with Ctrl+C).
+    """
+    buildArgs = (inputPath, outputPath, manifestPath, aliasesPath, delim_codepoint, outputFormats, compiler, flags)
+
+    inputPathPath = pathlib.Path(inputPath).absolute()
+    outputPathPath = pathlib.Path(outputPath).absolute()
+    otherPaths = [pathlib.Path(manifestPath).absolute()]
+
+    if aliasesPath:
+        otherPaths.append(pathlib.Path(aliasesPath).absolute())
+
+    # glyph images from the last build. (see glyphProc.compileImageGlyphs().)
+    imgMemo = dict()
+
+    try:
+        # (the snapshot is taken first so anything that changes during a build gets built next.)
+        lastSnapshot = snapshot(inputPathPath, otherPaths, outputPathPath)
+        build(buildArgs, imgMemo)
+
+        while True:
+            log.out(f'\n👀 Watching for changes... (press Ctrl+C to stop)\n', 35)
+
+            lastSnapshot, changed = waitForChanges(lastSnapshot, inputPathPath, otherPaths, outputPathPath)
+            log.out(f'{changed} file(s) changed, building again...', 35)
+
+            startTime = time.perf_counter()
+            build(buildArgs, imgMemo)
+            log.out(f'- Build took {time.perf_counter() - startTime:.2f}s.', 90)
+
+    except KeyboardInterrupt:
+        log.out(f'\nStopped watching.', 35)